@@ -0,0 +1,101 @@
+"""Микробенчмарк стоимости сравнения одного листа.
+
+Сравниваются списки из равных, но разных объектов, поэтому проверка
+``is`` не срабатывает и каждый лист проходит полное сравнение. Для
+встроенных типов это быстрый путь без вызова Python, для подклассов —
+общий путь через ``__eq__``. Строка ``shared`` показывает пропуск общего
+поддерева целиком.
+
+Цифры «до» и «после» снимаются на сборках двух ревизий: ``--json``
+сохраняет результат, ``--baseline`` печатает его рядом с текущим. Сессия
+``nox -s leaf_cost`` собирает обе ревизии и делает это сама.
+"""
+
+import argparse
+import json
+import time
+
+from rustdeepdiff import compare
+
+
+class Int(int):
+    pass
+
+
+class Float(float):
+    pass
+
+
+class Str(str):
+    pass
+
+
+LEAVES = {
+    "int": lambda i: (i + 10**6) * 3,
+    "float": lambda i: i * 0.5,
+    "str": lambda i: "value-" + str(i),
+    "Int": lambda i: Int((i + 10**6) * 3),
+    "Float": lambda i: Float(i * 0.5),
+    "Str": lambda i: Str("value-" + str(i)),
+}
+
+
+def make_leaves(kind, n):
+    """Два списка из n равных по значению, но разных объектов."""
+    make = LEAVES[kind]
+    return [make(i) for i in range(n)], [make(i) for i in range(n)]
+
+
+def per_leaf_ns(t1, t2, n, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        compare(t1, t2)
+        best = min(best, time.perf_counter() - start)
+    return best / n * 1e9
+
+
+def measure(leaves, repeat):
+    """Наносекунды на лист по видам листьев."""
+    results = {}
+    for kind in LEAVES:
+        t1, t2 = make_leaves(kind, leaves)
+        results[kind] = per_leaf_ns(t1, t2, leaves, repeat)
+
+    t1, _ = make_leaves("int", leaves)
+    results["shared"] = per_leaf_ns({"old": t1}, {"old": t1}, leaves, repeat)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--leaves", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="сохранить результат в файл")
+    parser.add_argument("--baseline", help="результат другой сборки для сравнения")
+    args = parser.parse_args()
+
+    results = measure(args.leaves, args.repeat)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    if not args.baseline:
+        print(f"{'лист':<8}{'нс/лист':>10}")
+        for kind, ns in results.items():
+            print(f"{kind:<8}{ns:>10.1f}")
+        return
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"{'лист':<8}{'до, нс':>10}{'после, нс':>12}{'ускорение':>12}")
+    for kind, ns in results.items():
+        before = baseline.get(kind)
+        if before is None:
+            print(f"{kind:<8}{'—':>10}{ns:>12.1f}{'—':>12}")
+        else:
+            print(f"{kind:<8}{before:>10.1f}{ns:>12.1f}{before / ns:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+"""Набор бенчмарков с перцентилями, пиковой памятью и базовой линией.
+
+Данные генерируются детерминированно по зерну: размер (число листьев),
+глубина, доля измененных листьев и набор типов листьев задаются в
+``CASES``. Каждый случай измеряется по фазам отдельно:
+
+* ``parse`` — ``json.loads`` обоих документов;
+* ``traversal`` — ``compare()`` над уже разобранными объектами;
+* ``materialize`` — ``DeepDiff.to_dict()`` готового результата;
+* ``to_json`` — ``DeepDiff.to_json()`` готового результата;
+* ``compare_json`` — разбор и сравнение в Rust одним вызовом.
+
+Для каждой фазы печатаются перцентили времени и прирост пикового RSS
+процесса за один запуск (``ru_maxrss``, в отдельном процессе на каждую
+фазу): так в пик попадают и выделения Rust — снимки, разбор JSON, — которых
+tracemalloc не видит. Результат пишется в JSON и сравнивается с
+сохраненной базовой линией по медиане и по пику памяти; без базовой линии
+сравнение завершается ошибкой::
+
+    nox -s bench
+    python benchmarks/suite.py --quick --json bench_results.json
+    python benchmarks/suite.py --save-baseline benchmarks/baseline.json
+    python benchmarks/suite.py --baseline benchmarks/baseline.json --tolerance 0.1
+"""
+
+import argparse
+import gc
+import json
+import math
+import platform
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from rustdeepdiff import compare, compare_json
+
+
+@dataclass(frozen=True)
+class Case:
+    name: str
+    # Примерное число листьев в документе.
+    size: int
+    # Глубина вложенности контейнеров.
+    depth: int
+    # Доля измененных листьев.
+    density: float
+    # Набор типов листьев, ключ LEAF_MIXES.
+    mix: str
+    quick: bool = False
+
+
+CASES = [
+    Case("small-flat", 1_000, 1, 0.01, "mixed", quick=True),
+    Case("small-deep", 1_000, 8, 0.01, "mixed", quick=True),
+    Case("medium-equal", 50_000, 4, 0.0, "mixed", quick=True),
+    Case("medium-sparse", 50_000, 4, 0.001, "mixed"),
+    Case("medium-dense", 50_000, 4, 0.2, "mixed"),
+    Case("medium-numbers", 50_000, 3, 0.01, "numbers"),
+    Case("medium-strings", 50_000, 3, 0.01, "strings"),
+    Case("large-shallow", 500_000, 2, 0.01, "mixed"),
+    Case("large-deep", 500_000, 10, 0.01, "mixed"),
+]
+
+LEAF_MIXES = {
+    "numbers": (
+        lambda rng: rng.randrange(10**9),
+        lambda rng: rng.random() * 1000,
+    ),
+    "strings": (
+        lambda rng: "value-%d" % rng.randrange(10**6),
+    ),
+    "mixed": (
+        lambda rng: rng.randrange(10**9),
+        lambda rng: rng.random() * 1000,
+        lambda rng: "value-%d" % rng.randrange(10**6),
+        lambda rng: rng.random() < 0.5,
+        lambda rng: None,
+    ),
+}
+
+PHASES = ("parse", "traversal", "materialize", "to_json", "compare_json")
+
+
+def make_leaf(rng, mix):
+    return rng.choice(LEAF_MIXES[mix])(rng)
+
+
+def make_tree(rng, case, leaves, depth):
+    """Дерево из словарей и списков примерно с leaves листьями."""
+    if depth == 0 or leaves <= 1:
+        return make_leaf(rng, case.mix)
+    # Ветвление подобрано так, чтобы листья кончились на нужной глубине.
+    fanout = max(2, math.ceil(leaves ** (1 / depth)))
+    share = max(1, leaves // fanout)
+    if depth % 2:
+        return [make_tree(rng, case, share, depth - 1) for _ in range(fanout)]
+    return {"k%d" % i: make_tree(rng, case, share, depth - 1) for i in range(fanout)}
+
+
+def mutate(rng, case, tree):
+    """Копия дерева, в которой изменена доля density листьев."""
+    if isinstance(tree, dict):
+        result = {}
+        for key, value in tree.items():
+            roll = rng.random()
+            if roll < case.density / 10:
+                continue
+            result[key] = mutate(rng, case, value)
+            if roll > 1 - case.density / 10:
+                result[key + "-new"] = make_leaf(rng, case.mix)
+        return result
+    if isinstance(tree, list):
+        result = [mutate(rng, case, value) for value in tree]
+        if rng.random() < case.density:
+            result.append(make_leaf(rng, case.mix))
+        return result
+    if rng.random() < case.density:
+        return make_leaf(rng, case.mix)
+    return tree
+
+
+def make_documents(case, seed):
+    """JSON-тексты двух версий документа для случая."""
+    rng = random.Random("%s:%d" % (case.name, seed))
+    t1 = make_tree(rng, case, case.size, case.depth)
+    t2 = mutate(rng, case, t1)
+    return json.dumps(t1), json.dumps(t2)
+
+
+def phase_runner(phase, text1, text2):
+    """Функция без аргументов, выполняющая одну фазу."""
+    if phase == "parse":
+        return lambda: (json.loads(text1), json.loads(text2))
+    if phase == "compare_json":
+        return lambda: compare_json(text1, text2)
+    # Разобранные объекты общие для всех запусков: в замер попадает
+    # только сама фаза.
+    t1, t2 = json.loads(text1), json.loads(text2)
+    if phase == "traversal":
+        return lambda: compare(t1, t2)
+    diff = compare(t1, t2)
+    if phase == "to_json":
+        return lambda: diff.to_json()
+    return lambda: diff.to_dict()
+
+
+def percentile(sorted_values, q):
+    """Перцентиль по ближайшему рангу."""
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def measure(run, repeat, warmup):
+    """Времена запусков в миллисекундах, без сборщика мусора в замере."""
+    for _ in range(warmup):
+        run()
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter_ns()
+            run()
+            times.append((time.perf_counter_ns() - start) / 1e6)
+        finally:
+            gc.enable()
+    return sorted(times)
+
+
+def max_rss_kib():
+    """Пиковый RSS процесса; ru_maxrss на macOS в байтах, на Linux в КиБ."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 if sys.platform == "darwin" else peak
+
+
+def rss_child(phase, path1, path2):
+    """Прирост пикового RSS за один запуск фазы; вызывается в отдельном
+    процессе, пик которого накопили только чтение документов и подготовка
+    фазы."""
+    with open(path1, encoding="utf-8") as f:
+        text1 = f.read()
+    with open(path2, encoding="utf-8") as f:
+        text2 = f.read()
+    run = phase_runner(phase, text1, text2)
+    gc.collect()
+    before = max_rss_kib()
+    run()
+    print(max_rss_kib() - before)
+
+
+def peak_rss_kib(phase, path1, path2):
+    """Прирост пикового RSS за запуск фазы в новом процессе; None, если
+    resource недоступен."""
+    if resource is None:
+        return None
+    command = [sys.executable, os.path.abspath(__file__), "--peak-rss", phase, path1, path2]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return float(output)
+
+
+def run_case(case, args):
+    text1, text2 = make_documents(case, args.seed)
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        path1, path2 = os.path.join(tmp, "t1.json"), os.path.join(tmp, "t2.json")
+        for path, text in ((path1, text1), (path2, text2)):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+        for phase in args.phases:
+            run = phase_runner(phase, text1, text2)
+            times = measure(run, args.repeat, args.warmup)
+            results.append(
+                {
+                    "case": case.name,
+                    "phase": phase,
+                    "repeat": len(times),
+                    "min_ms": times[0],
+                    "p50_ms": percentile(times, 50),
+                    "p90_ms": percentile(times, 90),
+                    "p99_ms": percentile(times, 99),
+                    "max_ms": times[-1],
+                    "peak_rss_kib": peak_rss_kib(phase, path1, path2),
+                }
+            )
+    return results
+
+
+def environment():
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+    }
+
+
+# Рост пика памяти меньше этого не считается регрессией: RSS растет
+# страницами и аренами аллокатора, и на малых случаях шум больше сигнала.
+RSS_NOISE_KIB = 1024
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """Регрессии по медиане времени и по пику памяти относительно базовой
+    линии: (результат, метрика, было, стало)."""
+    previous = {(r["case"], r["phase"]): r for r in baseline["results"]}
+    regressions = []
+    for result in results:
+        old = previous.get((result["case"], result["phase"]))
+        if old is None:
+            continue
+        if old["p50_ms"] > 0 and result["p50_ms"] > old["p50_ms"] * (1 + tolerance):
+            regressions.append((result, "p50 мс", old["p50_ms"], result["p50_ms"]))
+        was, now = old.get("peak_rss_kib"), result["peak_rss_kib"]
+        if was is not None and now is not None and now > max(was * (1 + tolerance), was + RSS_NOISE_KIB):
+            regressions.append((result, "пик RSS КиБ", was, now))
+    return regressions
+
+
+def print_table(results):
+    header = "%-16s%-14s%10s%10s%10s%12s" % ("случай", "фаза", "p50 мс", "p90 мс", "p99 мс", "+RSS КиБ")
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        rss = "-" if r["peak_rss_kib"] is None else "%.0f" % r["peak_rss_kib"]
+        print(
+            "%-16s%-14s%10.2f%10.2f%10.2f%12s"
+            % (r["case"], r["phase"], r["p50_ms"], r["p90_ms"], r["p99_ms"], rss)
+        )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="только быстрые случаи")
+    parser.add_argument("--case", action="append", help="запустить только эти случаи")
+    parser.add_argument("--phase", action="append", dest="phases", choices=PHASES, help="только эти фазы")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", metavar="PATH", help="записать результаты в JSON")
+    parser.add_argument("--baseline", metavar="PATH", help="сравнить с базовой линией")
+    parser.add_argument("--save-baseline", metavar="PATH", help="сохранить результаты как базовую линию")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="допустимый рост медианы и пика, доля")
+    # Служебный режим: замер памяти одной фазы в дочернем процессе.
+    parser.add_argument("--peak-rss", nargs=3, metavar=("PHASE", "OLD", "NEW"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.phases = args.phases or list(PHASES)
+    return args
+
+
+def main():
+    args = parse_args()
+    if args.peak_rss:
+        rss_child(*args.peak_rss)
+        return
+    cases = [c for c in CASES if (not args.quick or c.quick) and (not args.case or c.name in args.case)]
+    if not cases:
+        sys.exit("Нет подходящих случаев")
+
+    results = []
+    for case in cases:
+        print("... %s" % case.name, file=sys.stderr)
+        results.extend(run_case(case, args))
+    print_table(results)
+
+    report = {
+        "environment": environment(),
+        "settings": {"repeat": args.repeat, "warmup": args.warmup, "seed": args.seed},
+        "cases": [asdict(c) for c in cases],
+        "results": results,
+    }
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        try:
+            with open(args.baseline, encoding="utf-8") as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            sys.exit(
+                "Базовой линии %s нет: снимите ее на эталонной машине через --save-baseline и закоммитьте"
+                % args.baseline
+            )
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for result, metric, was, now in regressions:
+            print(
+                "РЕГРЕССИЯ %s/%s: %s %.2f против %.2f (x%.2f)"
+                % (result["case"], result["phase"], metric, now, was, now / was if was else math.inf)
+            )
+        if regressions:
+            sys.exit(1)
+        print("Регрессий относительно %s нет" % args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -203,6 +203,50 @@ def tests(session):
     session.run("pytest", "tests")
 
 
+@nox.session(python=Config.DEFAULT_PYTHON_VERSION)
+def bench(session):
+    """Бенчмарки: перцентили, пиковая память и сравнение с базовой линией"""
+    session.install("maturin")
+    session.run("maturin", "develop", "--release")
+    session.run(
+        "python",
+        "benchmarks/suite.py",
+        "--json",
+        "bench_results.json",
+        "--baseline",
+        os.path.join("benchmarks", "baseline.json"),
+        *session.posargs,
+    )
+
+
+# Последняя ревизия до быстрых путей для скаляров и пропуска общих
+# поддеревьев: с ней leaf_cost сравнивает текущую сборку.
+LEAF_COST_BASELINE = "4c2b567~1"
+
+
+@nox.session(python=Config.DEFAULT_PYTHON_VERSION)
+def leaf_cost(session):
+    """Стоимость листа до и после быстрых путей; posargs — ревизия «до»"""
+    baseline = session.posargs[0] if session.posargs else LEAF_COST_BASELINE
+    session.install("maturin")
+    tmp = session.create_tmp()
+    worktree = os.path.join(tmp, "baseline")
+    wheels = os.path.join(tmp, "wheels")
+    shutil.rmtree(wheels, ignore_errors=True)
+    session.run("git", "worktree", "add", "--force", "--detach", worktree, baseline, external=True)
+    try:
+        with session.chdir(worktree):
+            session.run("maturin", "build", "--release", "--out", wheels)
+    finally:
+        session.run("git", "worktree", "remove", "--force", worktree, external=True)
+
+    before = os.path.join(tmp, "leaf_cost_before.json")
+    session.install("--force-reinstall", *glob.glob(os.path.join(wheels, "*.whl")))
+    session.run("python", "benchmarks/leaf_cost.py", "--json", before)
+    session.run("maturin", "develop", "--release")
+    session.run("python", "benchmarks/leaf_cost.py", "--baseline", before)
+
+
 @nox.session
 def lint(session):
     session.install("ruff")
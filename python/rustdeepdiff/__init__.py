@@ -1,56 +1,54 @@
-import sys
-from importlib import import_module
-
-# Пробуем разные способы импорта модуля Rust
-try:
-    # Сначала пробуем прямой импорт
-    from _rustdeepdiff import DeepDiff, compare
-except ImportError:
-    try:
-        # Затем пробуем импорт через rustdeepdiff
-        from rustdeepdiff._rustdeepdiff import DeepDiff, compare
-    except ImportError:
-        try:
-            # Пробуем импорт из основного модуля
-            from rustdeepdiff import DeepDiff, compare
-        except ImportError:
-            # Наконец, пробуем импорт через importlib
-            import importlib.util
-            import os
-            
-            # Ищем модуль в разных местах
-            module_paths = [
-                os.path.dirname(__file__),  # Текущая директория
-                os.path.join(os.path.dirname(__file__), "_rustdeepdiff"),  # Поддиректория
-                os.path.join(sys.prefix, "lib", "python" + sys.version[:3], "site-packages"),  # site-packages
-            ]
-            
-            module_found = False
-            for path in module_paths:
-                if os.path.exists(path):
-                    for file in os.listdir(path):
-                        if file.startswith(("_rustdeepdiff", "rustdeepdiff")) and file.endswith((".so", ".pyd")):
-                            spec = importlib.util.spec_from_file_location("_rustdeepdiff", os.path.join(path, file))
-                            _rust_module = importlib.util.module_from_spec(spec)
-                            spec.loader.exec_module(_rust_module)
-                            DeepDiff = _rust_module.DeepDiff
-                            compare = _rust_module.compare
-                            module_found = True
-                            break
-                if module_found:
-                    break
-            
-            if not module_found:
-                raise ImportError("Не удалось найти модуль rustdeepdiff")
-
-# Определяем функцию deep_diff
+"""Глубокое сравнение объектов Python, реализованное на Rust.
+
+Скомпилированный модуль ставится внутрь пакета как
+``rustdeepdiff._rustdeepdiff`` и импортируется ровно одним способом: без
+поиска файлов по каталогам и правки ``sys.modules``. Пакет не импортирует
+ничего, кроме него, чтобы холодный старт оставался коротким: асинхронные
+обертки с asyncio загружаются при первом обращении к ним.
+"""
+
+from ._rustdeepdiff import (
+    CancelToken,
+    DeepDiff,
+    Delta,
+    DiffSession,
+    PathFilter,
+    compare,
+    compare_json,
+    compare_json_files,
+    compare_json_stream,
+    compare_many,
+    compare_pairs,
+    compare_to_snapshot,
+    fingerprint,
+    is_equal,
+    save_json_snapshot,
+    save_snapshot,
+)
+
+
 def deep_diff(t1, t2):
     """Обертка для функции compare для совместимости"""
     return compare(t1, t2)
 
-# Явно экспортируем все необходимые имена
-__all__ = ["DeepDiff", "compare", "deep_diff"]
 
-# Убедимся, что функция deep_diff доступна в глобальном пространстве имен
-import sys
-sys.modules["rustdeepdiff"].deep_diff = deep_diff
+# Имена из модуля _async, который загружается лениво.
+_ASYNC_NAMES = (
+    "compare_async",
+    "compare_json_async",
+    "compare_many_async",
+    "compare_pairs_async",
+    "get_async_concurrency",
+    "set_async_concurrency",
+)
+
+
+def __getattr__(name):
+    if name in _ASYNC_NAMES:
+        from . import _async
+
+        return getattr(_async, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+__all__ = ["CancelToken", "DeepDiff", "Delta", "DiffSession", "PathFilter", "compare", "compare_async", "compare_json", "compare_json_async", "compare_json_files", "compare_json_stream", "compare_many", "compare_many_async", "compare_pairs", "compare_pairs_async", "compare_to_snapshot", "deep_diff", "fingerprint", "get_async_concurrency", "is_equal", "save_json_snapshot", "save_snapshot", "set_async_concurrency"]
@@ -0,0 +1,119 @@
+"""Асинхронные обертки сравнения для серверов на asyncio.
+
+Сравнение идет в общем пуле потоков, а цикл событий ждет результат, не
+блокируясь. Обход снимков идет без GIL; сами снимки и объекты результата
+строятся под GIL. Одновременно в пуле идет не больше
+``get_async_concurrency()`` сравнений, остальные ждут в цикле событий. Так
+очередь видна вызывающему коду и отменяется вместе с задачей.
+
+Отмена задачи снимает сравнение из очереди. Если оно уже идет, обход
+останавливается через CancelToken; слот пула освобождается, когда поток
+действительно закончит работу. compare_json_async проверяет отмену до и
+после разбора каждого документа, но сам начатый разбор доходит до конца.
+
+Модуль загружается при первом обращении к асинхронным именам пакета, чтобы
+``import rustdeepdiff`` не тянул asyncio и concurrent.futures.
+"""
+
+import asyncio
+import os
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from ._rustdeepdiff import CancelToken, compare, compare_json, compare_many, compare_pairs
+
+# Одновременных сравнений по умолчанию: больше ядер обход без GIL не
+# займет, а снимки под GIL мешают циклу событий.
+DEFAULT_CONCURRENCY = min(4, os.cpu_count() or 1)
+
+_lock = threading.Lock()
+_concurrency = DEFAULT_CONCURRENCY
+_executor = None
+# Семафор на цикл событий: asyncio.Semaphore привязан к своему циклу.
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def get_async_concurrency():
+    """Сколько сравнений асинхронные функции выполняют одновременно."""
+    return _concurrency
+
+
+def set_async_concurrency(limit):
+    """Задает число одновременных сравнений и размер пула потоков.
+
+    Уже идущие сравнения доработают в прежнем пуле, новые пойдут в новый.
+    """
+    global _concurrency, _executor
+    if not isinstance(limit, int) or isinstance(limit, bool) or limit < 1:
+        raise ValueError("limit: ожидалось целое число не меньше 1")
+    with _lock:
+        previous, _executor, _concurrency = _executor, None, limit
+    if previous is not None:
+        previous.shutdown(wait=False)
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=_concurrency, thread_name_prefix="rustdeepdiff")
+        return _executor
+
+
+def _semaphore(loop):
+    with _lock:
+        limit, semaphore = _semaphores.get(loop, (None, None))
+        if limit != _concurrency:
+            limit, semaphore = _concurrency, asyncio.Semaphore(_concurrency)
+            _semaphores[loop] = limit, semaphore
+        return semaphore
+
+
+def _release(loop, semaphore):
+    try:
+        loop.call_soon_threadsafe(semaphore.release)
+    except RuntimeError:
+        # Цикл событий уже закрыт, ждать слота больше некому.
+        pass
+
+
+async def _run(func, *args, **options):
+    loop = asyncio.get_running_loop()
+    token = options.setdefault("cancel", CancelToken())
+    semaphore = _semaphore(loop)
+    await semaphore.acquire()
+    try:
+        future = _pool().submit(func, *args, **options)
+    except BaseException:
+        semaphore.release()
+        raise
+    # Слот занят, пока работает поток, а не пока ждет задача.
+    future.add_done_callback(lambda _: _release(loop, semaphore))
+    try:
+        return await asyncio.wrap_future(future, loop=loop)
+    except asyncio.CancelledError:
+        token.cancel()
+        raise
+
+
+async def compare_async(t1, t2, **options):
+    """compare() в пуле потоков с теми же параметрами. С use_hashes=True
+    обход идет по снимкам без GIL и меньше задерживает цикл событий."""
+    return await _run(compare, t1, t2, **options)
+
+
+async def compare_many_async(baseline, candidates, **options):
+    """compare_many() в пуле потоков."""
+    return await _run(compare_many, baseline, candidates, **options)
+
+
+async def compare_pairs_async(pairs, **options):
+    """compare_pairs() в пуле потоков."""
+    return await _run(compare_pairs, pairs, **options)
+
+
+async def compare_json_async(t1, t2):
+    """compare_json() в пуле потоков. bytearray лучше не менять, пока
+    сравнение не закончилось."""
+    return await _run(compare_json, t1, t2)
@@ -4,7 +4,8 @@ from setuptools_rust import Binding, RustExtension
 setup(
     name="rustdeepdiff",
     version="0.1.0",
-    rust_extensions=[RustExtension("rustdeepdiff.rustdeepdiff", binding=Binding.PyO3)],
+    rust_extensions=[RustExtension("rustdeepdiff._rustdeepdiff", binding=Binding.PyO3)],
     packages=["rustdeepdiff"],
+    package_dir={"": "python"},
     zip_safe=False,
 )
@@ -0,0 +1,169 @@
+// Выравнивание двух последовательностей алгоритмом Майерса в линейной
+// памяти: поиск средней змейки и рекурсия по двум половинам. Элементы
+// сравниваются только через eq(i, j), обычно по хешам поддеревьев.
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum Op {
+    Equal(usize, usize),
+    Delete(usize),
+    Insert(usize),
+}
+
+struct Aligner<F> {
+    eq: F,
+    // Оставшийся бюджет шагов; при исчерпании выравнивание прерывается.
+    budget: usize,
+    ops: Vec<Op>,
+}
+
+// Редакционное предписание, переводящее a[0..n] в b[0..m], или None, если
+// бюджет в budget шагов исчерпан раньше (патологические входы).
+pub fn align<F: Fn(usize, usize) -> bool>(n: usize, m: usize, eq: F, budget: usize) -> Option<Vec<Op>> {
+    let mut aligner = Aligner {
+        eq,
+        budget,
+        ops: Vec::with_capacity(n.max(m)),
+    };
+    aligner.diff(0, n, 0, m)?;
+    Some(aligner.ops)
+}
+
+impl<F: Fn(usize, usize) -> bool> Aligner<F> {
+    fn spend(&mut self, steps: usize) -> Option<()> {
+        self.budget = self.budget.checked_sub(steps)?;
+        Some(())
+    }
+
+    fn diff(&mut self, mut a0: usize, mut a1: usize, mut b0: usize, mut b1: usize) -> Option<()> {
+        while a0 < a1 && b0 < b1 && (self.eq)(a0, b0) {
+            self.ops.push(Op::Equal(a0, b0));
+            a0 += 1;
+            b0 += 1;
+        }
+        let (end_a, end_b) = (a1, b1);
+        while a1 > a0 && b1 > b0 && (self.eq)(a1 - 1, b1 - 1) {
+            a1 -= 1;
+            b1 -= 1;
+        }
+        self.spend(a0 + end_a - a1)?;
+
+        if a0 == a1 {
+            self.ops.extend((b0..b1).map(Op::Insert));
+        } else if b0 == b1 {
+            self.ops.extend((a0..a1).map(Op::Delete));
+        } else {
+            match bisect(&self.eq, &mut self.budget, a0, a1, b0, b1)? {
+                Some((x, y)) => {
+                    self.diff(a0, x, b0, y)?;
+                    self.diff(x, a1, y, b1)?;
+                }
+                None => {
+                    self.ops.extend((a0..a1).map(Op::Delete));
+                    self.ops.extend((b0..b1).map(Op::Insert));
+                }
+            }
+        }
+
+        self.ops.extend((a1..end_a).zip(b1..end_b).map(|(i, j)| Op::Equal(i, j)));
+        Some(())
+    }
+}
+
+// Точка разбиения на средней змейке; Some(None) — общих элементов нет.
+fn bisect<F: Fn(usize, usize) -> bool>(
+    eq: &F,
+    budget: &mut usize,
+    a0: usize,
+    a1: usize,
+    b0: usize,
+    b1: usize,
+) -> Option<Option<(usize, usize)>> {
+    let n = (a1 - a0) as isize;
+    let m = (b1 - b0) as isize;
+    let max_d = (n + m + 1) / 2;
+    let offset = max_d;
+    // Запас в два элемента: на краях диагоналей читаются соседи k ± 1.
+    let length = 2 * max_d + 2;
+    let mut v1 = vec![-1isize; length as usize];
+    let mut v2 = vec![-1isize; length as usize];
+    v1[(offset + 1) as usize] = 0;
+    v2[(offset + 1) as usize] = 0;
+    let delta = n - m;
+    // При нечетной разности встреча ищется на прямом проходе.
+    let front = delta % 2 != 0;
+    let (mut k1start, mut k1end, mut k2start, mut k2end) = (0, 0, 0, 0);
+    let eq = |x: isize, y: isize| eq(a0 + x as usize, b0 + y as usize);
+
+    for d in 0..max_d {
+        let mut steps = 0usize;
+
+        let mut k1 = -d + k1start;
+        while k1 <= d - k1end {
+            let k1_offset = (offset + k1) as usize;
+            let mut x1 = if k1 == -d || (k1 != d && v1[k1_offset - 1] < v1[k1_offset + 1]) {
+                v1[k1_offset + 1]
+            } else {
+                v1[k1_offset - 1] + 1
+            };
+            let mut y1 = x1 - k1;
+            let start = x1;
+            while x1 < n && y1 < m && eq(x1, y1) {
+                x1 += 1;
+                y1 += 1;
+            }
+            steps += 1 + (x1 - start) as usize;
+            v1[k1_offset] = x1;
+            if x1 > n {
+                k1end += 2;
+            } else if y1 > m {
+                k1start += 2;
+            } else if front {
+                let k2_offset = offset + delta - k1;
+                if k2_offset >= 0 && k2_offset < length && v2[k2_offset as usize] != -1 {
+                    let x2 = n - v2[k2_offset as usize];
+                    if x1 >= x2 {
+                        return Some(Some((a0 + x1 as usize, b0 + y1 as usize)));
+                    }
+                }
+            }
+            k1 += 2;
+        }
+
+        let mut k2 = -d + k2start;
+        while k2 <= d - k2end {
+            let k2_offset = (offset + k2) as usize;
+            let mut x2 = if k2 == -d || (k2 != d && v2[k2_offset - 1] < v2[k2_offset + 1]) {
+                v2[k2_offset + 1]
+            } else {
+                v2[k2_offset - 1] + 1
+            };
+            let mut y2 = x2 - k2;
+            let start = x2;
+            while x2 < n && y2 < m && eq(n - x2 - 1, m - y2 - 1) {
+                x2 += 1;
+                y2 += 1;
+            }
+            steps += 1 + (x2 - start) as usize;
+            v2[k2_offset] = x2;
+            if x2 > n {
+                k2end += 2;
+            } else if y2 > m {
+                k2start += 2;
+            } else if !front {
+                let k1_offset = offset + delta - k2;
+                if k1_offset >= 0 && k1_offset < length && v1[k1_offset as usize] != -1 {
+                    let x1 = v1[k1_offset as usize];
+                    let y1 = offset + x1 - k1_offset;
+                    if x1 >= n - x2 {
+                        return Some(Some((a0 + x1 as usize, b0 + y1 as usize)));
+                    }
+                }
+            }
+            k2 += 2;
+        }
+
+        *budget = budget.checked_sub(steps)?;
+    }
+
+    Some(None)
+}
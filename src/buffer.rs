@@ -0,0 +1,122 @@
+use pyo3::buffer::{Element, ReadOnlyCell};
+use pyo3::prelude::*;
+use pyo3::types::{PyByteArray, PyBytes, PyMemoryView};
+use pyo3::{ffi, AsPyPointer};
+
+use crate::options::FloatTolerance;
+
+// Тип элемента числового буфера по коду формата struct.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum Numeric {
+    I8,
+    I16,
+    I32,
+    I64,
+    U8,
+    U16,
+    U32,
+    U64,
+    F32,
+    F64,
+}
+
+// Объект с протоколом буфера: array.array, memoryview, mmap, массивы
+// NumPy. bytes и bytearray сюда не относятся — это значения, а не массивы.
+pub fn is_buffer(obj: &PyAny) -> bool {
+    if obj.downcast::<PyBytes>().is_ok() || obj.downcast::<PyByteArray>().is_ok() {
+        return false;
+    }
+    unsafe { ffi::PyObject_CheckBuffer(obj.as_ptr()) != 0 }
+}
+
+// Числовой тип элементов буфера; None — формат не числовой или порядок
+// байтов не родной.
+pub fn numeric_format(obj: &PyAny) -> PyResult<Option<Numeric>> {
+    let view = PyMemoryView::from(obj)?;
+    let format: &str = view.getattr("format")?.extract()?;
+    let itemsize: usize = view.getattr("itemsize")?.extract()?;
+
+    let code = match format.as_bytes() {
+        [code] | [b'@' | b'=', code] => *code,
+        [b'<', code] if cfg!(target_endian = "little") => *code,
+        [b'>' | b'!', code] if cfg!(target_endian = "big") => *code,
+        _ => return Ok(None),
+    };
+    let numeric = match (code, itemsize) {
+        (b'b' | b'h' | b'i' | b'l' | b'q' | b'n', 1) => Numeric::I8,
+        (b'b' | b'h' | b'i' | b'l' | b'q' | b'n', 2) => Numeric::I16,
+        (b'b' | b'h' | b'i' | b'l' | b'q' | b'n', 4) => Numeric::I32,
+        (b'b' | b'h' | b'i' | b'l' | b'q' | b'n', 8) => Numeric::I64,
+        (b'B' | b'H' | b'I' | b'L' | b'Q' | b'N', 1) => Numeric::U8,
+        (b'B' | b'H' | b'I' | b'L' | b'Q' | b'N', 2) => Numeric::U16,
+        (b'B' | b'H' | b'I' | b'L' | b'Q' | b'N', 4) => Numeric::U32,
+        (b'B' | b'H' | b'I' | b'L' | b'Q' | b'N', 8) => Numeric::U64,
+        (b'f', 4) => Numeric::F32,
+        (b'd', 8) => Numeric::F64,
+        _ => return Ok(None),
+    };
+    Ok(Some(numeric))
+}
+
+// Элемент числового буфера: целые сравниваются точно, float — с допусками.
+pub trait Number: Element + PartialEq + IntoPy<PyObject> {
+    fn close(self, other: Self, floats: &FloatTolerance) -> bool;
+}
+
+macro_rules! exact_number {
+    ($($t:ty),*) => {
+        $(impl Number for $t {
+            #[inline]
+            fn close(self, other: Self, _floats: &FloatTolerance) -> bool {
+                self == other
+            }
+        })*
+    };
+}
+
+exact_number!(i8, i16, i32, i64, u8, u16, u32, u64);
+
+impl Number for f32 {
+    #[inline]
+    fn close(self, other: Self, floats: &FloatTolerance) -> bool {
+        floats.eq(self as f64, other as f64)
+    }
+}
+
+impl Number for f64 {
+    #[inline]
+    fn close(self, other: Self, floats: &FloatTolerance) -> bool {
+        floats.eq(self, other)
+    }
+}
+
+// Блок, который проверяется целиком без ветвлений: такой цикл компилятор
+// векторизует, а индексы ищутся только в блоках с различиями.
+const CHUNK: usize = 64;
+
+// Номера различающихся элементов двух буферов одной длины.
+pub fn differing_indexes<T: Number>(a: &[ReadOnlyCell<T>], b: &[ReadOnlyCell<T>], floats: &FloatTolerance) -> Vec<usize> {
+    let mut indexes = Vec::new();
+    for (n, (c1, c2)) in a.chunks(CHUNK).zip(b.chunks(CHUNK)).enumerate() {
+        let same = c1.iter().zip(c2).fold(true, |same, (x, y)| same & x.get().close(y.get(), floats));
+        if same {
+            continue;
+        }
+        for (i, (x, y)) in c1.iter().zip(c2).enumerate() {
+            if !x.get().close(y.get(), floats) {
+                indexes.push(n * CHUNK + i);
+            }
+        }
+    }
+    indexes
+}
+
+// Плоский номер элемента C-смежного буфера в индексы по осям.
+pub fn unravel(mut index: usize, shape: &[usize]) -> Vec<usize> {
+    let mut indexes = vec![0; shape.len()];
+    for (axis, &len) in shape.iter().enumerate().rev() {
+        indexes[axis] = index % len;
+        index /= len;
+    }
+    indexes
+}
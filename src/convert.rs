@@ -0,0 +1,35 @@
+use pyo3::prelude::*;
+use pyo3::types::{PyDict, PyList, PyLong};
+use serde_json::Value;
+
+use crate::json_diff;
+
+pub fn json_to_py(py: Python, value: &Value) -> PyObject {
+    match value {
+        Value::Null => py.None(),
+        Value::Bool(b) => (*b).into_py(py),
+        Value::Number(n) if json_diff::is_float(n) => json_diff::float_value(n).into_py(py),
+        Value::Number(n) => match n.as_i64() {
+            Some(i) => i.into_py(py),
+            // Целое за пределами i64 — через int(str), как в json.loads. Строку
+            // длиннее sys.get_int_max_str_digits() Python не переводит, и
+            // тогда остается float.
+            None => match py.get_type::<PyLong>().call1((json_diff::int_text(n),)) {
+                Ok(value) => value.into(),
+                Err(_) => json_diff::float_value(n).into_py(py),
+            },
+        },
+        Value::String(s) => s.as_str().into_py(py),
+        Value::Array(items) => {
+            PyList::new(py, items.iter().map(|item| json_to_py(py, item))).into()
+        }
+        Value::Object(map) => {
+            let dict = PyDict::new(py);
+            for (k, v) in map {
+                // Ключи уже строки, вставка в свежий dict не может упасть.
+                let _ = dict.set_item(k, json_to_py(py, v));
+            }
+            dict.into()
+        }
+    }
+}
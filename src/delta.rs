@@ -0,0 +1,940 @@
+use std::collections::HashMap;
+
+use pyo3::exceptions::{PyTypeError, PyValueError};
+use pyo3::prelude::*;
+use pyo3::types::{PyBool, PyBytes, PyDict, PyFloat, PyFrozenSet, PyList, PyLong, PySet, PyString, PyTuple};
+
+use crate::path::PathComponent;
+use crate::result::{format_change_path, Category, Change, ChangePath, DeepDiff, Detail, PathKey};
+
+// Что правка делает с местом по своему пути.
+#[derive(Clone)]
+enum Action {
+    // Замена значения: values_changed, type_changes.
+    Replace,
+    // Ключ словаря: dictionary_item_added/removed.
+    AddKey,
+    RemoveKey,
+    // Элемент списка или кортежа по индексу.
+    Insert,
+    Delete,
+    // Элемент множества; путь оканчивается самим элементом.
+    AddMember,
+    RemoveMember,
+    // Перенос элемента списка на индекс в новом списке.
+    Move(usize),
+    // Повторы элемента: с позиций old_indexes на позиции new_indexes.
+    Repeat { old_indexes: Vec<usize>, new_indexes: Vec<usize> },
+    // Атрибут объекта: attribute_added/removed.
+    AddAttr,
+    RemoveAttr,
+}
+
+type EditPath = Vec<PathComponent<PyObject>>;
+
+// Одна правка патча. new — значение, которое записывается по пути (для
+// Move и Repeat — переносимый элемент), old — значение до правки.
+struct Edit {
+    action: Action,
+    path: EditPath,
+    old: Option<PyObject>,
+    new: Option<PyObject>,
+}
+
+fn clone_path(py: Python, path: &[PathComponent<PyObject>]) -> EditPath {
+    path.iter().map(|component| component.map_key(|key| key.clone_ref(py))).collect()
+}
+
+fn format_edit_path(py: Python, path: &[PathComponent<PyObject>]) -> PyResult<String> {
+    let path: ChangePath = path
+        .iter()
+        .map(|component| component.map_key(|key| PathKey::Py(key.clone_ref(py))))
+        .collect();
+    format_change_path(py, &path)
+}
+
+impl Edit {
+    fn from_change(py: Python, category: Category, change: &Change) -> PyResult<Edit> {
+        // Правки применяются рекурсией по пути.
+        if change.path.len() > MAX_DEPTH {
+            let reason = format!("Delta: путь записи длиннее {} компонентов", MAX_DEPTH);
+            return Err(PyValueError::new_err(reason));
+        }
+        // Запись, сопоставленная по group_by, не имеет позиции в списке.
+        if change.path.iter().any(|component| matches!(component, PathComponent::Group(..))) {
+            let path = format_change_path(py, &change.path)?;
+            return Err(PyValueError::new_err(format!(
+                "Delta: записи, сопоставленные по group_by, не адресуются индексом: {}",
+                path
+            )));
+        }
+        let path: EditPath = change
+            .path
+            .iter()
+            .map(|component| component.map_key(|key| key.to_object(py)))
+            .collect();
+        let old = change.old.as_ref().map(|value| value.to_object(py));
+        let new = change.new.as_ref().map(|value| value.to_object(py));
+        let (action, old, new) = match (category, &change.detail) {
+            (Category::ValuesChanged | Category::TypeChanges, _) => (Action::Replace, old, new),
+            (Category::DictionaryItemAdded, _) => (Action::AddKey, old, new),
+            (Category::DictionaryItemRemoved, _) => (Action::RemoveKey, old, new),
+            (Category::IterableItemAdded, _) => (Action::Insert, old, new),
+            (Category::IterableItemRemoved, _) => (Action::Delete, old, new),
+            (Category::SetItemAdded, _) => (Action::AddMember, old, new),
+            (Category::SetItemRemoved, _) => (Action::RemoveMember, old, new),
+            (Category::AttributeAdded, _) => (Action::AddAttr, old, new),
+            (Category::AttributeRemoved, _) => (Action::RemoveAttr, old, new),
+            (Category::IterableItemMoved, Detail::Moved(new_path)) => match new_path.last() {
+                Some(PathComponent::Index(j)) => (Action::Move(*j), None, old),
+                _ => return Err(PyValueError::new_err("Delta: перемещение без индекса назначения")),
+            },
+            (Category::RepetitionChange, Detail::Repetition { old_indexes, new_indexes }) => (
+                Action::Repeat {
+                    old_indexes: old_indexes.clone(),
+                    new_indexes: new_indexes.clone(),
+                },
+                None,
+                old,
+            ),
+            (category, _) => {
+                return Err(PyValueError::new_err(format!("Delta: запись {} без подробностей", category.name())))
+            }
+        };
+        Ok(Edit { action, path, old, new })
+    }
+
+    // Правка, отменяющая эту.
+    fn inverse(&self, py: Python) -> Edit {
+        let mut path = clone_path(py, &self.path);
+        let swap = |old: &Option<PyObject>, new: &Option<PyObject>| {
+            (
+                new.as_ref().map(|v| v.clone_ref(py)),
+                old.as_ref().map(|v| v.clone_ref(py)),
+            )
+        };
+        let (action, (old, new)) = match &self.action {
+            Action::Replace => (Action::Replace, swap(&self.old, &self.new)),
+            Action::AddKey => (Action::RemoveKey, swap(&self.old, &self.new)),
+            Action::RemoveKey => (Action::AddKey, swap(&self.old, &self.new)),
+            Action::Insert => (Action::Delete, swap(&self.old, &self.new)),
+            Action::Delete => (Action::Insert, swap(&self.old, &self.new)),
+            Action::AddMember => (Action::RemoveMember, swap(&self.old, &self.new)),
+            Action::RemoveMember => (Action::AddMember, swap(&self.old, &self.new)),
+            Action::AddAttr => (Action::RemoveAttr, swap(&self.old, &self.new)),
+            Action::RemoveAttr => (Action::AddAttr, swap(&self.old, &self.new)),
+            Action::Move(j) => {
+                let i = match path.last_mut() {
+                    Some(PathComponent::Index(i)) => std::mem::replace(i, *j),
+                    _ => unreachable!("путь перемещения оканчивается индексом"),
+                };
+                (Action::Move(i), swap(&self.new, &self.old))
+            }
+            Action::Repeat { old_indexes, new_indexes } => (
+                Action::Repeat {
+                    old_indexes: new_indexes.clone(),
+                    new_indexes: old_indexes.clone(),
+                },
+                swap(&self.new, &self.old),
+            ),
+        };
+        Edit { action, path, old, new }
+    }
+}
+
+// Правки одного контейнера: относящиеся к нему самому и к его детям,
+// дети — в порядке первого упоминания.
+struct Level<'e> {
+    direct: Vec<&'e Edit>,
+    children: Vec<(&'e PathComponent<PyObject>, Vec<&'e Edit>)>,
+}
+
+// Применение правок на месте. Изменяемые контейнеры и объекты правятся по
+// путям правок, остальное дерево не читается; неизменяемые (кортежи,
+// frozenset, namedtuple, замороженные dataclass) пересобираются и
+// записываются в родителя.
+struct Patcher<'p> {
+    py: Python<'p>,
+    deepcopy: &'p PyAny,
+    // Правки обратного патча: в списках сначала отменяются вставки и
+    // удаления, затем правки по старым индексам.
+    reversed: bool,
+}
+
+// Неизменяемые значения вставляются как есть, контейнеры — копией, чтобы
+// патч и документы не делили изменяемые объекты.
+fn is_atom(value: &PyAny) -> bool {
+    let py = value.py();
+    let ty = value.get_type();
+    value.is_none()
+        || ty.is(py.get_type::<PyBool>())
+        || ty.is(py.get_type::<PyLong>())
+        || ty.is(py.get_type::<PyFloat>())
+        || ty.is(py.get_type::<PyString>())
+        || ty.is(py.get_type::<PyBytes>())
+}
+
+impl<'p> Patcher<'p> {
+    // Ошибка с путем из первых len компонентов пути правки.
+    fn error(&self, edit: &Edit, len: usize, reason: &str) -> PyErr {
+        match format_edit_path(self.py, &edit.path[..len.min(edit.path.len())]) {
+            Ok(path) => PyValueError::new_err(format!("Delta не применяется к {}: {}", path, reason)),
+            Err(e) => e,
+        }
+    }
+
+    fn value(&self, edit: &Edit) -> PyResult<PyObject> {
+        let value = match &edit.new {
+            Some(value) => value.as_ref(self.py),
+            None => return Ok(self.py.None()),
+        };
+        if is_atom(value) {
+            Ok(value.into())
+        } else {
+            Ok(self.deepcopy.call1((value,))?.into())
+        }
+    }
+
+    fn group<'e>(&self, edits: &[&'e Edit], depth: usize) -> PyResult<Level<'e>> {
+        let mut level = Level {
+            direct: Vec::new(),
+            children: Vec::new(),
+        };
+        let mut by_index: HashMap<usize, usize> = HashMap::new();
+        let by_key = PyDict::new(self.py);
+        let by_attr = PyDict::new(self.py);
+        for &edit in edits {
+            if edit.path.len() == depth + 1 {
+                level.direct.push(edit);
+                continue;
+            }
+            let component = &edit.path[depth];
+            let slot = match component {
+                PathComponent::Index(i) => by_index.get(i).copied(),
+                PathComponent::Key(key) => by_key.get_item(key).map(|slot| slot.extract()).transpose()?,
+                PathComponent::Attr(name) => by_attr.get_item(name).map(|slot| slot.extract()).transpose()?,
+                PathComponent::Group(..) => unreachable!("правок по group_by не бывает"),
+            };
+            match slot {
+                Some(slot) => level.children[slot].1.push(edit),
+                None => {
+                    let slot = level.children.len();
+                    match component {
+                        PathComponent::Index(i) => {
+                            by_index.insert(*i, slot);
+                        }
+                        PathComponent::Key(key) => by_key.set_item(key, slot)?,
+                        PathComponent::Attr(name) => by_attr.set_item(name, slot)?,
+                        PathComponent::Group(..) => unreachable!("правок по group_by не бывает"),
+                    }
+                    level.children.push((component, vec![edit]));
+                }
+            }
+        }
+        Ok(level)
+    }
+
+    // Применяет правки к obj, лежащему на глубине depth. Some — объект
+    // заменен или пересобран, и родитель должен записать новое значение.
+    fn apply(&self, obj: &'p PyAny, edits: &[&Edit], depth: usize) -> PyResult<Option<PyObject>> {
+        if let Some(edit) = edits.iter().find(|edit| edit.path.len() == depth) {
+            return match edit.action {
+                Action::Replace => Ok(Some(self.value(edit)?)),
+                _ => Err(self.error(edit, depth, "правка без ключа или индекса")),
+            };
+        }
+
+        let level = self.group(edits, depth)?;
+        if level.addresses_attrs(depth) {
+            self.patch_object(obj, &level, depth)
+        } else if let Ok(dict) = obj.downcast::<PyDict>() {
+            self.patch_dict(dict, &level, depth)?;
+            Ok(None)
+        } else if let Ok(list) = obj.downcast::<PyList>() {
+            self.patch_list(list, &level, depth)?;
+            Ok(None)
+        } else if let Ok(tuple) = obj.downcast::<PyTuple>() {
+            let list = PyList::new(self.py, tuple.iter());
+            self.patch_list(list, &level, depth)?;
+            Ok(Some(rebuild_tuple(obj, list)?))
+        } else if let Ok(set) = obj.downcast::<PySet>() {
+            self.patch_set(set, &level, depth)?;
+            Ok(None)
+        } else if let Ok(frozen) = obj.downcast::<PyFrozenSet>() {
+            let items: Vec<&PyAny> = frozen.iter().collect();
+            let set = PySet::new(self.py, &items)?;
+            self.patch_set(set, &level, depth)?;
+            let items: Vec<&PyAny> = set.iter().collect();
+            Ok(Some(PyFrozenSet::new(self.py, &items)?.into()))
+        } else {
+            let edit = edits[0];
+            let reason = format!("ожидался контейнер, получен {}", obj.get_type().name()?);
+            Err(self.error(edit, depth, &reason))
+        }
+    }
+
+    fn patch_dict(&self, dict: &'p PyDict, level: &Level<'_>, depth: usize) -> PyResult<()> {
+        for (component, edits) in &level.children {
+            let key = match component {
+                PathComponent::Key(key) => key.as_ref(self.py),
+                PathComponent::Index(_) => return Err(self.error(edits[0], depth + 1, "индекс в словаре")),
+                PathComponent::Attr(_) => return Err(self.error(edits[0], depth + 1, "атрибут в словаре")),
+                PathComponent::Group(..) => unreachable!("правок по group_by не бывает"),
+            };
+            let child = dict.get_item(key).ok_or_else(|| self.error(edits[0], depth + 1, "нет такого ключа"))?;
+            if let Some(value) = self.apply(child, edits, depth + 1)? {
+                dict.set_item(key, value)?;
+            }
+        }
+
+        for &edit in &level.direct {
+            let key = match &edit.path[depth] {
+                PathComponent::Key(key) => key.as_ref(self.py),
+                PathComponent::Index(_) => return Err(self.error(edit, depth + 1, "индекс в словаре")),
+                PathComponent::Attr(_) => return Err(self.error(edit, depth + 1, "атрибут в словаре")),
+                PathComponent::Group(..) => unreachable!("правок по group_by не бывает"),
+            };
+            match edit.action {
+                Action::Replace | Action::AddKey => dict.set_item(key, self.value(edit)?)?,
+                Action::RemoveKey => {
+                    if !dict.contains(key)? {
+                        return Err(self.error(edit, depth + 1, "нет такого ключа"));
+                    }
+                    dict.del_item(key)?;
+                }
+                _ => return Err(self.error(edit, depth + 1, "правка элемента списка или множества в словаре")),
+            }
+        }
+        Ok(())
+    }
+
+    fn index(&self, edit: &Edit, component: &PathComponent<PyObject>, depth: usize) -> PyResult<usize> {
+        match component {
+            PathComponent::Index(i) => Ok(*i),
+            PathComponent::Key(_) => Err(self.error(edit, depth + 1, "ключ в списке")),
+            PathComponent::Attr(_) => Err(self.error(edit, depth + 1, "атрибут в списке")),
+            PathComponent::Group(..) => unreachable!("правок по group_by не бывает"),
+        }
+    }
+
+    fn attr(&self, edit: &Edit, component: &'p PathComponent<PyObject>, depth: usize) -> PyResult<&'p PyAny> {
+        match component {
+            PathComponent::Attr(name) => Ok(name.as_ref(self.py)),
+            _ => Err(self.error(edit, depth + 1, "ключ или индекс в объекте")),
+        }
+    }
+
+    // Изменяемые объекты правятся через setattr/delattr. namedtuple и
+    // замороженные dataclass пересобираются через _replace() и
+    // dataclasses.replace() с новыми значениями полей.
+    fn patch_object(&self, obj: &'p PyAny, level: &Level<'_>, depth: usize) -> PyResult<Option<PyObject>> {
+        let record = frozen_record(obj)?;
+        let fields = PyDict::new(self.py);
+        let set = |name: &PyAny, value: PyObject| match record {
+            Some(_) => fields.set_item(name, value),
+            None => obj.setattr(name.downcast::<PyString>()?, value),
+        };
+
+        for (component, edits) in &level.children {
+            let name = self.attr(edits[0], component, depth)?;
+            let child = obj
+                .getattr(name.downcast::<PyString>()?)
+                .map_err(|_| self.error(edits[0], depth + 1, "нет такого атрибута"))?;
+            if let Some(value) = self.apply(child, edits, depth + 1)? {
+                set(name, value)?;
+            }
+        }
+
+        for &edit in &level.direct {
+            let name = self.attr(edit, &edit.path[depth], depth)?;
+            match edit.action {
+                Action::Replace | Action::AddAttr => set(name, self.value(edit)?)?,
+                Action::RemoveAttr if record.is_none() => {
+                    if !obj.hasattr(name.downcast::<PyString>()?)? {
+                        return Err(self.error(edit, depth + 1, "нет такого атрибута"));
+                    }
+                    obj.delattr(name.downcast::<PyString>()?)?;
+                }
+                Action::RemoveAttr => return Err(self.error(edit, depth + 1, "атрибут неизменяемого объекта")),
+                _ => return Err(self.error(edit, depth + 1, "правка элемента контейнера в объекте")),
+            }
+        }
+
+        match record {
+            Some(_) if fields.is_empty() => Ok(None),
+            Some(replace) => Ok(Some(replace.call((obj,), Some(fields))?.into())),
+            None => Ok(None),
+        }
+    }
+
+    // Правки внутри элементов и замены элементов — по индексам исходного
+    // списка, вставки и удаления — по индексам исходного и нового.
+    fn patch_list(&self, list: &'p PyList, level: &Level<'_>, depth: usize) -> PyResult<()> {
+        if self.reversed {
+            self.patch_list_structure(list, level, depth)?;
+            self.patch_list_items(list, level, depth)
+        } else {
+            self.patch_list_items(list, level, depth)?;
+            self.patch_list_structure(list, level, depth)
+        }
+    }
+
+    fn patch_list_items(&self, list: &'p PyList, level: &Level<'_>, depth: usize) -> PyResult<()> {
+        for (component, edits) in &level.children {
+            let i = self.index(edits[0], component, depth)?;
+            if i >= list.len() {
+                return Err(self.error(edits[0], depth + 1, "индекс за пределами списка"));
+            }
+            if let Some(value) = self.apply(list.get_item(i)?, edits, depth + 1)? {
+                list.set_item(i, value)?;
+            }
+        }
+
+        for &edit in level.direct.iter().filter(|edit| matches!(edit.action, Action::Replace)) {
+            let i = self.index(edit, &edit.path[depth], depth)?;
+            if i >= list.len() {
+                return Err(self.error(edit, depth + 1, "индекс за пределами списка"));
+            }
+            list.set_item(i, self.value(edit)?)?;
+        }
+        Ok(())
+    }
+
+    // Удаления идут с конца, вставки — по возрастанию индексов нового
+    // списка, поэтому индексы друг друга не сдвигают.
+    fn patch_list_structure(&self, list: &'p PyList, level: &Level<'_>, depth: usize) -> PyResult<()> {
+        let mut deletes: Vec<(usize, &Edit)> = Vec::new();
+        let mut inserts: Vec<(usize, &Edit)> = Vec::new();
+        for &edit in &level.direct {
+            let i = self.index(edit, &edit.path[depth], depth)?;
+            match &edit.action {
+                Action::Replace => {}
+                Action::Insert => inserts.push((i, edit)),
+                Action::Delete => deletes.push((i, edit)),
+                Action::Move(j) => {
+                    deletes.push((i, edit));
+                    inserts.push((*j, edit));
+                }
+                Action::Repeat { old_indexes, new_indexes } => {
+                    deletes.extend(old_indexes.iter().map(|&i| (i, edit)));
+                    inserts.extend(new_indexes.iter().map(|&j| (j, edit)));
+                }
+                _ => return Err(self.error(edit, depth + 1, "правка ключа или множества в списке")),
+            }
+        }
+
+        deletes.sort_by_key(|(i, _)| *i);
+        deletes.dedup_by_key(|(i, _)| *i);
+        for &(i, edit) in deletes.iter().rev() {
+            if i >= list.len() {
+                return Err(self.error(edit, depth + 1, "индекс за пределами списка"));
+            }
+            list.del_item(i)?;
+        }
+        // Без учета порядка индексы вставок могут превышать длину списка.
+        inserts.sort_by_key(|(j, _)| *j);
+        for &(j, edit) in &inserts {
+            list.insert(j.min(list.len()), self.value(edit)?)?;
+        }
+        Ok(())
+    }
+
+    fn patch_set(&self, set: &'p PySet, level: &Level<'_>, depth: usize) -> PyResult<()> {
+        if let Some((_, edits)) = level.children.first() {
+            return Err(self.error(edits[0], depth + 1, "правка внутри элемента множества"));
+        }
+        for &edit in &level.direct {
+            let member = match &edit.path[depth] {
+                PathComponent::Key(member) => member.as_ref(self.py),
+                PathComponent::Index(_) => return Err(self.error(edit, depth + 1, "индекс в множестве")),
+                PathComponent::Attr(_) => return Err(self.error(edit, depth + 1, "атрибут в множестве")),
+                PathComponent::Group(..) => unreachable!("правок по group_by не бывает"),
+            };
+            match edit.action {
+                Action::AddMember => set.add(member)?,
+                Action::RemoveMember => set.discard(member),
+                _ => return Err(self.error(edit, depth + 1, "правка ключа или списка в множестве")),
+            }
+        }
+        Ok(())
+    }
+}
+
+impl Level<'_> {
+    // Правки этого уровня адресуют атрибуты объекта, а не элементы.
+    fn addresses_attrs(&self, depth: usize) -> bool {
+        let component = match (self.children.first(), self.direct.first()) {
+            (Some((component, _)), _) => *component,
+            (None, Some(edit)) => &edit.path[depth],
+            (None, None) => return false,
+        };
+        matches!(component, PathComponent::Attr(_))
+    }
+}
+
+// Функция пересборки для неизменяемых объектов с полями: _replace для
+// namedtuple, dataclasses.replace для замороженных dataclass.
+fn frozen_record(obj: &PyAny) -> PyResult<Option<&PyAny>> {
+    let py = obj.py();
+    let ty = obj.get_type();
+    if obj.downcast::<PyTuple>().is_ok() && ty.hasattr("_fields")? {
+        let replace = ty.getattr("_replace")?;
+        return Ok(Some(replace));
+    }
+    if let Ok(params) = ty.getattr("__dataclass_params__") {
+        if params.getattr("frozen")?.is_true()? {
+            return Ok(Some(py.import("dataclasses")?.getattr("replace")?));
+        }
+    }
+    Ok(None)
+}
+
+// Кортеж того же типа: namedtuple собирается через _make().
+fn rebuild_tuple(original: &PyAny, items: &PyList) -> PyResult<PyObject> {
+    let py = original.py();
+    let ty = original.get_type();
+    if ty.is(py.get_type::<PyTuple>()) {
+        Ok(items.to_tuple().into())
+    } else if ty.hasattr("_make")? {
+        Ok(ty.call_method1("_make", (items,))?.into())
+    } else {
+        Ok(ty.call1((items,))?.into())
+    }
+}
+
+// Двоичный формат патча. Заголовок: MAGIC, версия, флаги, число правок.
+// Правка: действие, путь (компоненты — индекс или ключ-значение), маска
+// присутствия old/new, значения и данные действия. Целые — varint.
+const MAGIC: &[u8; 4] = b"RDDT";
+
+// Наибольшая длина пути правки и вложенность значений. Применение,
+// сериализация и чтение патча рекурсивны, а данные from_bytes могут прийти
+// из сети: без предела глубокий путь или значение переполнили бы стек.
+// Столько же уровней copy.deepcopy проходит при пределе рекурсии Python.
+const MAX_DEPTH: usize = 1_000;
+const FORMAT_VERSION: u8 = 1;
+
+const FLAG_REVERSED: u8 = 1;
+const FLAG_UNORDERED: u8 = 2;
+
+const HAS_OLD: u8 = 1;
+const HAS_NEW: u8 = 2;
+
+const PATH_INDEX: u8 = 0;
+const PATH_KEY: u8 = 1;
+const PATH_ATTR: u8 = 2;
+
+mod tag {
+    pub const NONE: u8 = 0;
+    pub const FALSE: u8 = 1;
+    pub const TRUE: u8 = 2;
+    pub const INT: u8 = 3;
+    pub const BIG_INT: u8 = 4;
+    pub const FLOAT: u8 = 5;
+    pub const STR: u8 = 6;
+    pub const BYTES: u8 = 7;
+    pub const LIST: u8 = 8;
+    pub const TUPLE: u8 = 9;
+    pub const DICT: u8 = 10;
+    pub const SET: u8 = 11;
+    pub const FROZENSET: u8 = 12;
+}
+
+fn write_varint(out: &mut Vec<u8>, mut value: u64) {
+    while value >= 0x80 {
+        out.push(value as u8 | 0x80);
+        value >>= 7;
+    }
+    out.push(value as u8);
+}
+
+fn write_bytes(out: &mut Vec<u8>, bytes: &[u8]) {
+    write_varint(out, bytes.len() as u64);
+    out.extend_from_slice(bytes);
+}
+
+fn write_indexes(out: &mut Vec<u8>, indexes: &[usize]) {
+    write_varint(out, indexes.len() as u64);
+    for &i in indexes {
+        write_varint(out, i as u64);
+    }
+}
+
+// Значения — только встроенные типы точно, без подклассов. depth —
+// вложенность value в значении правки.
+fn encode_value(out: &mut Vec<u8>, value: &PyAny, depth: usize) -> PyResult<()> {
+    if depth >= MAX_DEPTH {
+        return Err(PyValueError::new_err(format!(
+            "Delta: значение глубже {} уровней не сериализуется",
+            MAX_DEPTH
+        )));
+    }
+    let py = value.py();
+    let ty = value.get_type();
+    if value.is_none() {
+        out.push(tag::NONE);
+    } else if ty.is(py.get_type::<PyBool>()) {
+        out.push(if value.is_true()? { tag::TRUE } else { tag::FALSE });
+    } else if ty.is(py.get_type::<PyLong>()) {
+        match value.extract::<i64>() {
+            Ok(v) => {
+                out.push(tag::INT);
+                write_varint(out, ((v << 1) ^ (v >> 63)) as u64);
+            }
+            Err(_) => {
+                out.push(tag::BIG_INT);
+                write_bytes(out, value.str()?.to_str()?.as_bytes());
+            }
+        }
+    } else if ty.is(py.get_type::<PyFloat>()) {
+        out.push(tag::FLOAT);
+        out.extend_from_slice(&value.downcast::<PyFloat>()?.value().to_le_bytes());
+    } else if ty.is(py.get_type::<PyString>()) {
+        out.push(tag::STR);
+        write_bytes(out, value.downcast::<PyString>()?.to_str()?.as_bytes());
+    } else if ty.is(py.get_type::<PyBytes>()) {
+        out.push(tag::BYTES);
+        write_bytes(out, value.downcast::<PyBytes>()?.as_bytes());
+    } else if ty.is(py.get_type::<PyList>()) {
+        encode_items(out, tag::LIST, value, depth)?;
+    } else if ty.is(py.get_type::<PyTuple>()) {
+        encode_items(out, tag::TUPLE, value, depth)?;
+    } else if ty.is(py.get_type::<PySet>()) {
+        encode_items(out, tag::SET, value, depth)?;
+    } else if ty.is(py.get_type::<PyFrozenSet>()) {
+        encode_items(out, tag::FROZENSET, value, depth)?;
+    } else if ty.is(py.get_type::<PyDict>()) {
+        let dict = value.downcast::<PyDict>()?;
+        out.push(tag::DICT);
+        write_varint(out, dict.len() as u64);
+        for (k, v) in dict.iter() {
+            encode_value(out, k, depth + 1)?;
+            encode_value(out, v, depth + 1)?;
+        }
+    } else {
+        return Err(PyTypeError::new_err(format!(
+            "Delta: значение типа {} не сериализуется",
+            ty.name()?
+        )));
+    }
+    Ok(())
+}
+
+fn encode_items(out: &mut Vec<u8>, tag: u8, value: &PyAny, depth: usize) -> PyResult<()> {
+    out.push(tag);
+    write_varint(out, value.len()? as u64);
+    for item in value.iter()? {
+        encode_value(out, item?, depth + 1)?;
+    }
+    Ok(())
+}
+
+fn encode_edit(py: Python, out: &mut Vec<u8>, edit: &Edit) -> PyResult<()> {
+    out.push(match edit.action {
+        Action::Replace => 0,
+        Action::AddKey => 1,
+        Action::RemoveKey => 2,
+        Action::Insert => 3,
+        Action::Delete => 4,
+        Action::AddMember => 5,
+        Action::RemoveMember => 6,
+        Action::Move(_) => 7,
+        Action::Repeat { .. } => 8,
+        Action::AddAttr => 9,
+        Action::RemoveAttr => 10,
+    });
+
+    write_varint(out, edit.path.len() as u64);
+    for component in &edit.path {
+        match component {
+            PathComponent::Index(i) => {
+                out.push(PATH_INDEX);
+                write_varint(out, *i as u64);
+            }
+            PathComponent::Key(key) => {
+                out.push(PATH_KEY);
+                encode_value(out, key.as_ref(py), 0)?;
+            }
+            PathComponent::Attr(name) => {
+                out.push(PATH_ATTR);
+                encode_value(out, name.as_ref(py), 0)?;
+            }
+            PathComponent::Group(..) => unreachable!("правок по group_by не бывает"),
+        }
+    }
+
+    out.push(edit.old.as_ref().map_or(0, |_| HAS_OLD) | edit.new.as_ref().map_or(0, |_| HAS_NEW));
+    for value in edit.old.iter().chain(edit.new.iter()) {
+        encode_value(out, value.as_ref(py), 0)?;
+    }
+
+    match &edit.action {
+        Action::Move(j) => write_varint(out, *j as u64),
+        Action::Repeat { old_indexes, new_indexes } => {
+            write_indexes(out, old_indexes);
+            write_indexes(out, new_indexes);
+        }
+        _ => {}
+    }
+    Ok(())
+}
+
+fn corrupt(reason: &str) -> PyErr {
+    PyValueError::new_err(format!("Некорректные данные Delta: {}", reason))
+}
+
+struct Reader<'b> {
+    data: &'b [u8],
+    pos: usize,
+}
+
+impl<'b> Reader<'b> {
+    fn take(&mut self, n: usize) -> PyResult<&'b [u8]> {
+        let end = self.pos.checked_add(n).filter(|&end| end <= self.data.len());
+        let end = end.ok_or_else(|| corrupt("неожиданный конец данных"))?;
+        let bytes = &self.data[self.pos..end];
+        self.pos = end;
+        Ok(bytes)
+    }
+
+    fn byte(&mut self) -> PyResult<u8> {
+        Ok(self.take(1)?[0])
+    }
+
+    fn varint(&mut self) -> PyResult<u64> {
+        let mut value = 0u64;
+        for shift in (0..64).step_by(7) {
+            let byte = self.byte()?;
+            value |= ((byte & 0x7f) as u64) << shift;
+            if byte & 0x80 == 0 {
+                return Ok(value);
+            }
+        }
+        Err(corrupt("слишком длинное число"))
+    }
+
+    fn len(&mut self) -> PyResult<usize> {
+        let len = self.varint()? as usize;
+        // Каждый элемент занимает хотя бы байт: защита от огромных выделений.
+        if len > self.data.len() - self.pos {
+            return Err(corrupt("длина больше оставшихся данных"));
+        }
+        Ok(len)
+    }
+
+    fn bytes(&mut self) -> PyResult<&'b [u8]> {
+        let len = self.len()?;
+        self.take(len)
+    }
+
+    fn str(&mut self) -> PyResult<&'b str> {
+        std::str::from_utf8(self.bytes()?).map_err(|_| corrupt("строка не в UTF-8"))
+    }
+
+    fn indexes(&mut self) -> PyResult<Vec<usize>> {
+        let len = self.len()?;
+        (0..len).map(|_| Ok(self.varint()? as usize)).collect()
+    }
+
+    // Значение на глубине depth внутри значения правки.
+    fn value(&mut self, py: Python, depth: usize) -> PyResult<PyObject> {
+        if depth >= MAX_DEPTH {
+            return Err(corrupt(&format!("вложенность значения глубже {} уровней", MAX_DEPTH)));
+        }
+        Ok(match self.byte()? {
+            tag::NONE => py.None(),
+            tag::FALSE => false.into_py(py),
+            tag::TRUE => true.into_py(py),
+            tag::INT => {
+                let v = self.varint()?;
+                (((v >> 1) as i64) ^ -((v & 1) as i64)).into_py(py)
+            }
+            tag::BIG_INT => py.get_type::<PyLong>().call1((self.str()?,))?.into(),
+            tag::FLOAT => {
+                let bytes: [u8; 8] = self.take(8)?.try_into().expect("ровно 8 байт");
+                f64::from_le_bytes(bytes).into_py(py)
+            }
+            tag::STR => self.str()?.into_py(py),
+            tag::BYTES => PyBytes::new(py, self.bytes()?).into(),
+            tag::LIST => PyList::new(py, self.items(py, depth + 1)?).into(),
+            tag::TUPLE => PyTuple::new(py, self.items(py, depth + 1)?).into(),
+            tag::SET => PySet::new(py, &self.items(py, depth + 1)?)?.into(),
+            tag::FROZENSET => PyFrozenSet::new(py, &self.items(py, depth + 1)?)?.into(),
+            tag::DICT => {
+                let len = self.len()?;
+                let dict = PyDict::new(py);
+                for _ in 0..len {
+                    let key = self.value(py, depth + 1)?;
+                    dict.set_item(key, self.value(py, depth + 1)?)?;
+                }
+                dict.into()
+            }
+            other => return Err(corrupt(&format!("неизвестный тип значения {}", other))),
+        })
+    }
+
+    fn items(&mut self, py: Python, depth: usize) -> PyResult<Vec<PyObject>> {
+        let len = self.len()?;
+        (0..len).map(|_| self.value(py, depth)).collect()
+    }
+
+    fn edit(&mut self, py: Python) -> PyResult<Edit> {
+        let action = self.byte()?;
+
+        let len = self.len()?;
+        if len > MAX_DEPTH {
+            return Err(corrupt(&format!("путь правки длиннее {} компонентов", MAX_DEPTH)));
+        }
+        let mut path = Vec::with_capacity(len);
+        for _ in 0..len {
+            path.push(match self.byte()? {
+                PATH_INDEX => PathComponent::Index(self.varint()? as usize),
+                PATH_KEY => PathComponent::Key(self.value(py, 0)?),
+                PATH_ATTR => PathComponent::Attr(self.value(py, 0)?),
+                other => return Err(corrupt(&format!("неизвестный компонент пути {}", other))),
+            });
+        }
+
+        let mask = self.byte()?;
+        let old = if mask & HAS_OLD != 0 { Some(self.value(py, 0)?) } else { None };
+        let new = if mask & HAS_NEW != 0 { Some(self.value(py, 0)?) } else { None };
+
+        let action = match action {
+            0 => Action::Replace,
+            1 => Action::AddKey,
+            2 => Action::RemoveKey,
+            3 => Action::Insert,
+            4 => Action::Delete,
+            5 => Action::AddMember,
+            6 => Action::RemoveMember,
+            7 => Action::Move(self.varint()? as usize),
+            8 => Action::Repeat {
+                old_indexes: self.indexes()?,
+                new_indexes: self.indexes()?,
+            },
+            9 => Action::AddAttr,
+            10 => Action::RemoveAttr,
+            other => return Err(corrupt(&format!("неизвестное действие {}", other))),
+        };
+        if matches!(action, Action::Move(_)) && !matches!(path.last(), Some(PathComponent::Index(_))) {
+            return Err(corrupt("путь перемещения без индекса"));
+        }
+        Ok(Edit { action, path, old, new })
+    }
+}
+
+// Патч из результата сравнения: apply(t1) превращает t1 в t2, правя
+// только затронутые пути. Сериализуется в компактный двоичный вид с
+// путями из ключей и индексов, а не строками.
+#[pyclass]
+pub struct Delta {
+    edits: Vec<Edit>,
+    reversed: bool,
+    // Сравнение было без учета порядка: индексы списков не задают позиций,
+    // и результат совпадает с t2 тоже без учета порядка.
+    unordered: bool,
+}
+
+#[pymethods]
+impl Delta {
+    #[new]
+    fn new(py: Python, diff: PyRef<'_, DeepDiff>) -> PyResult<Self> {
+        // Из усеченного результата вышел бы патч, который не дает ни t1, ни t2.
+        if diff.truncated {
+            return Err(PyValueError::new_err(
+                "Delta: сравнение остановлено раньше (max_diffs, max_depth, timeout или cancel), \
+                 патч из неполного результата не строится",
+            ));
+        }
+        let mut edits = Vec::new();
+        for category in Category::ALL {
+            for change in diff.entries(category) {
+                edits.push(Edit::from_change(py, category, change)?);
+            }
+        }
+        Ok(Delta {
+            edits,
+            reversed: false,
+            unordered: diff.unordered,
+        })
+    }
+
+    fn __len__(&self) -> usize {
+        self.edits.len()
+    }
+
+    fn __repr__(&self) -> String {
+        format!("Delta(edits={}, reversed={})", self.edits.len(), self.reversed)
+    }
+
+    // Применяет патч на месте и возвращает результат: это сам obj, если
+    // он не заменен целиком и не является кортежем или frozenset.
+    fn apply(&self, py: Python, obj: &PyAny) -> PyResult<PyObject> {
+        let patcher = Patcher {
+            py,
+            deepcopy: py.import("copy")?.getattr("deepcopy")?,
+            reversed: self.reversed,
+        };
+        let edits: Vec<&Edit> = self.edits.iter().collect();
+        if edits.is_empty() {
+            return Ok(obj.into());
+        }
+        Ok(patcher.apply(obj, &edits, 0)?.unwrap_or_else(|| obj.into()))
+    }
+
+    // Обратный патч: apply(t2) возвращает t1.
+    fn reverse(&self, py: Python) -> PyResult<Delta> {
+        if self.unordered {
+            return Err(PyValueError::new_err(
+                "Delta из сравнения с ignore_order=True нельзя обратить: индексы в нем не задают позиций",
+            ));
+        }
+        Ok(Delta {
+            edits: self.edits.iter().map(|edit| edit.inverse(py)).collect(),
+            reversed: !self.reversed,
+            unordered: false,
+        })
+    }
+
+    fn to_bytes(&self, py: Python) -> PyResult<PyObject> {
+        let mut out = Vec::new();
+        out.extend_from_slice(MAGIC);
+        out.push(FORMAT_VERSION);
+        let mut flags = 0;
+        if self.reversed {
+            flags |= FLAG_REVERSED;
+        }
+        if self.unordered {
+            flags |= FLAG_UNORDERED;
+        }
+        out.push(flags);
+        write_varint(&mut out, self.edits.len() as u64);
+        for edit in &self.edits {
+            encode_edit(py, &mut out, edit)?;
+        }
+        Ok(PyBytes::new(py, &out).into())
+    }
+
+    #[staticmethod]
+    fn from_bytes(py: Python, data: &[u8]) -> PyResult<Delta> {
+        let mut reader = Reader { data, pos: 0 };
+        if reader.take(MAGIC.len()).ok() != Some(&MAGIC[..]) {
+            return Err(corrupt("это не Delta"));
+        }
+        let version = reader.byte()?;
+        if version != FORMAT_VERSION {
+            return Err(corrupt(&format!("неподдерживаемая версия формата {}", version)));
+        }
+        let flags = reader.byte()?;
+        let count = reader.len()?;
+        let edits = (0..count).map(|_| reader.edit(py)).collect::<PyResult<Vec<_>>>()?;
+        if reader.pos != data.len() {
+            return Err(corrupt("лишние данные в конце"));
+        }
+        Ok(Delta {
+            edits,
+            reversed: flags & FLAG_REVERSED != 0,
+            unordered: flags & FLAG_UNORDERED != 0,
+        })
+    }
+}
@@ -0,0 +1,284 @@
+use std::collections::HashMap;
+use std::sync::Arc;
+
+use pyo3::exceptions::PyValueError;
+use pyo3::prelude::*;
+use pyo3::types::PyString;
+use regex::RegexSet;
+
+use crate::path::{parse_path, push_attr, push_index, push_key, PathComponent};
+
+// Узел префиксного дерева путей. Узлы лежат в одном векторе, дети
+// ссылаются на них по номеру.
+#[derive(Debug, Default)]
+struct TrieNode {
+    keys: HashMap<String, usize>,
+    indexes: HashMap<usize, usize>,
+    attrs: HashMap<String, usize>,
+    exclude: bool,
+    include: bool,
+}
+
+impl TrieNode {
+    fn is_leaf(&self) -> bool {
+        self.keys.is_empty() && self.indexes.is_empty() && self.attrs.is_empty()
+    }
+}
+
+// Шаг пути при спуске: строковый ключ, индекс (и неотрицательный
+// int-ключ — в строке пути они неотличимы), repr() прочих ключей либо
+// атрибут объекта. Запись group_by идет как Repr с текстом id=42.
+#[derive(Clone, Copy)]
+pub enum Step<'k> {
+    Key(&'k str),
+    Index(usize),
+    Repr(&'k str),
+    Attr(&'k str),
+}
+
+fn push_step(text: &mut String, step: Step<'_>) {
+    match step {
+        Step::Key(key) => push_key(text, key),
+        Step::Index(idx) => push_index(text, idx),
+        Step::Repr(repr) => {
+            text.push('[');
+            text.push_str(repr);
+            text.push(']');
+        }
+        Step::Attr(name) => push_attr(text, name),
+    }
+}
+
+// Положение обхода в фильтре. node — узел дерева для текущего пути (None,
+// если правил глубже нет), included — путь внутри include_paths, text_len —
+// длина строки пути в общем буфере обхода (только при шаблонах).
+#[derive(Debug, Clone, Copy)]
+pub struct Cursor {
+    node: Option<usize>,
+    pub included: bool,
+    text_len: usize,
+}
+
+// Скомпилированные exclude_paths / include_paths / exclude_regex_paths /
+// exclude_glob_paths. Точные пути собраны в префиксное дерево, шаблоны —
+// в один RegexSet; обход проверяет каждого ребенка перед спуском в него,
+// и исключенные поддеревья не читаются вовсе.
+#[derive(Debug)]
+pub struct Filter {
+    nodes: Vec<TrieNode>,
+    has_include: bool,
+    patterns: Option<RegexSet>,
+}
+
+// Глоб в регулярное выражение над строкой пути: * — любая часть одного
+// компонента, ** — любое число компонентов, ? — один символ.
+fn glob_to_regex(glob: &str) -> String {
+    let mut regex = String::from("^");
+    let mut chars = glob.chars().peekable();
+    while let Some(c) = chars.next() {
+        match c {
+            '*' if chars.peek() == Some(&'*') => {
+                chars.next();
+                regex.push_str(".*");
+            }
+            '*' => regex.push_str(r"[^\[\]]*"),
+            '?' => regex.push('.'),
+            c => regex.push_str(&regex::escape(c.encode_utf8(&mut [0; 4]))),
+        }
+    }
+    regex.push('$');
+    regex
+}
+
+impl Filter {
+    pub fn compile(exclude: &[String], include: &[String], regexes: &[String], globs: &[String]) -> PyResult<Filter> {
+        let mut filter = Filter {
+            nodes: vec![TrieNode::default()],
+            has_include: !include.is_empty(),
+            patterns: None,
+        };
+        for path in exclude {
+            let id = filter.insert(path)?;
+            filter.nodes[id].exclude = true;
+        }
+        for path in include {
+            let id = filter.insert(path)?;
+            filter.nodes[id].include = true;
+        }
+
+        let patterns: Vec<String> = regexes.iter().cloned().chain(globs.iter().map(|g| glob_to_regex(g))).collect();
+        if !patterns.is_empty() {
+            let set = RegexSet::new(&patterns)
+                .map_err(|e| PyValueError::new_err(format!("Некорректный шаблон пути: {}", e)))?;
+            filter.patterns = Some(set);
+        }
+        Ok(filter)
+    }
+
+    fn insert(&mut self, path: &str) -> PyResult<usize> {
+        if !path.starts_with("root") {
+            return Err(PyValueError::new_err(format!("Путь должен начинаться с root: {}", path)));
+        }
+        let mut id = 0;
+        for component in parse_path(path) {
+            let next = self.nodes.len();
+            let node = &mut self.nodes[id];
+            let child = match component {
+                PathComponent::Key(key) => *node.keys.entry(key).or_insert(next),
+                PathComponent::Index(idx) => *node.indexes.entry(idx).or_insert(next),
+                PathComponent::Attr(name) => *node.attrs.entry(name).or_insert(next),
+                // parse_path читает [id=42] как ключ id=42; шаг записи
+                // group_by ищется среди ключей по тому же тексту.
+                PathComponent::Group(..) => unreachable!("parse_path не выдает компонентов group_by"),
+            };
+            if child == next {
+                self.nodes.push(TrieNode::default());
+            }
+            id = child;
+        }
+        Ok(id)
+    }
+
+    pub fn root(&self, text: &mut String) -> Cursor {
+        text.clear();
+        text.push_str("root");
+        let root = &self.nodes[0];
+        Cursor {
+            node: if root.exclude { None } else { Some(0) },
+            included: !root.exclude && (!self.has_include || root.include),
+            text_len: text.len(),
+        }
+    }
+
+    // Нужен ли шаг для спуска из cursor; если нет, ребенок наследует
+    // курсор родителя, и ключ можно не разбирать.
+    pub fn needs_step(&self, cursor: Cursor) -> bool {
+        self.patterns.is_some() || cursor.node.map_or(false, |id| !self.nodes[id].is_leaf())
+    }
+
+    pub fn inherit(&self, cursor: Cursor) -> Cursor {
+        Cursor { node: None, ..cursor }
+    }
+
+    // Курсор ребенка или None, если поддерево пропускается: исключено или
+    // не ведет ни к одному из include_paths.
+    pub fn step(&self, cursor: Cursor, step: Step<'_>, text: &mut String) -> Option<Cursor> {
+        if !self.needs_step(cursor) {
+            return Some(self.inherit(cursor));
+        }
+
+        let node = cursor.node.and_then(|id| {
+            let node = &self.nodes[id];
+            match step {
+                // Правило root.key из старого вида путей задает и ключ
+                // словаря: если ключа в явном виде нет, берется атрибут.
+                Step::Key(key) => node.keys.get(key).or_else(|| node.attrs.get(key)).copied(),
+                Step::Repr(key) => node.keys.get(key).copied(),
+                Step::Index(idx) => node.indexes.get(&idx).copied(),
+                Step::Attr(name) => node.attrs.get(name).copied(),
+            }
+        });
+        let trie = node.map(|id| &self.nodes[id]);
+        if trie.map_or(false, |n| n.exclude) {
+            return None;
+        }
+        let included = cursor.included || trie.map_or(false, |n| n.include);
+        if !included && node.is_none() {
+            return None;
+        }
+
+        let mut text_len = cursor.text_len;
+        if let Some(patterns) = &self.patterns {
+            text.truncate(cursor.text_len);
+            push_step(text, step);
+            if patterns.is_match(text) {
+                return None;
+            }
+            text_len = text.len();
+        }
+        Some(Cursor { node, included, text_len })
+    }
+}
+
+fn path_list(value: Option<&PyAny>) -> PyResult<Vec<String>> {
+    match value {
+        None => Ok(Vec::new()),
+        Some(value) if value.is_none() => Ok(Vec::new()),
+        Some(value) => match value.downcast::<PyString>() {
+            Ok(path) => Ok(vec![path.to_str()?.to_string()]),
+            Err(_) => value.extract(),
+        },
+    }
+}
+
+// Параметры фильтра из именованных аргументов compare(); компилируются
+// один раз на вызов.
+#[derive(Default)]
+pub struct FilterSpec {
+    pub exclude: Vec<String>,
+    pub include: Vec<String>,
+    pub regexes: Vec<String>,
+    pub globs: Vec<String>,
+}
+
+impl FilterSpec {
+    // Принимает параметр фильтра; false — имя к фильтру не относится.
+    pub fn set(&mut self, name: &str, value: &PyAny) -> PyResult<bool> {
+        let target = match name {
+            "exclude_paths" => &mut self.exclude,
+            "include_paths" => &mut self.include,
+            "exclude_regex_paths" => &mut self.regexes,
+            "exclude_glob_paths" => &mut self.globs,
+            _ => return Ok(false),
+        };
+        *target = path_list(Some(value))?;
+        Ok(true)
+    }
+
+    pub fn is_empty(&self) -> bool {
+        self.exclude.is_empty() && self.include.is_empty() && self.regexes.is_empty() && self.globs.is_empty()
+    }
+
+    pub fn compile(&self) -> PyResult<Filter> {
+        Filter::compile(&self.exclude, &self.include, &self.regexes, &self.globs)
+    }
+}
+
+// Скомпилированный фильтр путей для повторного использования:
+// compare(t1, t2, path_filter=PathFilter(exclude_paths=[...])).
+#[pyclass]
+pub struct PathFilter {
+    pub filter: Arc<Filter>,
+}
+
+#[pymethods]
+impl PathFilter {
+    #[new]
+    #[pyo3(signature = (exclude_paths=None, include_paths=None, exclude_regex_paths=None, exclude_glob_paths=None))]
+    fn new(
+        exclude_paths: Option<&PyAny>,
+        include_paths: Option<&PyAny>,
+        exclude_regex_paths: Option<&PyAny>,
+        exclude_glob_paths: Option<&PyAny>,
+    ) -> PyResult<Self> {
+        let spec = FilterSpec {
+            exclude: path_list(exclude_paths)?,
+            include: path_list(include_paths)?,
+            regexes: path_list(exclude_regex_paths)?,
+            globs: path_list(exclude_glob_paths)?,
+        };
+        Ok(PathFilter {
+            filter: Arc::new(spec.compile()?),
+        })
+    }
+
+    fn __repr__(&self) -> String {
+        let nodes = &self.filter.nodes;
+        format!(
+            "PathFilter(exclude={}, include={}, patterns={})",
+            nodes.iter().filter(|n| n.exclude).count(),
+            nodes.iter().filter(|n| n.include).count(),
+            self.filter.patterns.as_ref().map_or(0, RegexSet::len),
+        )
+    }
+}
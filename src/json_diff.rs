@@ -0,0 +1,233 @@
+use std::fmt;
+
+use serde::Deserialize;
+use serde_json::{Number, Value};
+
+use crate::options::CancelToken;
+use crate::path::{to_owned_path, PathComponent};
+
+// Записи одной категории в порядке обхода: элементы массивов — по
+// индексу, ключи объектов — по возрастанию, а не в порядке документа
+// (serde_json собран без preserve_order). Путь хранится компонентами,
+// строка из него собирается только при выдаче.
+pub type Entries<T> = Vec<(Vec<PathComponent>, T)>;
+
+#[derive(Debug, Clone, Default)]
+pub struct Diff {
+    pub values_changed: Entries<(Value, Value)>,
+    pub type_changes: Entries<(Value, Value)>,
+    pub dictionary_item_added: Entries<Value>,
+    pub dictionary_item_removed: Entries<Value>,
+    pub iterable_item_added: Entries<Value>,
+    pub iterable_item_removed: Entries<Value>,
+    // Отмена извне (compare_json(cancel=...)): обход прекращается, и
+    // результат помечается усеченным.
+    pub cancel: Option<CancelToken>,
+    pub truncated: bool,
+}
+
+impl Diff {
+    // Проверка на каждом узле: флаг отмены — одно атомарное чтение.
+    fn cancelled(&mut self) -> bool {
+        if !self.truncated && self.cancel.as_ref().map_or(false, CancelToken::is_cancelled) {
+            self.truncated = true;
+        }
+        self.truncated
+    }
+}
+
+// Глубже этого документы не разбираются: разбор, сравнение и перевод в
+// объекты Python рекурсивны, и предел держит их в стеке потока Python.
+// json.loads при настройках по умолчанию отказывает раньше, примерно на
+// тысяче уровней.
+pub const MAX_DEPTH: usize = 2_000;
+
+#[derive(Debug)]
+pub enum ParseError {
+    Syntax(serde_json::Error),
+    TooDeep,
+}
+
+impl fmt::Display for ParseError {
+    fn fmt(&self, f: &mut fmt::Formatter<'_>) -> fmt::Result {
+        match self {
+            ParseError::Syntax(e) => write!(f, "{}", e),
+            ParseError::TooDeep => write!(f, "вложенность глубже {} уровней", MAX_DEPTH),
+        }
+    }
+}
+
+impl From<serde_json::Error> for ParseError {
+    fn from(e: serde_json::Error) -> Self {
+        ParseError::Syntax(e)
+    }
+}
+
+// Наибольшая вложенность массивов и объектов; скобки внутри строк не
+// считаются. Проход по байтам много дешевле самого разбора.
+pub fn depth(data: &[u8]) -> usize {
+    let (mut depth, mut max) = (0usize, 0usize);
+    let (mut in_string, mut escaped) = (false, false);
+    for &c in data {
+        if in_string {
+            match c {
+                _ if escaped => escaped = false,
+                b'\\' => escaped = true,
+                b'"' => in_string = false,
+                _ => {}
+            }
+            continue;
+        }
+        match c {
+            b'"' => in_string = true,
+            b'[' | b'{' => {
+                depth += 1;
+                max = max.max(depth);
+            }
+            b']' | b'}' => depth = depth.saturating_sub(1),
+            _ => {}
+        }
+    }
+    max
+}
+
+// Разбор документа. Встроенный в serde_json предел в 128 уровней снят:
+// его заменяет MAX_DEPTH, проверенный до разбора.
+pub fn parse(data: &[u8]) -> Result<Value, ParseError> {
+    if depth(data) > MAX_DEPTH {
+        return Err(ParseError::TooDeep);
+    }
+    let mut de = serde_json::Deserializer::from_slice(data);
+    de.disable_recursion_limit();
+    let value = Value::deserialize(&mut de)?;
+    de.end()?;
+    Ok(value)
+}
+
+// Числа хранятся записью из документа (arbitrary_precision), как их видит
+// json.loads: без точки и экспоненты — int любой длины, иначе float.
+pub fn is_float(n: &Number) -> bool {
+    n.as_str().contains(|c| c == '.' || c == 'e' || c == 'E')
+}
+
+// Значение float; вне диапазона f64 — бесконечность, как у json.loads.
+pub fn float_value(n: &Number) -> f64 {
+    n.as_str().parse().unwrap_or(f64::NAN)
+}
+
+// Запись целого без "-0": в Python это тот же 0.
+pub fn int_text(n: &Number) -> &str {
+    match n.as_str() {
+        "-0" => "0",
+        text => text,
+    }
+}
+
+// Равенство скаляров как в Python после json.loads: целые — точно, по
+// записи, float — как f64, так что 1.0 и 1.00 равны.
+pub fn scalars_equal(a: &Value, b: &Value) -> bool {
+    match (a, b) {
+        (Value::Number(x), Value::Number(y)) if is_float(x) || is_float(y) => float_value(x) == float_value(y),
+        (Value::Number(x), Value::Number(y)) => int_text(x) == int_text(y),
+        _ => a == b,
+    }
+}
+
+// Имя типа, который получит значение после json.loads: так type_changes
+// совпадают с тем, что compare() выдает для уже разобранных объектов.
+pub fn type_name(value: &Value) -> &'static str {
+    match value {
+        Value::Null => "NoneType",
+        Value::Bool(_) => "bool",
+        Value::Number(n) if is_float(n) => "float",
+        Value::Number(_) => "int",
+        Value::String(_) => "str",
+        Value::Array(_) => "list",
+        Value::Object(_) => "dict",
+    }
+}
+
+// Стек пути общий на весь обход; ключи в нем заимствуются у документа
+// (или, при потоковом разборе, принадлежат стеку), поэтому на совпадающих
+// узлах ничего не выделяется.
+pub fn compare_values<'a, K>(diff: &mut Diff, old_json: &'a Value, new_json: &'a Value, path: &mut Vec<PathComponent<K>>)
+where
+    K: AsRef<str> + From<&'a str>,
+{
+    if diff.cancelled() {
+        return;
+    }
+    if type_name(old_json) != type_name(new_json) {
+        diff.type_changes
+            .push((to_owned_path(path), (old_json.clone(), new_json.clone())));
+        return;
+    }
+
+    match (old_json, new_json) {
+        (Value::Object(m1), Value::Object(m2)) => {
+            for (key, v1) in m1 {
+                path.push(PathComponent::Key(K::from(key.as_str())));
+                match m2.get(key) {
+                    Some(v2) => compare_values(diff, v1, v2, path),
+                    None => diff.dictionary_item_removed.push((to_owned_path(path), v1.clone())),
+                }
+                path.pop();
+            }
+
+            for (key, v2) in m2 {
+                if !m1.contains_key(key) {
+                    path.push(PathComponent::Key(K::from(key.as_str())));
+                    diff.dictionary_item_added.push((to_owned_path(path), v2.clone()));
+                    path.pop();
+                }
+            }
+        }
+        (Value::Array(l1), Value::Array(l2)) => {
+            for (i, (v1, v2)) in l1.iter().zip(l2.iter()).enumerate() {
+                path.push(PathComponent::Index(i));
+                compare_values(diff, v1, v2, path);
+                path.pop();
+            }
+
+            for (i, v1) in l1.iter().enumerate().skip(l2.len()) {
+                path.push(PathComponent::Index(i));
+                diff.iterable_item_removed.push((to_owned_path(path), v1.clone()));
+                path.pop();
+            }
+
+            for (i, v2) in l2.iter().enumerate().skip(l1.len()) {
+                path.push(PathComponent::Index(i));
+                diff.iterable_item_added.push((to_owned_path(path), v2.clone()));
+                path.pop();
+            }
+        }
+        _ => {
+            if !scalars_equal(old_json, new_json) {
+                diff.values_changed
+                    .push((to_owned_path(path), (old_json.clone(), new_json.clone())));
+            }
+        }
+    }
+}
+
+pub fn generate_diff(old_json: &Value, new_json: &Value, cancel: Option<CancelToken>) -> Diff {
+    let mut diff = Diff { cancel, ..Diff::default() };
+    let mut path: Vec<PathComponent<&str>> = Vec::new();
+    compare_values(&mut diff, old_json, new_json, &mut path);
+    diff
+}
+
+// Полный цикл без участия Python: разбор обоих документов и сравнение.
+// Отмена сверяется и между разборами: сам разбор не прерывается.
+pub fn diff_slices(old: &[u8], new: &[u8], cancel: Option<CancelToken>) -> Result<Diff, ParseError> {
+    let cancelled = || cancel.as_ref().map_or(false, CancelToken::is_cancelled);
+    if cancelled() {
+        return Ok(Diff { truncated: true, ..Diff::default() });
+    }
+    let old_json = parse(old)?;
+    if cancelled() {
+        return Ok(Diff { truncated: true, ..Diff::default() });
+    }
+    let new_json = parse(new)?;
+    Ok(generate_diff(&old_json, &new_json, cancel))
+}
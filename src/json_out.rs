@@ -0,0 +1,477 @@
+use std::io::{self, Write};
+use std::sync::Arc;
+
+use pyo3::exceptions::{PyTypeError, PyValueError};
+use pyo3::prelude::*;
+use pyo3::AsPyPointer;
+use pyo3::types::{PyBool, PyBytes, PyDict, PyFrozenSet, PyList, PySet, PyString, PyTuple};
+use serde_json::Value;
+
+use crate::node::{Kind, Node};
+use crate::result::{format_change_path, Category, Change, ChangeValue, DeepDiff, Detail};
+
+// Что писать вместо значений, которых нет в JSON: объектов прочих типов,
+// bytes, NaN и бесконечностей. Call — результат default(value), который
+// сам переводится в JSON.
+pub enum Fallback {
+    Repr,
+    Str,
+    Error,
+    Call(PyObject),
+}
+
+impl Fallback {
+    pub fn extract(value: Option<&PyAny>) -> PyResult<Self> {
+        let value = match value {
+            Some(value) if !value.is_none() => value,
+            _ => return Ok(Fallback::Repr),
+        };
+        if let Ok(name) = value.downcast::<PyString>() {
+            return match name.to_str()? {
+                "repr" => Ok(Fallback::Repr),
+                "str" => Ok(Fallback::Str),
+                "error" => Ok(Fallback::Error),
+                other => Err(PyValueError::new_err(format!(
+                    "default: ожидалось 'repr', 'str', 'error' или функция, получено {:?}",
+                    other
+                ))),
+            };
+        }
+        if value.is_callable() {
+            Ok(Fallback::Call(value.into()))
+        } else {
+            Err(PyTypeError::new_err("default: ожидалась строка или функция"))
+        }
+    }
+}
+
+// Сколько раз подряд default может вернуть значение, которое снова не
+// переводится в JSON.
+const MAX_FALLBACK_NESTING: usize = 32;
+
+// Значение записи, готовое к выводу без GIL: разобранный JSON из
+// compare_json или снимок объекта Python без непрозрачных узлов.
+enum Out<'a> {
+    Json(&'a Value),
+    Node(Node),
+}
+
+// Запись с путями и именами типов, собранными заранее: при выводе
+// Python уже не нужен.
+pub struct Entry<'a> {
+    category: Category,
+    change: &'a Change,
+    path: String,
+    new_path: Option<String>,
+    types: Option<(String, String)>,
+    old: Option<Out<'a>>,
+    new: Option<Out<'a>>,
+}
+
+fn out_value<'a>(py: Python, value: &'a ChangeValue, fallback: &Fallback) -> PyResult<Out<'a>> {
+    match value {
+        ChangeValue::Json(value) => Ok(Out::Json(value)),
+        ChangeValue::Py(obj) => {
+            let mut node = Node::snapshot(obj.as_ref(py))?;
+            resolve(py, &mut node, fallback, 0, 0, &mut Vec::new())?;
+            Ok(Out::Node(node))
+        }
+    }
+}
+
+// Заменяет в снимке все, чего нет в JSON: контейнеры, которые снимок
+// оставил непрозрачными, раскрываются (см. expand), остальное — результат
+// fallback. depth — глубина узла, open — адреса раскрываемых контейнеров
+// на пути к нему.
+fn resolve(
+    py: Python,
+    node: &mut Node,
+    fallback: &Fallback,
+    nesting: usize,
+    depth: usize,
+    open: &mut Vec<usize>,
+) -> PyResult<()> {
+    match &mut node.kind {
+        Kind::None | Kind::Bool(_) | Kind::Int(_) | Kind::BigInt(_) | Kind::Str(_) => Ok(()),
+        Kind::Float(value) if value.is_finite() => Ok(()),
+        // Снимок значения только что построен, и его дети ни с кем не общие.
+        Kind::List(items) | Kind::Tuple(items) => Arc::get_mut(items)
+            .expect("дети нового снимка не общие")
+            .iter_mut()
+            .try_for_each(|item| resolve(py, item, fallback, nesting, depth + 1, open)),
+        // Ключи снимка — только str и int.
+        Kind::Dict(entries) => Arc::get_mut(entries)
+            .expect("дети нового снимка не общие")
+            .iter_mut()
+            .try_for_each(|(_, value)| resolve(py, value, fallback, nesting, depth + 1, open)),
+        Kind::Float(_) | Kind::Bytes(_) | Kind::Opaque => {
+            let obj = node.obj.as_ref(py);
+            if node.is_opaque() {
+                if let Some(kind) = expand(py, obj, fallback, nesting, depth, open)? {
+                    node.kind = kind;
+                    return Ok(());
+                }
+            }
+            node.kind = match fallback {
+                Fallback::Repr => Kind::Str(obj.repr()?.to_string_lossy().into_owned()),
+                Fallback::Str => Kind::Str(obj.str()?.to_string_lossy().into_owned()),
+                Fallback::Error => {
+                    return Err(PyTypeError::new_err(format!(
+                        "Значение типа {} не переводится в JSON",
+                        obj.get_type().name()?
+                    )))
+                }
+                Fallback::Call(_) if nesting >= MAX_FALLBACK_NESTING => {
+                    return Err(PyValueError::new_err("default раз за разом возвращает значения не для JSON"))
+                }
+                Fallback::Call(default) => {
+                    let mut value = Node::snapshot(default.as_ref(py).call1((obj,))?)?;
+                    resolve(py, &mut value, fallback, nesting + 1, depth, open)?;
+                    value.kind
+                }
+            };
+            Ok(())
+        }
+    }
+}
+
+// Глубже этого уровня контейнеры не раскрываются: write_node рекурсивен,
+// а снимок каждого раскрытого значения может добавить еще столько же.
+const MAX_EXPAND_DEPTH: usize = 256;
+
+// Контейнер, оставленный снимком непрозрачным, как в json.dumps:
+// множества и подклассы list и tuple (namedtuple тоже) — массив, подклассы
+// dict и прочие Mapping — объект. None, если вида JSON у объекта нет, у
+// Mapping есть ключи не str и не int, контейнер глубже предела или уже
+// раскрывается выше по пути (цикл).
+fn expand(
+    py: Python,
+    obj: &PyAny,
+    fallback: &Fallback,
+    nesting: usize,
+    depth: usize,
+    open: &mut Vec<usize>,
+) -> PyResult<Option<Kind>> {
+    let address = obj.as_ptr() as usize;
+    if depth >= MAX_EXPAND_DEPTH || open.contains(&address) {
+        return Ok(None);
+    }
+    let sequence = obj.downcast::<PyList>().is_ok()
+        || obj.downcast::<PyTuple>().is_ok()
+        || obj.downcast::<PySet>().is_ok()
+        || obj.downcast::<PyFrozenSet>().is_ok();
+    if !sequence
+        && obj.downcast::<PyDict>().is_err()
+        && !obj.is_instance(py.import("collections.abc")?.getattr("Mapping")?)?
+    {
+        return Ok(None);
+    }
+
+    open.push(address);
+    let kind = if sequence {
+        expand_items(py, obj, fallback, nesting, depth, open)
+    } else {
+        expand_mapping(py, obj, fallback, nesting, depth, open)
+    };
+    open.pop();
+    kind
+}
+
+fn expand_items(
+    py: Python,
+    obj: &PyAny,
+    fallback: &Fallback,
+    nesting: usize,
+    depth: usize,
+    open: &mut Vec<usize>,
+) -> PyResult<Option<Kind>> {
+    let mut items = Vec::with_capacity(obj.len()?);
+    for item in obj.iter()? {
+        let mut item = Node::snapshot(item?)?;
+        resolve(py, &mut item, fallback, nesting, depth + 1, open)?;
+        items.push(item);
+    }
+    Ok(Some(Kind::List(items.into())))
+}
+
+// Пары берутся через items(), как у json.dumps для подклассов dict.
+fn expand_mapping(
+    py: Python,
+    obj: &PyAny,
+    fallback: &Fallback,
+    nesting: usize,
+    depth: usize,
+    open: &mut Vec<usize>,
+) -> PyResult<Option<Kind>> {
+    let mut entries = Vec::with_capacity(obj.len()?);
+    for pair in obj.call_method0("items")?.iter()? {
+        let (key, value): (&PyAny, &PyAny) = pair?.extract()?;
+        let key = Node::snapshot(key)?;
+        if !matches!(key.kind, Kind::Str(_) | Kind::Int(_)) {
+            return Ok(None);
+        }
+        let mut value = Node::snapshot(value)?;
+        resolve(py, &mut value, fallback, nesting, depth + 1, open)?;
+        entries.push((key, value));
+    }
+    Ok(Some(Kind::Dict(entries.into())))
+}
+
+// Снимает значения записей в порядке to_dict(): по категориям, внутри —
+// в порядке обхода.
+pub fn collect<'a>(py: Python, diff: &'a DeepDiff, fallback: &Fallback) -> PyResult<Vec<Entry<'a>>> {
+    let mut entries = Vec::new();
+    for category in Category::ALL {
+        for change in diff.entries(category) {
+            let new_path = match &change.detail {
+                Detail::Moved(new_path) => Some(format_change_path(py, new_path)?),
+                _ => None,
+            };
+            let types = match (category, &change.old, &change.new) {
+                (Category::TypeChanges, Some(old), Some(new)) => Some((old.type_name(py)?, new.type_name(py)?)),
+                _ => None,
+            };
+            entries.push(Entry {
+                category,
+                change,
+                path: format_change_path(py, &change.path)?,
+                new_path,
+                types,
+                old: change.old.as_ref().map(|value| out_value(py, value, fallback)).transpose()?,
+                new: change.new.as_ref().map(|value| out_value(py, value, fallback)).transpose()?,
+            });
+        }
+    }
+    Ok(entries)
+}
+
+fn write_str<W: Write>(out: &mut W, s: &str) -> io::Result<()> {
+    serde_json::to_writer(out, s).map_err(io::Error::from)
+}
+
+fn write_node<W: Write>(out: &mut W, node: &Node) -> io::Result<()> {
+    match &node.kind {
+        Kind::None => out.write_all(b"null"),
+        Kind::Bool(b) => out.write_all(if *b { b"true" } else { b"false" }),
+        Kind::Int(value) => write!(out, "{}", value),
+        // В JSON у целых нет предела, десятичная запись пишется как есть.
+        Kind::BigInt(digits) => out.write_all(digits.as_bytes()),
+        Kind::Float(value) => serde_json::to_writer(out, value).map_err(io::Error::from),
+        Kind::Str(s) => write_str(out, s),
+        Kind::List(items) | Kind::Tuple(items) => {
+            out.write_all(b"[")?;
+            for (i, item) in items.iter().enumerate() {
+                if i > 0 {
+                    out.write_all(b",")?;
+                }
+                write_node(out, item)?;
+            }
+            out.write_all(b"]")
+        }
+        Kind::Dict(entries) => {
+            out.write_all(b"{")?;
+            for (i, (key, value)) in entries.iter().enumerate() {
+                if i > 0 {
+                    out.write_all(b",")?;
+                }
+                // int-ключи становятся строками, как в json.dumps.
+                match &key.kind {
+                    Kind::Str(s) => write_str(out, s)?,
+                    Kind::Int(value) => write!(out, "\"{}\"", value)?,
+                    _ => unreachable!("ключи снимка — только str и int"),
+                }
+                out.write_all(b":")?;
+                write_node(out, value)?;
+            }
+            out.write_all(b"}")
+        }
+        Kind::Bytes(_) | Kind::Opaque => unreachable!("resolve заменяет такие узлы"),
+    }
+}
+
+fn write_out<W: Write>(out: &mut W, value: &Out<'_>) -> io::Result<()> {
+    match value {
+        Out::Json(value) => serde_json::to_writer(out, value).map_err(io::Error::from),
+        Out::Node(node) => write_node(out, node),
+    }
+}
+
+fn write_field<W: Write>(out: &mut W, first: &mut bool, name: &str) -> io::Result<()> {
+    if !std::mem::take(first) {
+        out.write_all(b",")?;
+    }
+    write_str(out, name)?;
+    out.write_all(b":")
+}
+
+// Поля записи, как в словаре из to_dict(). Запись с одним значением
+// (добавленный или удаленный элемент) в to_dict() — само значение, а в
+// строке JSON Lines — поле value.
+fn write_fields<W: Write>(out: &mut W, entry: &Entry<'_>, first: &mut bool) -> io::Result<()> {
+    match (&entry.change.detail, &entry.old) {
+        (Detail::Moved(_), Some(value)) => {
+            write_field(out, first, "new_path")?;
+            write_str(out, entry.new_path.as_deref().unwrap_or_default())?;
+            write_field(out, first, "value")?;
+            return write_out(out, value);
+        }
+        (Detail::Repetition { old_indexes, new_indexes }, Some(value)) => {
+            write_field(out, first, "old_repeat")?;
+            write!(out, "{}", old_indexes.len())?;
+            write_field(out, first, "new_repeat")?;
+            write!(out, "{}", new_indexes.len())?;
+            write_field(out, first, "old_indexes")?;
+            serde_json::to_writer(&mut *out, old_indexes).map_err(io::Error::from)?;
+            write_field(out, first, "new_indexes")?;
+            serde_json::to_writer(&mut *out, new_indexes).map_err(io::Error::from)?;
+            write_field(out, first, "value")?;
+            return write_out(out, value);
+        }
+        _ => {}
+    }
+    match (&entry.old, &entry.new) {
+        (Some(old), Some(new)) => {
+            if let Some((old_type, new_type)) = &entry.types {
+                write_field(out, first, "old_type")?;
+                write_str(out, old_type)?;
+                write_field(out, first, "new_type")?;
+                write_str(out, new_type)?;
+            }
+            write_field(out, first, "old_value")?;
+            write_out(out, old)?;
+            write_field(out, first, "new_value")?;
+            write_out(out, new)
+        }
+        (Some(value), None) | (None, Some(value)) => {
+            write_field(out, first, "value")?;
+            write_out(out, value)
+        }
+        (None, None) => Ok(()),
+    }
+}
+
+fn is_single_value(entry: &Entry<'_>) -> bool {
+    matches!(entry.change.detail, Detail::None) && entry.old.is_some() != entry.new.is_some()
+}
+
+// Документ того же вида, что json.dumps(diff.to_dict()), либо (lines)
+// JSON Lines: по строке {"category", "path", поля записи} на запись.
+pub fn write<W: Write>(out: &mut W, entries: &[Entry<'_>], lines: bool) -> io::Result<()> {
+    if lines {
+        for entry in entries {
+            out.write_all(b"{\"category\":")?;
+            write_str(out, entry.category.name())?;
+            out.write_all(b",\"path\":")?;
+            write_str(out, &entry.path)?;
+            write_fields(out, entry, &mut false)?;
+            out.write_all(b"}\n")?;
+        }
+        return Ok(());
+    }
+
+    out.write_all(b"{")?;
+    let mut current: Option<Category> = None;
+    for entry in entries {
+        if current != Some(entry.category) {
+            if current.is_some() {
+                out.write_all(b"},")?;
+            }
+            write_str(out, entry.category.name())?;
+            out.write_all(b":{")?;
+            current = Some(entry.category);
+        } else {
+            out.write_all(b",")?;
+        }
+        write_str(out, &entry.path)?;
+        out.write_all(b":")?;
+        if is_single_value(entry) {
+            let value = entry.old.as_ref().or(entry.new.as_ref()).expect("одно значение есть");
+            write_out(out, value)?;
+        } else if entry.old.is_none() && entry.new.is_none() {
+            out.write_all(b"null")?;
+        } else {
+            out.write_all(b"{")?;
+            write_fields(out, entry, &mut true)?;
+            out.write_all(b"}")?;
+        }
+    }
+    if current.is_some() {
+        out.write_all(b"}")?;
+    }
+    out.write_all(b"}")
+}
+
+// Номер дескриптора, если file — int. bool — тоже int, но True и False
+// вместо 1 и 0 почти наверняка ошибка вызывающего.
+fn fd_number(file: &PyAny) -> PyResult<Option<i32>> {
+    if file.downcast::<PyBool>().is_ok() {
+        return Err(PyTypeError::new_err("file: ожидался дескриптор или файл, получен bool"));
+    }
+    Ok(file.extract::<i32>().ok())
+}
+
+// Дескриптор, в который можно писать напрямую без GIL: int или файл с
+// fileno(). Буфер файла Python сбрасывается заранее, чтобы его данные не
+// оказались после наших.
+#[cfg(unix)]
+pub fn descriptor(file: &PyAny) -> PyResult<Option<i32>> {
+    if let Some(fd) = fd_number(file)? {
+        return Ok(Some(fd));
+    }
+    if !file.hasattr("fileno")? {
+        return Ok(None);
+    }
+    // BytesIO и похожие объекты на fileno() бросают UnsupportedOperation.
+    let fd = match file.call_method0("fileno").and_then(|fd| fd.extract::<i32>()) {
+        Ok(fd) => fd,
+        Err(_) => return Ok(None),
+    };
+    if file.hasattr("flush")? {
+        file.call_method0("flush")?;
+    }
+    Ok(Some(fd))
+}
+
+#[cfg(not(unix))]
+pub fn descriptor(_file: &PyAny) -> PyResult<Option<i32>> {
+    Ok(None)
+}
+
+// Пишет записи в дескриптор через буфер, не закрывая его.
+#[cfg(unix)]
+pub fn write_fd(fd: i32, entries: &[Entry<'_>], lines: bool) -> io::Result<()> {
+    use std::os::unix::io::FromRawFd;
+
+    let file = std::mem::ManuallyDrop::new(unsafe { std::fs::File::from_raw_fd(fd) });
+    let mut writer = io::BufWriter::new(&*file);
+    write(&mut writer, entries, lines)?;
+    writer.flush()
+}
+
+#[cfg(not(unix))]
+pub fn write_fd(_fd: i32, _entries: &[Entry<'_>], _lines: bool) -> io::Result<()> {
+    unreachable!("descriptor() вне Unix дескрипторов не отдает")
+}
+
+// Готовые байты в объект Python: в дескриптор через os.write, в
+// двоичный файл как bytes, в текстовый — строкой.
+pub fn write_file(file: &PyAny, data: &[u8]) -> PyResult<()> {
+    let py = file.py();
+    if let Some(fd) = fd_number(file)? {
+        let os = py.import("os")?;
+        let mut rest = data;
+        while !rest.is_empty() {
+            let written: usize = os.call_method1("write", (fd, PyBytes::new(py, rest)))?.extract()?;
+            rest = &rest[written..];
+        }
+        return Ok(());
+    }
+    match file.call_method1("write", (PyBytes::new(py, data),)) {
+        Ok(_) => Ok(()),
+        Err(e) if e.is_instance_of::<PyTypeError>(py) => {
+            file.call_method1("write", (String::from_utf8_lossy(data).into_owned(),))?;
+            Ok(())
+        }
+        Err(e) => Err(e),
+    }
+}
@@ -1,296 +1,355 @@
+use pyo3::exceptions::{PyRuntimeError, PyTimeoutError, PyTypeError, PyValueError};
 use pyo3::prelude::*;
-use pyo3::types::{PyDict, PyList, PyTuple, PySet};
-use std::collections::HashMap;
-use serde_json::Value;
+use pyo3::types::{PyByteArray, PyBytes, PyDict, PyString};
+use std::borrow::Cow;
+use std::path::PathBuf;
+use std::time::Instant;
 
-#[pyclass]
-struct DeepDiff {
-    #[pyo3(get)]
-    values_changed: HashMap<String, PyObject>,
-    #[pyo3(get)]
-    type_changes: HashMap<String, PyObject>,
-    #[pyo3(get)]
-    dictionary_item_added: HashMap<String, PyObject>,
-    #[pyo3(get)]
-    dictionary_item_removed: HashMap<String, PyObject>,
-    #[pyo3(get)]
-    iterable_item_added: HashMap<String, PyObject>,
-    #[pyo3(get)]
-    iterable_item_removed: HashMap<String, PyObject>,
-}
+mod align;
+mod buffer;
+mod convert;
+mod delta;
+mod filter;
+mod json_diff;
+mod json_out;
+mod node;
+mod node_diff;
+mod options;
+mod parallel;
+mod path;
+mod result;
+mod session;
+mod snapshot_file;
+mod stats;
+mod stream;
+mod walker;
 
-#[pymethods]
-impl DeepDiff {
-    #[new]
-    fn new() -> Self {
-        DeepDiff {
-            values_changed: HashMap::new(),
-            type_changes: HashMap::new(),
-            dictionary_item_added: HashMap::new(),
-            dictionary_item_removed: HashMap::new(),
-            iterable_item_added: HashMap::new(),
-            iterable_item_removed: HashMap::new(),
-        }
-    }
+use convert::json_to_py;
+use node::{ListHash, Node};
+use options::{Budget, CancelToken, DiffOptions};
+use result::{ChangeIter, DeepDiff};
+use walker::Walker;
 
-    fn to_dict(&self, py: Python) -> PyResult<PyObject> {
-        let result = PyDict::new(py);
-        
-        if !self.values_changed.is_empty() {
-            let values_dict = PyDict::new(py);
-            for (k, v) in &self.values_changed {
-                values_dict.set_item(k, v.clone_ref(py))?;
-            }
-            result.set_item("values_changed", values_dict)?;
-        }
-        
-        if !self.type_changes.is_empty() {
-            let types_dict = PyDict::new(py);
-            for (k, v) in &self.type_changes {
-                types_dict.set_item(k, v.clone_ref(py))?;
-            }
-            result.set_item("type_changes", types_dict)?;
-        }
-        
-        if !self.dictionary_item_added.is_empty() {
-            let added_dict = PyDict::new(py);
-            for (k, v) in &self.dictionary_item_added {
-                added_dict.set_item(k, v.clone_ref(py))?;
-            }
-            result.set_item("dictionary_item_added", added_dict)?;
-        }
-        
-        if !self.dictionary_item_removed.is_empty() {
-            let removed_dict = PyDict::new(py);
-            for (k, v) in &self.dictionary_item_removed {
-                removed_dict.set_item(k, v.clone_ref(py))?;
-            }
-            result.set_item("dictionary_item_removed", removed_dict)?;
-        }
-        
-        if !self.iterable_item_added.is_empty() {
-            let added_dict = PyDict::new(py);
-            for (k, v) in &self.iterable_item_added {
-                added_dict.set_item(k, v.clone_ref(py))?;
-            }
-            result.set_item("iterable_item_added", added_dict)?;
+// Параметры сравнения (см. DiffOptions) передаются именованными
+// аргументами и включают обход снимков: оба объекта копируются в Rust и
+// сравниваются без GIL. use_hashes пропускает равные по хешу поддеревья,
+// parallelism=N разносит детей корня по N потокам (0 — по числу ядер),
+// align_lists выравнивает списки по хешам элементов, ignore_order
+// сравнивает их как мультимножества, group_by сопоставляет записи по полю.
+// max_diffs, max_depth и timeout (секунды) останавливают обход раньше,
+// такой результат помечен truncated; так же его останавливает
+// cancel=CancelToken(), когда token.cancel() вызван из другого потока.
+// atol, rtol и significant_digits задают допуски для float и числовых
+// буферов (array, массивы NumPy).
+// Экземпляры классов на Python — dataclass, namedtuple, классы с __slots__
+// и __dict__ — сравниваются по атрибутам: пути вида root.field, новые и
+// пропавшие атрибуты — attribute_added и attribute_removed.
+// stats=True собирает счетчики обхода и время по фазам в DeepDiff.stats;
+// on_slow_subtree(path, seconds) вызывается для поддеревьев, сравнение
+// которых заняло не меньше slow_threshold секунд (по умолчанию 0.1).
+#[pyfunction]
+#[pyo3(signature = (t1, t2, **options))]
+fn compare(py: Python, t1: &PyAny, t2: &PyAny, options: Option<&PyDict>) -> PyResult<DeepDiff> {
+    let options = DiffOptions::from_kwargs(options)?;
+    Ok(diff_objects(py, t1, t2, &options)?.finish())
+}
+
+fn diff_objects<'p>(py: Python<'p>, t1: &'p PyAny, t2: &'p PyAny, options: &DiffOptions) -> PyResult<Walker<'p>> {
+    let mut walker = Walker::new(py, options);
+    let started = Instant::now();
+    if options.native() {
+        let mut old = Node::snapshot(t1)?;
+        let mut new = Node::snapshot(t2)?;
+        let converted = Instant::now();
+        let (old, new) = (&mut old, &mut new);
+        let changes = py.allow_threads(move || parallel::diff_snapshots(old, new, options));
+        let diffed = Instant::now();
+        let deferred = walker.stats.as_ref().map(|stats| stats.traversal).unwrap_or_default();
+        walker.merge_node_changes(changes)?;
+        // Досравнение отложенных пар при сборке уже учтено как обход.
+        if let Some(stats) = &mut walker.stats {
+            let deferred = stats.traversal - deferred;
+            stats.conversion += converted - started;
+            stats.traversal += diffed - converted;
+            stats.materialization += diffed.elapsed().saturating_sub(deferred);
         }
-        
-        if !self.iterable_item_removed.is_empty() {
-            let removed_dict = PyDict::new(py);
-            for (k, v) in &self.iterable_item_removed {
-                removed_dict.set_item(k, v.clone_ref(py))?;
-            }
-            result.set_item("iterable_item_removed", removed_dict)?;
+    } else {
+        walker.compare_objects(t1, t2)?;
+        if let Some(stats) = &mut walker.stats {
+            stats.traversal += started.elapsed();
         }
-        
-        Ok(result.into())
     }
+    Ok(walker)
 }
 
+// Равны ли объекты с теми же параметрами, что у compare(). Обход
+// прекращается на первом различии, записи о нем не создаются.
 #[pyfunction]
-fn compare(py: Python, t1: PyObject, t2: PyObject) -> PyResult<PyObject> {
-    let mut diff = DeepDiff::new();
-    compare_objects(py, t1, t2, "root".to_string(), &mut diff)?;
-    Ok(diff.to_dict(py)?)
-}
-
-fn compare_objects(py: Python, t1: PyObject, t2: PyObject, path: String, diff: &mut DeepDiff) -> PyResult<()> {
-    let t1_type = t1.as_ref(py).get_type();
-    let t2_type = t2.as_ref(py).get_type();
-    
-    if !t1_type.is(t2_type) {
-        let change = PyDict::new(py);
-        change.set_item("old_type", t1_type.name()?)?;
-        change.set_item("new_type", t2_type.name()?)?;
-        change.set_item("old_value", t1.clone_ref(py))?;
-        change.set_item("new_value", t2.clone_ref(py))?;
-        diff.type_changes.insert(path, change.into());
-        return Ok(());
+#[pyo3(signature = (t1, t2, **options))]
+fn is_equal(py: Python, t1: &PyAny, t2: &PyAny, options: Option<&PyDict>) -> PyResult<bool> {
+    let mut options = DiffOptions::from_kwargs(options)?;
+    options.max_diffs = Some(0);
+    let walker = diff_objects(py, t1, t2, &options)?;
+    if walker.budget.cancelled {
+        return Err(PyRuntimeError::new_err("Сравнение отменено"));
     }
-    
-    if let (Ok(d1), Ok(d2)) = (t1.extract::<&PyDict>(py), t2.extract::<&PyDict>(py)) {
-        compare_dicts(py, d1, d2, path, diff)?;
+    if walker.budget.expired {
+        return Err(PyTimeoutError::new_err("Сравнение не уложилось в timeout"));
     }
-    else if let (Ok(l1), Ok(l2)) = (t1.extract::<&PyList>(py), t2.extract::<&PyList>(py)) {
-        compare_iterables(py, l1.iter().collect(), l2.iter().collect(), path, diff)?;
-    }
-    else if let (Ok(t1_tuple), Ok(t2_tuple)) = (t1.extract::<&PyTuple>(py), t2.extract::<&PyTuple>(py)) {
-        compare_iterables(py, t1_tuple.iter().collect(), t2_tuple.iter().collect(), path, diff)?;
-    }
-    else if let (Ok(s1), Ok(s2)) = (t1.extract::<&PySet>(py), t2.extract::<&PySet>(py)) {
-        let s1_len = s1.len();
-        let s2_len = s2.len();
-        
-        if s1_len != s2_len {
-            let change = PyDict::new(py);
-            change.set_item("old_value", t1.clone_ref(py))?;
-            change.set_item("new_value", t2.clone_ref(py))?;
-            diff.values_changed.insert(path, change.into());
-        } else {
-            let py_s1: PyObject = s1.into();
-            let py_s2: PyObject = s2.into();
-            let is_equal = py.import("operator")?.getattr("eq")?.call1((py_s1, py_s2))?;
-            
-            if !is_equal.extract::<bool>()? {
-                let change = PyDict::new(py);
-                change.set_item("old_value", t1.clone_ref(py))?;
-                change.set_item("new_value", t2.clone_ref(py))?;
-                diff.values_changed.insert(path, change.into());
-            }
+    Ok(!walker.budget.truncated)
+}
+
+// Сколько пар на поток снимается за одно освобождение GIL в пакетных
+// сравнениях: ограничивает память под снимки.
+const BATCH_PAIRS_PER_THREAD: usize = 16;
+
+// Пакетное сравнение. Элементы items — кандидаты против уже снятого
+// baseline либо пары (t1, t2), если baseline нет. Они снимаются порциями,
+// каждая порция хешируется и сравнивается без GIL, по паре на поток.
+// Срок и отмена общие на весь пакет и сверяются перед каждой парой: после
+// них пары не снимаются и не сравниваются, а их результаты пусты и
+// помечены truncated, как у compare().
+fn compare_batch(py: Python, baseline: Option<&Node>, items: &PyAny, options: &DiffOptions) -> PyResult<Vec<DeepDiff>> {
+    let threads = options.threads();
+    let mut budget = Budget::new(options);
+    let mut results = Vec::new();
+    let mut items = items.iter()?;
+
+    loop {
+        let mut chunk: Vec<(Option<Node>, Node)> = Vec::new();
+        while chunk.len() < threads * BATCH_PAIRS_PER_THREAD && !budget.poll() {
+            let item = match items.next() {
+                Some(item) => item?,
+                None => break,
+            };
+            chunk.push(match baseline {
+                Some(_) => (None, Node::snapshot(item)?),
+                None => {
+                    let (t1, t2): (&PyAny, &PyAny) = item.extract()?;
+                    (Some(Node::snapshot(t1)?), Node::snapshot(t2)?)
+                }
+            });
         }
-    }
-    else {
-        let is_equal = py.import("operator")?.getattr("eq")?.call1((t1.clone_ref(py), t2.clone_ref(py)))?;
-        
-        if !is_equal.extract::<bool>()? {
-            let change = PyDict::new(py);
-            change.set_item("old_value", t1.clone_ref(py))?;
-            change.set_item("new_value", t2.clone_ref(py))?;
-            diff.values_changed.insert(path, change.into());
+        if chunk.is_empty() {
+            break;
         }
-    }
-    
-    Ok(())
-}
 
-fn compare_dicts(py: Python, d1: &PyDict, d2: &PyDict, path: String, diff: &mut DeepDiff) -> PyResult<()> {
-    for (k, v1) in d1.iter() {
-        let key_str = k.to_string();
-        let new_path = format!("{}.{}", path, key_str);
-        
-        if let Some(v2) = d2.get_item(k) {
-            compare_objects(py, v1.into(), v2.into(), new_path, diff)?;
-        } else {
-            diff.dictionary_item_removed.insert(new_path, v1.into());
+        let chunk = &mut chunk;
+        let changes = py.allow_threads(move || {
+            if options.hashing() {
+                let roots = chunk.iter_mut().flat_map(|(old, new)| old.iter_mut().chain([new])).collect();
+                parallel::hash_snapshots(roots, threads, options.list_hash());
+            }
+            let chunk: &Vec<(Option<Node>, Node)> = chunk;
+            parallel::run_tasks(chunk.iter().collect(), threads, |(old, new)| {
+                let old = old.as_ref().or(baseline).expect("нет исходного объекта");
+                parallel::diff_nodes(old, new, 1, options)
+            })
+        });
+
+        for changes in changes {
+            let mut walker = Walker::new(py, options);
+            walker.merge_node_changes(changes)?;
+            results.push(walker.finish());
         }
     }
-    
-    for (k, v2) in d2.iter() {
-        if d1.get_item(k).is_none() {
-            let key_str = k.to_string();
-            let new_path = format!("{}.{}", path, key_str);
-            diff.dictionary_item_added.insert(new_path, v2.into());
+
+    if budget.poll() {
+        for item in items {
+            item?;
+            let mut walker = Walker::new(py, options);
+            walker.budget.stop();
+            results.push(walker.finish());
         }
     }
-    
-    Ok(())
+    Ok(results)
 }
 
-fn compare_iterables(py: Python, l1: Vec<&PyAny>, l2: Vec<&PyAny>, path: String, diff: &mut DeepDiff) -> PyResult<()> {
-    for i in 0..std::cmp::min(l1.len(), l2.len()) {
-        let new_path = format!("{}[{}]", path, i);
-        compare_objects(py, l1[i].into(), l2[i].into(), new_path, diff)?;
-    }
-    
-    for i in l2.len()..l1.len() {
-        let new_path = format!("{}[{}]", path, i);
-        diff.iterable_item_removed.insert(new_path, l1[i].into());
-    }
-    
-    for i in l1.len()..l2.len() {
-        let new_path = format!("{}[{}]", path, i);
-        diff.iterable_item_added.insert(new_path, l2[i].into());
+// Пакетные сравнения по умолчанию занимают все ядра.
+fn batch_options(options: Option<&PyDict>) -> PyResult<DiffOptions> {
+    let mut options = DiffOptions::from_kwargs(options)?;
+    options.parallelism.get_or_insert(0);
+    Ok(options)
+}
+
+// Сравнивает один исходный объект со многими кандидатами. Снимок и хеши
+// baseline строятся один раз, кандидаты сравниваются параллельно.
+#[pyfunction]
+#[pyo3(signature = (baseline, candidates, **options))]
+fn compare_many(py: Python, baseline: &PyAny, candidates: &PyAny, options: Option<&PyDict>) -> PyResult<Vec<DeepDiff>> {
+    let options = batch_options(options)?;
+    let mut base = Node::snapshot(baseline)?;
+    if options.hashing() {
+        let (base, threads, lists) = (&mut base, options.threads(), options.list_hash());
+        py.allow_threads(move || parallel::hash_snapshots(vec![base], threads, lists));
     }
-    
-    Ok(())
+    compare_batch(py, Some(&base), candidates, &options)
 }
 
-#[derive(Debug, Clone, PartialEq)]
-pub enum PathComponent {
-    Key(String),
-    Index(usize),
+// Сравнивает пары (t1, t2) из итерируемого объекта, параллельно по парам.
+#[pyfunction]
+#[pyo3(signature = (pairs, **options))]
+fn compare_pairs(py: Python, pairs: &PyAny, options: Option<&PyDict>) -> PyResult<Vec<DeepDiff>> {
+    compare_batch(py, None, pairs, &batch_options(options)?)
 }
 
-fn format_path(path: &[PathComponent]) -> String {
-    let mut result = String::from("root");
-    
-    for component in path {
-        match component {
-            PathComponent::Key(key) => {
-                result.push_str(&format!("['{}']", key));
-            }
-            PathComponent::Index(idx) => {
-                result.push_str(&format!("[{}]", idx));
-            }
-        }
+// Отпечаток содержимого: тот же хеш, что и при use_hashes=True. Равные
+// по compare() объекты имеют равные отпечатки.
+#[pyfunction]
+fn fingerprint(py: Python, obj: &PyAny) -> PyResult<u64> {
+    let mut node = Node::snapshot(obj)?;
+    py.allow_threads(|| node.compute_hash(ListHash::Ordered)).ok_or_else(|| {
+        PyTypeError::new_err("Нельзя вычислить отпечаток: объект содержит NaN или значения неподдерживаемых типов")
+    })
+}
+
+// Байты документа без копирования для bytes и str; bytearray изменяем,
+// поэтому его содержимое копируется до освобождения GIL.
+fn json_input(obj: &PyAny) -> PyResult<Cow<'_, [u8]>> {
+    if let Ok(b) = obj.downcast::<PyBytes>() {
+        Ok(Cow::Borrowed(b.as_bytes()))
+    } else if let Ok(s) = obj.downcast::<PyString>() {
+        Ok(Cow::Borrowed(s.to_str()?.as_bytes()))
+    } else if let Ok(ba) = obj.downcast::<PyByteArray>() {
+        Ok(Cow::Owned(ba.to_vec()))
+    } else {
+        Err(PyTypeError::new_err(format!(
+            "Ожидались bytes, bytearray или str, получен {}",
+            obj.get_type().name()?
+        )))
     }
-    
-    result
 }
 
-#[derive(Debug, Clone)]
-pub struct Diff {
-    pub added: HashMap<String, Value>,
-    pub removed: HashMap<String, Value>,
-    pub changed: HashMap<String, Value>,
-    pub iterable_item_added: HashMap<String, Value>,
-    pub iterable_item_removed: HashMap<String, Value>,
+// cancel — CancelToken: после отмены сравнение прекращается, и результат
+// помечается truncated, как у compare().
+#[pyfunction]
+#[pyo3(signature = (t1, t2, cancel=None))]
+fn compare_json(py: Python, t1: &PyAny, t2: &PyAny, cancel: Option<PyRef<'_, CancelToken>>) -> PyResult<DeepDiff> {
+    let old = json_input(t1)?;
+    let new = json_input(t2)?;
+    let cancel = cancel.map(|token| token.clone());
+    let diff = py
+        .allow_threads(|| json_diff::diff_slices(&old, &new, cancel))
+        .map_err(|e| PyValueError::new_err(format!("Некорректный JSON: {}", e)))?;
+    Ok(diff.into())
 }
 
-fn compare_values(_diff: &mut Diff, _old_json: &Value, _new_json: &Value, _path: Vec<PathComponent>) {
-    // Реализация сравнения значений JSON
-    // Это заглушка, которую нужно заменить реальной реализацией
+#[pyfunction]
+fn compare_json_files(py: Python, path1: PathBuf, path2: PathBuf) -> PyResult<DeepDiff> {
+    let diff = py.allow_threads(|| -> PyResult<json_diff::Diff> {
+        let old = std::fs::read(&path1)?;
+        let new = std::fs::read(&path2)?;
+        json_diff::diff_slices(&old, &new, None)
+            .map_err(|e| PyValueError::new_err(format!("Некорректный JSON: {}", e)))
+    })?;
+    Ok(diff.into())
 }
 
-pub fn generate_diff(old_json: &Value, new_json: &Value) -> Diff {
-    let mut diff = Diff {
-        added: HashMap::new(),
-        removed: HashMap::new(),
-        changed: HashMap::new(),
-        iterable_item_added: HashMap::new(),
-        iterable_item_removed: HashMap::new(),
-    };
+// Сохраняет снимок объекта в файл для compare_to_snapshot().
+#[pyfunction]
+fn save_snapshot(py: Python, path: PathBuf, obj: &PyAny) -> PyResult<()> {
+    snapshot_file::save_object(py, &path, obj)
+}
 
-    compare_values(&mut diff, old_json, new_json, vec![]);
-    
-    let reformat_hashmap = |map: HashMap<String, Value>| -> HashMap<String, Value> {
-        let mut new_map = HashMap::new();
-        for (path_str, value) in map {
-            let path_components: Vec<PathComponent> = parse_path(&path_str);
-            let new_path_str = format_path(&path_components);
-            new_map.insert(new_path_str, value);
-        }
-        new_map
-    };
-    
-    Diff {
-        added: reformat_hashmap(diff.added),
-        removed: reformat_hashmap(diff.removed),
-        changed: reformat_hashmap(diff.changed),
-        iterable_item_added: reformat_hashmap(diff.iterable_item_added),
-        iterable_item_removed: reformat_hashmap(diff.iterable_item_removed),
-    }
+// Сохраняет снимок документа JSON; сравнение с ним — как с json.loads(data).
+#[pyfunction]
+fn save_json_snapshot(py: Python, path: PathBuf, data: &PyAny) -> PyResult<()> {
+    let data = json_input(data)?;
+    snapshot_file::save_json(py, &path, &data)
+}
+
+#[pyfunction]
+#[pyo3(signature = (snapshot_path, obj, **options))]
+fn compare_to_snapshot(py: Python, snapshot_path: PathBuf, obj: &PyAny, options: Option<&PyDict>) -> PyResult<DeepDiff> {
+    let options = DiffOptions::from_kwargs(options)?;
+    snapshot_file::compare(py, &snapshot_path, obj, &options)
 }
 
-fn parse_path(_path_str: &str) -> Vec<PathComponent> {
-    // Реализация парсинга строки пути в компоненты
-    // Это зависит от текущего формата путей в вашей библиотеке
-    // ...
-    vec![] // Заглушка
+// Сколько записей потоковый обход собирает за одно освобождение GIL.
+const STREAM_BATCH: usize = 256;
+
+#[pyclass]
+struct JsonDiffStream {
+    inner: stream::StreamDiff<stream::Input>,
+    ready: std::collections::VecDeque<stream::Entry>,
 }
 
-#[allow(dead_code)]
-fn path_to_string(path: &[PathComponent]) -> String {
-    let mut result = String::from("root");
-    
-    for component in path {
-        match component {
-            PathComponent::Key(key) => {
-                result.push_str(&format!("['{}']", key));
-            }
-            PathComponent::Index(idx) => {
-                result.push_str(&format!("[{}]", idx));
+fn stream_error(e: stream::StreamError) -> PyErr {
+    match e {
+        stream::StreamError::Io(e) => e.into(),
+        e => PyValueError::new_err(format!("Некорректный JSON: {}", e)),
+    }
+}
+
+fn stream_entry_to_py(py: Python, entry: stream::Entry) -> PyResult<PyObject> {
+    let payload: PyObject = match (&entry.old, &entry.new) {
+        (Some(old), Some(new)) => {
+            let change = PyDict::new(py);
+            if entry.category == "type_changes" {
+                change.set_item("old_type", json_diff::type_name(old))?;
+                change.set_item("new_type", json_diff::type_name(new))?;
             }
+            change.set_item("old_value", json_to_py(py, old))?;
+            change.set_item("new_value", json_to_py(py, new))?;
+            change.into()
+        }
+        (Some(value), None) | (None, Some(value)) => json_to_py(py, value),
+        (None, None) => py.None(),
+    };
+    Ok((entry.category, entry.path, payload).into_py(py))
+}
+
+#[pymethods]
+impl JsonDiffStream {
+    fn __iter__(slf: PyRef<'_, Self>) -> PyRef<'_, Self> {
+        slf
+    }
+
+    fn __next__(mut slf: PyRefMut<'_, Self>, py: Python) -> PyResult<Option<PyObject>> {
+        if slf.ready.is_empty() {
+            let inner = &mut slf.inner;
+            let batch = py
+                .allow_threads(|| inner.next_batch(STREAM_BATCH))
+                .map_err(stream_error)?;
+            slf.ready.extend(batch);
+        }
+        match slf.ready.pop_front() {
+            Some(entry) => Ok(Some(stream_entry_to_py(py, entry)?)),
+            None => Ok(None),
         }
     }
-    
-    result
 }
 
+#[pyfunction]
+fn compare_json_stream(path1: PathBuf, path2: PathBuf) -> PyResult<JsonDiffStream> {
+    Ok(JsonDiffStream {
+        inner: stream::StreamDiff::open(&path1, &path2)?,
+        ready: std::collections::VecDeque::new(),
+    })
+}
+
+// Модуль ставится внутрь пакета как rustdeepdiff._rustdeepdiff, имя
+// должно совпадать с module-name в pyproject.toml.
 #[pymodule]
+#[pyo3(name = "_rustdeepdiff")]
 fn rustdeepdiff(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_class::<DeepDiff>()?;
+    m.add_class::<ChangeIter>()?;
+    m.add_class::<delta::Delta>()?;
+    m.add_class::<filter::PathFilter>()?;
+    m.add_class::<JsonDiffStream>()?;
+    m.add_class::<session::DiffSession>()?;
+    m.add_class::<options::CancelToken>()?;
     m.add_function(wrap_pyfunction!(compare, m)?)?;
+    m.add_function(wrap_pyfunction!(compare_many, m)?)?;
+    m.add_function(wrap_pyfunction!(compare_pairs, m)?)?;
+    m.add_function(wrap_pyfunction!(fingerprint, m)?)?;
+    m.add_function(wrap_pyfunction!(is_equal, m)?)?;
+    m.add_function(wrap_pyfunction!(compare_json, m)?)?;
+    m.add_function(wrap_pyfunction!(compare_json_files, m)?)?;
+    m.add_function(wrap_pyfunction!(compare_json_stream, m)?)?;
+    m.add_function(wrap_pyfunction!(save_snapshot, m)?)?;
+    m.add_function(wrap_pyfunction!(save_json_snapshot, m)?)?;
+    m.add_function(wrap_pyfunction!(compare_to_snapshot, m)?)?;
     Ok(())
 } 
\ No newline at end of file
@@ -0,0 +1,421 @@
+use std::collections::HashMap;
+use std::sync::Arc;
+
+use pyo3::prelude::*;
+use pyo3::AsPyPointer;
+use pyo3::types::{PyBool, PyBytes, PyDict, PyFloat, PyList, PyLong, PyString, PyTuple};
+
+// Содержимое узла снимка. Встроенные типы копируются в Rust, остальное
+// остается непрозрачным и сравнивается только через Python. Дети
+// контейнеров лежат в Arc: снимки версий одного документа делят общие
+// поддеревья, а не копируют их.
+#[derive(Clone)]
+pub enum Kind {
+    None,
+    Bool(bool),
+    Int(i64),
+    // int за пределами i64 хранится десятичной записью.
+    BigInt(String),
+    Float(f64),
+    Str(String),
+    Bytes(Vec<u8>),
+    List(Arc<[Node]>),
+    Tuple(Arc<[Node]>),
+    // Ключи — только str и int, иначе словарь целиком непрозрачен.
+    Dict(Arc<[(Node, Node)]>),
+    Opaque,
+}
+
+// Как хешируются списки и кортежи: с учетом порядка, как мультимножество
+// или как множество (повторы не различаются) — для ignore_order.
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum ListHash {
+    Ordered,
+    Multiset,
+    Set,
+}
+
+// Метки типов узлов: узлы с разными метками относятся к разным типам
+// Python. Метка входит в хеш узла.
+pub const TAG_NONE: u8 = 0;
+pub const TAG_BOOL: u8 = 1;
+pub const TAG_INT: u8 = 2;
+pub const TAG_FLOAT: u8 = 3;
+pub const TAG_STR: u8 = 4;
+pub const TAG_BYTES: u8 = 5;
+pub const TAG_LIST: u8 = 6;
+pub const TAG_TUPLE: u8 = 7;
+pub const TAG_DICT: u8 = 8;
+pub const TAG_OPAQUE: u8 = 255;
+
+// Узел снимка объекта Python. Снимок строится с GIL, а хеширование и
+// обход работают без него: исходный объект нужен только для выдачи.
+pub struct Node {
+    pub kind: Kind,
+    pub obj: PyObject,
+    // Хеш поддерева после compute_hash(); None, если поддерево содержит
+    // непрозрачные объекты или NaN, и равенство хешей ничего не значит.
+    pub hash: Option<u64>,
+}
+
+// Глубже этого уровня снимок не строится: контейнеры остаются
+// непрозрачными, и их сравнивает обход Python, которому не нужен стек
+// потока. Рекурсивные снимок, хеширование и обход снимков так не
+// переполняют стек, в том числе у рабочих потоков.
+const MAX_SNAPSHOT_DEPTH: usize = 256;
+
+impl Node {
+    // Учитываются только точные типы: у подклассов может быть свой __eq__.
+    pub fn snapshot(obj: &PyAny) -> PyResult<Node> {
+        Self::snapshot_at(obj, &mut Vec::new())
+    }
+
+    // ancestors — адреса контейнеров на пути к obj. Контейнер, который
+    // содержит сам себя, тоже остается непрозрачным: циклы разбирает обход
+    // Python.
+    fn snapshot_at(obj: &PyAny, ancestors: &mut Vec<usize>) -> PyResult<Node> {
+        let py = obj.py();
+        let ty = obj.get_type();
+
+        let kind = if obj.is_none() {
+            Kind::None
+        } else if ty.is(py.get_type::<PyBool>()) {
+            Kind::Bool(obj.is_true()?)
+        } else if ty.is(py.get_type::<PyLong>()) {
+            match obj.extract::<i64>() {
+                Ok(value) => Kind::Int(value),
+                Err(_) => Kind::BigInt(obj.str()?.to_str()?.to_string()),
+            }
+        } else if ty.is(py.get_type::<PyFloat>()) {
+            Kind::Float(obj.downcast::<PyFloat>()?.value())
+        } else if ty.is(py.get_type::<PyString>()) {
+            // Строки с суррогатами не переводятся в UTF-8.
+            match obj.downcast::<PyString>()?.to_str() {
+                Ok(s) => Kind::Str(s.to_string()),
+                Err(_) => Kind::Opaque,
+            }
+        } else if ty.is(py.get_type::<PyBytes>()) {
+            Kind::Bytes(obj.downcast::<PyBytes>()?.as_bytes().to_vec())
+        } else if ancestors.len() >= MAX_SNAPSHOT_DEPTH || ancestors.contains(&(obj.as_ptr() as usize)) {
+            Kind::Opaque
+        } else if ty.is(py.get_type::<PyList>()) {
+            ancestors.push(obj.as_ptr() as usize);
+            let items = Self::snapshot_items(obj.downcast::<PyList>()?.iter(), ancestors);
+            ancestors.pop();
+            Kind::List(items?.into())
+        } else if ty.is(py.get_type::<PyTuple>()) {
+            ancestors.push(obj.as_ptr() as usize);
+            let items = Self::snapshot_items(obj.downcast::<PyTuple>()?.iter(), ancestors);
+            ancestors.pop();
+            Kind::Tuple(items?.into())
+        } else if ty.is(py.get_type::<PyDict>()) {
+            ancestors.push(obj.as_ptr() as usize);
+            let kind = Self::snapshot_dict(obj.downcast::<PyDict>()?, ancestors);
+            ancestors.pop();
+            kind?
+        } else {
+            Kind::Opaque
+        };
+
+        Ok(Node {
+            kind,
+            obj: obj.into(),
+            hash: None,
+        })
+    }
+
+    fn snapshot_items<'p>(items: impl Iterator<Item = &'p PyAny>, ancestors: &mut Vec<usize>) -> PyResult<Vec<Node>> {
+        items.map(|item| Node::snapshot_at(item, ancestors)).collect()
+    }
+
+    fn snapshot_dict(dict: &PyDict, ancestors: &mut Vec<usize>) -> PyResult<Kind> {
+        let mut entries = Vec::with_capacity(dict.len());
+        for (k, v) in dict.iter() {
+            let key = Node::snapshot_at(k, ancestors)?;
+            // Ключи 1, 1.0 и True в Python совпадают, поэтому сопоставлять
+            // их без Python можно только для str и int.
+            if !matches!(key.kind, Kind::Str(_) | Kind::Int(_)) {
+                return Ok(Kind::Opaque);
+            }
+            entries.push((key, Node::snapshot_at(v, ancestors)?));
+        }
+        Ok(Kind::Dict(entries.into()))
+    }
+
+    // Снимок obj, где поддерево, чей объект тот же, что у base на том же
+    // месте (ключе или индексе), берется из base вместе с хешем, а не
+    // снимается заново; его дети общие с base. Хеши прочих узлов — None,
+    // их досчитывает fill_hash(). Годится, пока объекты base не правят на
+    // месте.
+    pub fn snapshot_reusing(obj: &PyAny, base: &Node) -> PyResult<Node> {
+        Self::reuse_at(obj, Some(base), &mut Vec::new())
+    }
+
+    fn reuse_at(obj: &PyAny, base: Option<&Node>, ancestors: &mut Vec<usize>) -> PyResult<Node> {
+        let py = obj.py();
+        let address = obj.as_ptr() as usize;
+        let base = match base {
+            Some(base) if base.obj.as_ptr() as usize == address => return Ok(base.clone_ref(py)),
+            Some(base) if ancestors.len() < MAX_SNAPSHOT_DEPTH && !ancestors.contains(&address) => base,
+            _ => return Self::snapshot_at(obj, ancestors),
+        };
+        let ty = obj.get_type();
+        let kind = match &base.kind {
+            Kind::List(items) if ty.is(py.get_type::<PyList>()) => {
+                ancestors.push(address);
+                let kind = Self::reuse_items(obj.downcast::<PyList>()?.iter(), items, ancestors).map(Kind::List);
+                ancestors.pop();
+                kind?
+            }
+            Kind::Tuple(items) if ty.is(py.get_type::<PyTuple>()) => {
+                ancestors.push(address);
+                let kind = Self::reuse_items(obj.downcast::<PyTuple>()?.iter(), items, ancestors).map(Kind::Tuple);
+                ancestors.pop();
+                kind?
+            }
+            Kind::Dict(entries) if ty.is(py.get_type::<PyDict>()) => {
+                ancestors.push(address);
+                let kind = Self::reuse_dict(obj.downcast::<PyDict>()?, entries, ancestors);
+                ancestors.pop();
+                kind?
+            }
+            _ => return Self::snapshot_at(obj, ancestors),
+        };
+        Ok(Node {
+            kind,
+            obj: obj.into(),
+            hash: None,
+        })
+    }
+
+    fn reuse_items<'p>(
+        items: impl Iterator<Item = &'p PyAny>,
+        base: &[Node],
+        ancestors: &mut Vec<usize>,
+    ) -> PyResult<Arc<[Node]>> {
+        items.enumerate().map(|(i, item)| Node::reuse_at(item, base.get(i), ancestors)).collect()
+    }
+
+    // Запись base для ключа ищется сначала на том же месте: порядок
+    // ключей обычно сохраняется. Иначе — по индексу ключей base, который
+    // строится при первом промахе.
+    fn reuse_dict(dict: &PyDict, base: &[(Node, Node)], ancestors: &mut Vec<usize>) -> PyResult<Kind> {
+        let mut index: Option<HashMap<DictKey, usize>> = None;
+        let mut entries = Vec::with_capacity(dict.len());
+        for (i, (k, v)) in dict.iter().enumerate() {
+            let key = Node::snapshot_at(k, ancestors)?;
+            let dict_key = match DictKey::of(&key) {
+                Some(dict_key) => dict_key,
+                None => return Ok(Kind::Opaque),
+            };
+            let found = match base.get(i) {
+                Some((base_key, _)) if DictKey::of(base_key).as_ref() == Some(&dict_key) => Some(i),
+                _ => {
+                    let index = index.get_or_insert_with(|| {
+                        base.iter().enumerate().filter_map(|(j, (k, _))| Some((DictKey::of(k)?, j))).collect()
+                    });
+                    index.get(&dict_key).copied()
+                }
+            };
+            let value = Node::reuse_at(v, found.map(|j| &base[j].1), ancestors)?;
+            entries.push((key, value));
+        }
+        Ok(Kind::Dict(entries.into()))
+    }
+
+    // Копия узла с хешем; дети и объекты Python общие, так что копия
+    // не зависит от размера поддерева.
+    pub fn clone_ref(&self, py: Python) -> Node {
+        Node {
+            kind: self.kind.clone(),
+            obj: self.obj.clone_ref(py),
+            hash: self.hash,
+        }
+    }
+
+    pub fn type_tag(&self) -> u8 {
+        match self.kind {
+            Kind::None => TAG_NONE,
+            Kind::Bool(_) => TAG_BOOL,
+            Kind::Int(_) | Kind::BigInt(_) => TAG_INT,
+            Kind::Float(_) => TAG_FLOAT,
+            Kind::Str(_) => TAG_STR,
+            Kind::Bytes(_) => TAG_BYTES,
+            Kind::List(_) => TAG_LIST,
+            Kind::Tuple(_) => TAG_TUPLE,
+            Kind::Dict(_) => TAG_DICT,
+            Kind::Opaque => TAG_OPAQUE,
+        }
+    }
+
+    pub fn is_opaque(&self) -> bool {
+        matches!(self.kind, Kind::Opaque)
+    }
+
+    pub fn is_container(&self) -> bool {
+        matches!(self.kind, Kind::List(_) | Kind::Tuple(_) | Kind::Dict(_))
+    }
+
+    // Равенство листьев одного типа; для контейнеров и Opaque — None.
+    pub fn scalar_eq(&self, other: &Node) -> Option<bool> {
+        match (&self.kind, &other.kind) {
+            (Kind::None, Kind::None) => Some(true),
+            (Kind::Bool(a), Kind::Bool(b)) => Some(a == b),
+            (Kind::Int(a), Kind::Int(b)) => Some(a == b),
+            (Kind::BigInt(a), Kind::BigInt(b)) => Some(a == b),
+            (Kind::Int(_), Kind::BigInt(_)) | (Kind::BigInt(_), Kind::Int(_)) => Some(false),
+            (Kind::Float(a), Kind::Float(b)) => Some(a == b),
+            (Kind::Str(a), Kind::Str(b)) => Some(a == b),
+            (Kind::Bytes(a), Kind::Bytes(b)) => Some(a == b),
+            _ => None,
+        }
+    }
+
+    // Непосредственные дети узла, включая ключи словаря. У детей, общих
+    // с другим снимком, хеши уже посчитаны, и они не выдаются.
+    pub fn children_mut(&mut self) -> Vec<&mut Node> {
+        match &mut self.kind {
+            Kind::List(items) | Kind::Tuple(items) => match Arc::get_mut(items) {
+                Some(items) => items.iter_mut().collect(),
+                None => Vec::new(),
+            },
+            Kind::Dict(entries) => match Arc::get_mut(entries) {
+                Some(entries) => entries.iter_mut().flat_map(|(k, v)| [k, v]).collect(),
+                None => Vec::new(),
+            },
+            _ => Vec::new(),
+        }
+    }
+
+    // Merkle-хеш поддерева, без обращения к Python. Порядок элементов
+    // списка учитывается, порядок ключей словаря — нет, как и в ==.
+    pub fn compute_hash(&mut self, lists: ListHash) -> Option<u64> {
+        self.hash_with(lists, |child| child.compute_hash(lists))
+    }
+
+    // То же, но узлы с готовым хешем (из snapshot_reusing) не
+    // пересчитываются.
+    pub fn fill_hash(&mut self, lists: ListHash) -> Option<u64> {
+        if self.hash.is_some() {
+            return self.hash;
+        }
+        self.hash_with(lists, |child| child.fill_hash(lists))
+    }
+
+    // Хеш узла из уже посчитанных хешей детей.
+    pub fn combine_hash(&mut self, lists: ListHash) -> Option<u64> {
+        self.hash_with(lists, |child| child.hash)
+    }
+
+    fn hash_with(&mut self, lists: ListHash, mut child_hash: impl FnMut(&mut Node) -> Option<u64>) -> Option<u64> {
+        let tag = self.type_tag();
+        let hash = match &mut self.kind {
+            Kind::None => Some(hash_bytes(tag, &[])),
+            Kind::Bool(b) => Some(hash_bytes(tag, &[*b as u8])),
+            Kind::Int(value) => Some(hash_bytes(tag, &value.to_le_bytes())),
+            Kind::BigInt(digits) => Some(hash_bytes(tag, digits.as_bytes())),
+            Kind::Float(value) => hash_float(*value),
+            Kind::Str(s) => Some(hash_bytes(tag, s.as_bytes())),
+            Kind::Bytes(b) => Some(hash_bytes(tag, b)),
+            Kind::List(items) | Kind::Tuple(items) => {
+                // Хеши считаются у всех детей, даже если у соседа его нет.
+                // Общие с другим снимком дети посчитаны в нем.
+                let children: Vec<Option<u64>> = match Arc::get_mut(items) {
+                    Some(items) => items.iter_mut().map(&mut child_hash).collect(),
+                    None => items.iter().map(|item| item.hash).collect(),
+                };
+                let children: Option<Vec<u64>> = children.into_iter().collect();
+                children.map(|children| hash_sequence(tag, children, lists))
+            }
+            Kind::Dict(entries) => {
+                let len = entries.len();
+                let children: Vec<(Option<u64>, Option<u64>)> = match Arc::get_mut(entries) {
+                    Some(entries) => entries.iter_mut().map(|(k, v)| (child_hash(k), child_hash(v))).collect(),
+                    None => entries.iter().map(|(k, v)| (k.hash, v.hash)).collect(),
+                };
+                let mut hash = Some(0u64);
+                for (key, value) in children {
+                    hash = hash.zip(key.zip(value)).map(|(h, (k, v))| h.wrapping_add(hash_entry(k, v)));
+                }
+                hash.map(|h| hash_dict(h, len))
+            }
+            Kind::Opaque => None,
+        };
+        self.hash = hash;
+        hash
+    }
+}
+
+// Ключ словаря в снимке для поиска записи по нему.
+#[derive(PartialEq, Eq, Hash)]
+enum DictKey<'a> {
+    Str(&'a str),
+    Int(i64),
+}
+
+impl<'a> DictKey<'a> {
+    fn of(node: &'a Node) -> Option<Self> {
+        match &node.kind {
+            Kind::Str(s) => Some(DictKey::Str(s)),
+            Kind::Int(value) => Some(DictKey::Int(*value)),
+            _ => None,
+        }
+    }
+}
+
+// Некриптографический 64-битный хеш: FNV-1a с финальным перемешиванием
+// splitmix64. Значения стабильны между запусками и платформами.
+const FNV_OFFSET: u64 = 0xcbf2_9ce4_8422_2325;
+const FNV_PRIME: u64 = 0x0000_0100_0000_01b3;
+
+fn mix(mut x: u64) -> u64 {
+    x ^= x >> 30;
+    x = x.wrapping_mul(0xbf58_476d_1ce4_e5b9);
+    x ^= x >> 27;
+    x = x.wrapping_mul(0x94d0_49bb_1331_11eb);
+    x ^ (x >> 31)
+}
+
+// Хеши узлов по частям — для тех, кто строит их не из снимка, как файлы
+// снимков из JSON. Результат должен совпадать с compute_hash().
+pub fn hash_bytes(tag: u8, bytes: &[u8]) -> u64 {
+    let mut hash = (FNV_OFFSET ^ tag as u64).wrapping_mul(FNV_PRIME);
+    for byte in bytes {
+        hash = (hash ^ *byte as u64).wrapping_mul(FNV_PRIME);
+    }
+    mix(hash ^ bytes.len() as u64)
+}
+
+// NaN не равен сам себе, а 0.0 == -0.0.
+pub fn hash_float(value: f64) -> Option<u64> {
+    if value.is_nan() {
+        return None;
+    }
+    Some(hash_bytes(TAG_FLOAT, &(value + 0.0).to_bits().to_le_bytes()))
+}
+
+pub fn hash_sequence(tag: u8, mut children: Vec<u64>, lists: ListHash) -> u64 {
+    match lists {
+        ListHash::Ordered => {
+            let hash = children.iter().fold(mix(tag as u64), |h, c| mix(h.rotate_left(7) ^ c));
+            mix(hash ^ children.len() as u64)
+        }
+        ListHash::Multiset | ListHash::Set => {
+            if lists == ListHash::Set {
+                children.sort_unstable();
+                children.dedup();
+            }
+            let hash = children.iter().fold(0u64, |h, c| h.wrapping_add(mix(*c)));
+            mix(hash ^ mix(tag as u64) ^ children.len() as u64)
+        }
+    }
+}
+
+// Вклад пары ключ-значение; порядок пар не важен, вклады складываются.
+pub fn hash_entry(key: u64, value: u64) -> u64 {
+    mix(key ^ value.rotate_left(29))
+}
+
+pub fn hash_dict(entries: u64, len: usize) -> u64 {
+    mix(entries ^ mix(TAG_DICT as u64) ^ len as u64)
+}
@@ -0,0 +1,811 @@
+use std::collections::{HashMap, VecDeque};
+use std::sync::Arc;
+use std::time::{Duration, Instant};
+
+use pyo3::AsPyPointer;
+
+use crate::align::{self, Op};
+use crate::filter::{Cursor, Filter, Step};
+use crate::node::{Kind, Node};
+use crate::options::{Budget, DiffOptions, GroupBy};
+use crate::path::{group_text, push_group, push_index, push_key, PathComponent};
+use crate::result::Category;
+use crate::stats::{NodeKind, Stats};
+
+// Предел шагов выравнивания одного списка. На патологических входах
+// (почти ничего общего у длинных списков) выравнивание дороже пользы,
+// и список сравнивается по позициям.
+const ALIGN_MAX_STEPS: usize = 50_000_000;
+
+// Оставшиеся без пары при ignore_order элементы сопоставляются попарно по
+// близости, если пар не больше этого числа; иначе — только added/removed.
+const MAX_PAIR_CANDIDATES: usize = 100_000;
+
+// Наибольшая доля различий, при которой элементы еще считаются измененной
+// версией друг друга, а не удаленным и добавленным.
+const PAIR_MAX_DISTANCE: f64 = 0.3;
+
+pub type NodePath<'a> = Vec<PathComponent<&'a Node>>;
+
+pub enum NodeChange<'a> {
+    Record {
+        category: Category,
+        path: NodePath<'a>,
+        old: Option<&'a Node>,
+        new: Option<&'a Node>,
+    },
+    // Пара с непрозрачным объектом: ее сравнивает обход Python под GIL.
+    // ancestors — пары контейнеров на пути к ней, чтобы обход Python узнал
+    // цикл, ведущий к ним.
+    Deferred {
+        path: NodePath<'a>,
+        old: &'a Node,
+        new: &'a Node,
+        ancestors: Vec<(usize, usize)>,
+    },
+    // Элемент списка, найденный при выравнивании на другом месте.
+    Move {
+        path: NodePath<'a>,
+        new_path: NodePath<'a>,
+        value: &'a Node,
+    },
+    // Элемент, число повторов которого изменилось (ignore_order).
+    Repetition {
+        path: NodePath<'a>,
+        value: &'a Node,
+        old_indexes: Vec<usize>,
+        new_indexes: Vec<usize>,
+    },
+    // Элементы без хеша, оставшиеся без пары при ignore_order, с их
+    // индексами; path — путь списка. Обход Python сопоставляет их через
+    // is и ==, остальные выдает как removed/added.
+    Unmatched {
+        path: NodePath<'a>,
+        removed: Vec<(usize, &'a Node)>,
+        added: Vec<(usize, &'a Node)>,
+    },
+    // Пара поддеревьев на глубине разбиения, оставленная для
+    // параллельного обхода, и пары контейнеров на пути к ней; в итоговый
+    // результат не попадает.
+    Pending {
+        path: NodePath<'a>,
+        old: &'a Node,
+        new: &'a Node,
+        ancestors: Vec<(usize, usize)>,
+    },
+    // Обход уперся в max_diffs, срок (expired) или отмену (cancelled) и
+    // собрал не все.
+    Truncated { expired: bool, cancelled: bool },
+    // Счетчики обхода при stats=True, в конце его записей.
+    Stats(Box<Stats>),
+    // Поддерево, сравнение которого заняло не меньше порога on_slow_subtree.
+    Slow { path: NodePath<'a>, elapsed: Duration },
+}
+
+// Ключ словаря снимка для сопоставления без Python.
+#[derive(PartialEq, Eq, Hash)]
+enum DictKey<'a> {
+    Str(&'a str),
+    Int(i64),
+}
+
+fn dict_key(node: &Node) -> DictKey<'_> {
+    match &node.kind {
+        Kind::Str(s) => DictKey::Str(s),
+        Kind::Int(value) => DictKey::Int(*value),
+        _ => unreachable!("ключи словаря снимка — только str и int"),
+    }
+}
+
+fn dict_index(entries: &[(Node, Node)]) -> HashMap<DictKey<'_>, &Node> {
+    entries.iter().map(|(k, v)| (dict_key(k), v)).collect()
+}
+
+// Значение поля field у записи-словаря, пригодное как ключ сопоставления.
+fn record_key<'a>(record: &'a Node, field: &str) -> Option<(DictKey<'a>, &'a Node)> {
+    match &record.kind {
+        Kind::Dict(entries) => entries
+            .iter()
+            .find(|(k, _)| matches!(&k.kind, Kind::Str(s) if s == field))
+            .and_then(|(_, value)| match value.kind {
+                Kind::Str(_) | Kind::Int(_) => Some((dict_key(value), value)),
+                _ => None,
+            }),
+        _ => None,
+    }
+}
+
+// Индекс записей по ключу; None, если у записи нет ключа или он повторяется.
+fn record_index<'a>(records: &'a [Node], field: &str) -> Option<HashMap<DictKey<'a>, usize>> {
+    let mut index = HashMap::with_capacity(records.len());
+    for (i, record) in records.iter().enumerate() {
+        let (key, _) = record_key(record, field)?;
+        if index.insert(key, i).is_some() {
+            return None;
+        }
+    }
+    Some(index)
+}
+
+fn format_node_path(path: &[PathComponent<&Node>]) -> String {
+    let mut result = String::from("root");
+    for component in path {
+        match component {
+            PathComponent::Key(key) => match &key.kind {
+                Kind::Str(s) => push_key(&mut result, s),
+                Kind::Int(value) => result.push_str(&format!("[{}]", value)),
+                _ => result.push_str("[?]"),
+            },
+            PathComponent::Index(idx) => push_index(&mut result, *idx),
+            PathComponent::Attr(_) => unreachable!("в снимках нет атрибутов"),
+            PathComponent::Group(field, key) => push_group(&mut result, &group_key_text(field, key)),
+        }
+    }
+    result
+}
+
+// Текст компонента group_by для ключа записи — str или int.
+fn group_key_text(field: &str, key: &Node) -> String {
+    match &key.kind {
+        Kind::Str(s) => group_text(field, s, true),
+        Kind::Int(value) => group_text(field, &value.to_string(), false),
+        _ => unreachable!("ключ group_by — только str и int"),
+    }
+}
+
+// Доля различающихся детей двух контейнеров одного типа по их хешам;
+// None — узлы несравнимы (скаляры, разные типы, непрозрачные объекты).
+fn distance(old: &Node, new: &Node) -> Option<f64> {
+    match (&old.kind, &new.kind) {
+        (Kind::Dict(d1), Kind::Dict(d2)) => {
+            let index2 = dict_index(d2);
+            let mut same = 0;
+            for (k, v1) in d1.iter() {
+                if let Some(v2) = index2.get(&dict_key(k)) {
+                    same += same_hash(v1, v2) as usize;
+                }
+            }
+            let total = d1.len() + d2.len() - same;
+            Some(if total == 0 { 0.0 } else { 1.0 - same as f64 / total as f64 })
+        }
+        (Kind::List(l1), Kind::List(l2)) | (Kind::Tuple(l1), Kind::Tuple(l2)) => {
+            let mut counts: HashMap<u64, isize> = HashMap::new();
+            for hash in l1.iter().filter_map(|n| n.hash) {
+                *counts.entry(hash).or_default() += 1;
+            }
+            let mut same = 0;
+            for hash in l2.iter().filter_map(|n| n.hash) {
+                let count = counts.entry(hash).or_default();
+                if *count > 0 {
+                    *count -= 1;
+                    same += 1;
+                }
+            }
+            let total = l1.len() + l2.len() - same;
+            Some(if total == 0 { 0.0 } else { 1.0 - same as f64 / total as f64 })
+        }
+        _ => None,
+    }
+}
+
+// Шаг сопоставления элементов двух списков. Шаги считаются по снимкам
+// элементов с хешами и одинаково выполняются обходом снимков и обходом
+// Python, которому достаются списки внутри непрозрачных объектов.
+pub enum ListOp {
+    // Сравнить l1[i] и l2[j] вглубь по пути элемента l1[i].
+    Pair(usize, usize),
+    Removed(usize),
+    Added(usize),
+    // l1[i] найден при выравнивании на месте l2[j].
+    Move(usize, usize),
+    // Число повторов l1[i] изменилось: индексы повторов с обеих сторон.
+    Repetition(usize, Vec<usize>, Vec<usize>),
+    // Элементы без хеша, оставшиеся без пары: их сопоставляют через is и
+    // == под GIL.
+    Unmatched(Vec<usize>, Vec<usize>),
+}
+
+// Сопоставление записей по полю field (group_by); None — у записи нет
+// ключа или он повторяется. Записи без пары — removed/added.
+pub fn grouped_ops(l1: &[Node], l2: &[Node], field: &str) -> Option<Vec<ListOp>> {
+    let index1 = record_index(l1, field)?;
+    let index2 = record_index(l2, field)?;
+    let mut ops = Vec::with_capacity(l1.len().max(l2.len()));
+    for (i, record) in l1.iter().enumerate() {
+        let (key, _) = record_key(record, field).expect("ключ уже проверен при индексации");
+        ops.push(match index2.get(&key) {
+            Some(&j) => ListOp::Pair(i, j),
+            None => ListOp::Removed(i),
+        });
+    }
+    for (j, record) in l2.iter().enumerate() {
+        let (key, _) = record_key(record, field).expect("ключ уже проверен при индексации");
+        if !index1.contains_key(&key) {
+            ops.push(ListOp::Added(j));
+        }
+    }
+    Some(ops)
+}
+
+// Узел ключа записи из списка, сопоставленного grouped_ops(): в пути
+// записи вместо индекса стоит поле и этот ключ.
+pub fn group_key<'a>(record: &'a Node, field: &str) -> &'a Node {
+    record_key(record, field).expect("ключ уже проверен при индексации").1
+}
+
+// Выравнивание по хешам элементов (align_lists); None — выравнивание
+// дороже ALIGN_MAX_STEPS шагов, и список сравнивается по позициям.
+// Удаленный и вставленный элементы с равным хешем — перемещение;
+// остальные удаления и вставки в одном промежутке между совпадениями
+// попарно сравниваются вглубь, лишние — removed/added.
+pub fn aligned_ops(l1: &[Node], l2: &[Node]) -> Option<Vec<ListOp>> {
+    let ops = align::align(l1.len(), l2.len(), |i, j| same_hash(&l1[i], &l2[j]), ALIGN_MAX_STEPS)?;
+    let mut gaps: Vec<(Vec<usize>, Vec<usize>)> = Vec::new();
+    let mut in_gap = false;
+    for op in ops {
+        if let Op::Equal(..) = op {
+            in_gap = false;
+            continue;
+        }
+        if !in_gap {
+            gaps.push((Vec::new(), Vec::new()));
+            in_gap = true;
+        }
+        let gap = gaps.last_mut().expect("промежуток только что добавлен");
+        match op {
+            Op::Delete(i) => gap.0.push(i),
+            Op::Insert(j) => gap.1.push(j),
+            Op::Equal(..) => {}
+        }
+    }
+
+    let mut deleted: HashMap<u64, VecDeque<usize>> = HashMap::new();
+    for (dels, _) in &gaps {
+        for &i in dels {
+            if let Some(hash) = l1[i].hash {
+                deleted.entry(hash).or_default().push_back(i);
+            }
+        }
+    }
+    let mut moved_from = vec![false; l1.len()];
+    let mut moved_to = vec![false; l2.len()];
+    let mut moves = Vec::new();
+    for (_, ins) in &gaps {
+        for &j in ins {
+            let from = l2[j].hash.and_then(|hash| deleted.get_mut(&hash)).and_then(VecDeque::pop_front);
+            if let Some(i) = from {
+                moved_from[i] = true;
+                moved_to[j] = true;
+                moves.push(ListOp::Move(i, j));
+            }
+        }
+    }
+
+    let mut result = Vec::new();
+    for (dels, ins) in &gaps {
+        let dels: Vec<usize> = dels.iter().copied().filter(|&i| !moved_from[i]).collect();
+        let ins: Vec<usize> = ins.iter().copied().filter(|&j| !moved_to[j]).collect();
+        result.extend(dels.iter().zip(ins.iter()).map(|(&i, &j)| ListOp::Pair(i, j)));
+        result.extend(dels.iter().skip(ins.len()).map(|&i| ListOp::Removed(i)));
+        result.extend(ins.iter().skip(dels.len()).map(|&j| ListOp::Added(j)));
+    }
+    result.extend(moves);
+    Some(result)
+}
+
+// Сопоставление без учета порядка. Элементы раскладываются по корзинам
+// хешей, и равные сопоставляются за линейное время; оставшиеся без пары
+// сопоставляются по близости, остальное — removed/added.
+pub fn unordered_ops(l1: &[Node], l2: &[Node], report_repetition: bool) -> Vec<ListOp> {
+    let mut ops = Vec::new();
+    let mut buckets: HashMap<u64, (Vec<usize>, Vec<usize>)> = HashMap::new();
+    for (i, node) in l1.iter().enumerate() {
+        if let Some(hash) = node.hash {
+            buckets.entry(hash).or_default().0.push(i);
+        }
+    }
+    for (j, node) in l2.iter().enumerate() {
+        if let Some(hash) = node.hash {
+            buckets.entry(hash).or_default().1.push(j);
+        }
+    }
+
+    // Элементы без хеша не попадают в корзины.
+    let mut removed = Vec::new();
+    for (i, node) in l1.iter().enumerate() {
+        let (olds, news) = match node.hash {
+            Some(hash) => &buckets[&hash],
+            None => {
+                removed.push(i);
+                continue;
+            }
+        };
+        if news.is_empty() {
+            removed.push(i);
+        } else if report_repetition && olds[0] == i && olds.len() != news.len() {
+            ops.push(ListOp::Repetition(i, olds.clone(), news.clone()));
+        }
+    }
+    let added: Vec<usize> = (0..l2.len())
+        .filter(|&j| l2[j].hash.map_or(true, |hash| buckets[&hash].0.is_empty()))
+        .collect();
+
+    let mut paired_old = vec![false; l1.len()];
+    let mut paired_new = vec![false; l2.len()];
+    if removed.len() * added.len() <= MAX_PAIR_CANDIDATES {
+        let mut candidates = Vec::new();
+        for &i in &removed {
+            for &j in &added {
+                match distance(&l1[i], &l2[j]) {
+                    Some(d) if d <= PAIR_MAX_DISTANCE => candidates.push((d, i, j)),
+                    _ => {}
+                }
+            }
+        }
+        candidates.sort_by(|a, b| a.partial_cmp(b).expect("расстояние не NaN"));
+        for (_, i, j) in candidates {
+            if paired_old[i] || paired_new[j] {
+                continue;
+            }
+            paired_old[i] = true;
+            paired_new[j] = true;
+            ops.push(ListOp::Pair(i, j));
+        }
+    }
+
+    // Элементы без хеша — непрозрачные объекты, NaN и контейнеры с
+    // ними — равны только через is или ==. Тот же объект с обеих сторон
+    // снимается здесь, остальные пары ищет обход Python под GIL.
+    let mut unhashed_old = Vec::new();
+    let mut unhashed_new: Vec<usize> =
+        added.iter().copied().filter(|&j| !paired_new[j] && l2[j].hash.is_none()).collect();
+    for &i in &removed {
+        if paired_old[i] || l1[i].hash.is_some() {
+            continue;
+        }
+        let ptr = l1[i].obj.as_ptr();
+        match unhashed_new.iter().position(|&j| l2[j].obj.as_ptr() == ptr) {
+            Some(k) => {
+                paired_old[i] = true;
+                paired_new[unhashed_new.remove(k)] = true;
+            }
+            None => unhashed_old.push(i),
+        }
+    }
+    if !unhashed_old.is_empty()
+        && !unhashed_new.is_empty()
+        && unhashed_old.len() * unhashed_new.len() <= MAX_PAIR_CANDIDATES
+    {
+        for &i in &unhashed_old {
+            paired_old[i] = true;
+        }
+        for &j in &unhashed_new {
+            paired_new[j] = true;
+        }
+        ops.push(ListOp::Unmatched(unhashed_old, unhashed_new));
+    }
+
+    ops.extend(removed.into_iter().filter(|&i| !paired_old[i]).map(ListOp::Removed));
+    ops.extend(added.into_iter().filter(|&j| !paired_new[j]).map(ListOp::Added));
+    ops
+}
+
+// Обход двух снимков в том же порядке, что и обход объектов Python.
+// Поддеревья с совпавшими хешами пропускаются.
+pub struct NodeDiffer<'a> {
+    path: NodePath<'a>,
+    pub changes: Vec<NodeChange<'a>>,
+    options: &'a DiffOptions,
+    // Глубина, на которой пары контейнеров не сравниваются, а остаются
+    // как Pending; скаляры на ней сравниваются сразу. 0 — без разбиения.
+    split: usize,
+    // Ограничения этого обхода. При параллельном обходе каждая задача
+    // получает свой max_diffs — остаток после уже собранных задачами
+    // раньше нее, — а точный общий предел соблюдается при сборке результата:
+    // так он не зависит от потоков.
+    pub budget: Budget,
+    // Фильтр путей и курсоры в нем, как в обходе Python.
+    filter: Option<&'a Filter>,
+    cursors: Vec<Cursor>,
+    text: String,
+    stats: Option<Box<Stats>>,
+    // Пары контейнеров (по адресам объектов) на текущем пути.
+    ancestors: Vec<(usize, usize)>,
+}
+
+// Вид узла снимка для счетчиков.
+fn node_kind(kind: &Kind) -> NodeKind {
+    match kind {
+        Kind::None => NodeKind::None,
+        Kind::Bool(_) => NodeKind::Bool,
+        Kind::Int(_) | Kind::BigInt(_) => NodeKind::Int,
+        Kind::Float(_) => NodeKind::Float,
+        Kind::Str(_) => NodeKind::Str,
+        Kind::Bytes(_) => NodeKind::Bytes,
+        Kind::List(_) => NodeKind::List,
+        Kind::Tuple(_) => NodeKind::Tuple,
+        Kind::Dict(_) => NodeKind::Dict,
+        Kind::Opaque => NodeKind::Object,
+    }
+}
+
+// Шаг фильтра для ключа снимка; ключи словарей — только str и int.
+fn node_step<R>(key: &Node, f: impl FnOnce(Step<'_>) -> R) -> R {
+    match &key.kind {
+        Kind::Str(s) => f(Step::Key(s)),
+        Kind::Int(value) if *value >= 0 => f(Step::Index(*value as usize)),
+        Kind::Int(value) => f(Step::Repr(&value.to_string())),
+        _ => unreachable!("ключи словаря снимка — только str и int"),
+    }
+}
+
+fn same_hash(old: &Node, new: &Node) -> bool {
+    matches!((old.hash, new.hash), (Some(h1), Some(h2)) if h1 == h2)
+}
+
+impl<'a> NodeDiffer<'a> {
+    pub fn new(options: &'a DiffOptions) -> Self {
+        Self::with_path(Vec::new(), Vec::new(), options)
+    }
+
+    // Обход поддерева, лежащего по пути path внутри контейнеров ancestors.
+    pub fn with_path(path: NodePath<'a>, ancestors: Vec<(usize, usize)>, options: &'a DiffOptions) -> Self {
+        let mut differ = NodeDiffer {
+            path: Vec::with_capacity(path.len()),
+            changes: Vec::new(),
+            options,
+            split: 0,
+            budget: Budget::new(options),
+            filter: options.filter.as_deref(),
+            cursors: Vec::new(),
+            text: String::new(),
+            stats: options.stats.then(Box::default),
+            ancestors,
+        };
+        if let Some(filter) = differ.filter {
+            differ.cursors.push(filter.root(&mut differ.text));
+        }
+        for component in path {
+            let entered = differ.enter(component);
+            debug_assert!(entered, "путь поддерева уже прошел фильтр");
+        }
+        differ
+    }
+
+    pub fn split(options: &'a DiffOptions, depth: usize) -> Self {
+        NodeDiffer {
+            split: depth,
+            ..Self::new(options)
+        }
+    }
+
+    // Записи обхода с пометкой об усечении и счетчиками в конце.
+    pub fn finish(mut self) -> Vec<NodeChange<'a>> {
+        if self.budget.truncated {
+            self.changes.push(NodeChange::Truncated {
+                expired: self.budget.expired,
+                cancelled: self.budget.cancelled,
+            });
+        }
+        if let Some(stats) = self.stats {
+            self.changes.push(NodeChange::Stats(stats));
+        }
+        self.changes
+    }
+
+    // Сколько пар этот обход оставил как Pending и можно ли разбить
+    // хотя бы одну из них глубже: контейнеры с обеих сторон одного типа.
+    pub fn pending(&self) -> (usize, bool) {
+        let mut count = 0;
+        let mut divisible = false;
+        for change in &self.changes {
+            if let NodeChange::Pending { old, new, .. } = change {
+                count += 1;
+                divisible |= old.type_tag() == new.type_tag();
+            }
+        }
+        (count, divisible)
+    }
+
+    // Учитывает в счетчиках задачи параллельного обхода.
+    pub fn count_tasks(&mut self, tasks: usize) {
+        if let Some(stats) = &mut self.stats {
+            stats.parallel_tasks += tasks as u64;
+        }
+    }
+
+    // Спуск к ребенку; false — поддерево отфильтровано.
+    fn enter(&mut self, component: PathComponent<&'a Node>) -> bool {
+        if let Some(filter) = self.filter {
+            let cursor = *self.cursors.last().expect("курсор корня есть всегда");
+            let text = &mut self.text;
+            let next = match component {
+                _ if !filter.needs_step(cursor) => Some(filter.inherit(cursor)),
+                PathComponent::Index(idx) => filter.step(cursor, Step::Index(idx), text),
+                PathComponent::Key(key) => node_step(key, |step| filter.step(cursor, step, text)),
+                PathComponent::Attr(_) => unreachable!("в снимках нет атрибутов"),
+                PathComponent::Group(ref field, key) => filter.step(cursor, Step::Repr(&group_key_text(field, key)), text),
+            };
+            match next {
+                Some(next) => self.cursors.push(next),
+                None => {
+                    if let Some(stats) = &mut self.stats {
+                        stats.filtered += 1;
+                    }
+                    return false;
+                }
+            }
+        }
+        self.path.push(component);
+        true
+    }
+
+    fn leave(&mut self) {
+        self.path.pop();
+        if self.filter.is_some() {
+            self.cursors.pop();
+        }
+    }
+
+    // Попадает ли запись по текущему пути в результат.
+    fn visible(&mut self) -> bool {
+        self.cursors.last().map_or(true, |cursor| cursor.included) && self.budget.take_record()
+    }
+
+    fn record(&mut self, category: Category, old: Option<&'a Node>, new: Option<&'a Node>) {
+        if !self.visible() {
+            return;
+        }
+        self.changes.push(NodeChange::Record {
+            category,
+            path: self.path.clone(),
+            old,
+            new,
+        });
+    }
+
+    pub fn compare_nodes(&mut self, old: &'a Node, new: &'a Node) {
+        if same_hash(old, new) {
+            self.skip();
+            return;
+        }
+        if self.budget.stopped() {
+            return;
+        }
+
+        if old.is_opaque() || new.is_opaque() {
+            self.changes.push(NodeChange::Deferred {
+                path: self.path.clone(),
+                old,
+                new,
+                ancestors: self.ancestors.clone(),
+            });
+            return;
+        }
+
+        if let Some(stats) = &mut self.stats {
+            stats.visit(node_kind(&old.kind), self.path.len());
+        }
+
+        if old.type_tag() != new.type_tag() {
+            self.record(Category::TypeChanges, Some(old), Some(new));
+            return;
+        }
+
+        // Ниже max_depth контейнеры сравнивает == в обходе Python.
+        let container = matches!(old.kind, Kind::Dict(_) | Kind::List(_) | Kind::Tuple(_));
+        if container && self.budget.too_deep(self.path.len()) {
+            self.changes.push(NodeChange::Deferred {
+                path: self.path.clone(),
+                old,
+                new,
+                ancestors: self.ancestors.clone(),
+            });
+            return;
+        }
+
+        let started = match &self.options.slow_subtree {
+            Some(_) if container => Some(Instant::now()),
+            _ => None,
+        };
+        if container {
+            self.ancestors.push((old.obj.as_ptr() as usize, new.obj.as_ptr() as usize));
+        }
+        match (&old.kind, &new.kind) {
+            (Kind::Dict(d1), Kind::Dict(d2)) => self.compare_dicts(d1, d2),
+            (Kind::List(l1), Kind::List(l2)) | (Kind::Tuple(l1), Kind::Tuple(l2)) => self.compare_iterables(l1, l2),
+            (Kind::Float(a), Kind::Float(b)) => {
+                if !self.options.floats.eq(*a, *b) {
+                    self.record(Category::ValuesChanged, Some(old), Some(new));
+                }
+            }
+            _ => {
+                if old.scalar_eq(new) != Some(true) {
+                    self.record(Category::ValuesChanged, Some(old), Some(new));
+                }
+            }
+        }
+        if container {
+            self.ancestors.pop();
+        }
+        if let (Some(started), Some(slow)) = (started, &self.options.slow_subtree) {
+            let elapsed = started.elapsed();
+            if elapsed >= slow.threshold {
+                self.changes.push(NodeChange::Slow {
+                    path: self.path.clone(),
+                    elapsed,
+                });
+            }
+        }
+    }
+
+    fn skip(&mut self) {
+        if let Some(stats) = &mut self.stats {
+            stats.skipped += 1;
+        }
+    }
+
+    fn compare_child(&mut self, old: &'a Node, new: &'a Node) {
+        let task = self.split > 0 && self.path.len() >= self.split && old.is_container() && new.is_container();
+        if !task {
+            self.compare_nodes(old, new);
+        } else if same_hash(old, new) {
+            self.skip();
+        } else {
+            self.changes.push(NodeChange::Pending {
+                path: self.path.clone(),
+                old,
+                new,
+                ancestors: self.ancestors.clone(),
+            });
+        }
+    }
+
+    fn compare_dicts(&mut self, d1: &'a [(Node, Node)], d2: &'a [(Node, Node)]) {
+        let index1 = dict_index(d1);
+        let index2 = dict_index(d2);
+
+        for (k, v1) in d1 {
+            if self.budget.stopped() {
+                return;
+            }
+            if self.enter(PathComponent::Key(k)) {
+                match index2.get(&dict_key(k)) {
+                    Some(v2) => self.compare_child(v1, v2),
+                    None => self.record(Category::DictionaryItemRemoved, Some(v1), None),
+                }
+                self.leave();
+            }
+        }
+
+        for (k, v2) in d2 {
+            if !index1.contains_key(&dict_key(k)) && self.enter(PathComponent::Key(k)) {
+                self.record(Category::DictionaryItemAdded, None, Some(v2));
+                self.leave();
+            }
+        }
+    }
+
+    fn compare_iterables(&mut self, l1: &'a [Node], l2: &'a [Node]) {
+        if let Some(field) = self.group_field() {
+            if let Some(ops) = grouped_ops(l1, l2, field) {
+                self.apply_ops(l1, l2, ops, Some(field));
+                return;
+            }
+        }
+
+        if self.options.ignore_order {
+            let ops = unordered_ops(l1, l2, self.options.report_repetition);
+            self.apply_ops(l1, l2, ops, None);
+            return;
+        }
+
+        if self.options.align_lists {
+            if let Some(ops) = aligned_ops(l1, l2) {
+                self.apply_ops(l1, l2, ops, None);
+                return;
+            }
+        }
+
+        for (i, (v1, v2)) in l1.iter().zip(l2.iter()).enumerate() {
+            if self.budget.stopped() {
+                return;
+            }
+            if self.enter(PathComponent::Index(i)) {
+                self.compare_child(v1, v2);
+                self.leave();
+            }
+        }
+
+        for (i, v1) in l1.iter().enumerate().skip(l2.len()) {
+            if self.enter(PathComponent::Index(i)) {
+                self.record(Category::IterableItemRemoved, Some(v1), None);
+                self.leave();
+            }
+        }
+
+        for (i, v2) in l2.iter().enumerate().skip(l1.len()) {
+            if self.enter(PathComponent::Index(i)) {
+                self.record(Category::IterableItemAdded, None, Some(v2));
+                self.leave();
+            }
+        }
+    }
+
+    // Выполняет сопоставление элементов: пары сравниваются вглубь, прочие
+    // шаги становятся записями. Путь элемента — индекс или, если списки
+    // сопоставлены по полю group, поле и значение ключа записи.
+    fn apply_ops(&mut self, l1: &'a [Node], l2: &'a [Node], ops: Vec<ListOp>, group: Option<&Arc<str>>) {
+        let item = |items: &'a [Node], i: usize| match group {
+            Some(field) => PathComponent::Group(field.clone(), group_key(&items[i], field)),
+            None => PathComponent::Index(i),
+        };
+        for op in ops {
+            if self.budget.stopped() {
+                return;
+            }
+            match op {
+                ListOp::Pair(i, j) => {
+                    if self.enter(item(l1, i)) {
+                        self.compare_child(&l1[i], &l2[j]);
+                        self.leave();
+                    }
+                }
+                ListOp::Removed(i) => {
+                    if self.enter(item(l1, i)) {
+                        self.record(Category::IterableItemRemoved, Some(&l1[i]), None);
+                        self.leave();
+                    }
+                }
+                ListOp::Added(j) => {
+                    if self.enter(item(l2, j)) {
+                        self.record(Category::IterableItemAdded, None, Some(&l2[j]));
+                        self.leave();
+                    }
+                }
+                ListOp::Move(i, j) => {
+                    let mut new_path = self.path.clone();
+                    new_path.push(PathComponent::Index(j));
+                    if self.enter(PathComponent::Index(i)) {
+                        if self.visible() {
+                            self.changes.push(NodeChange::Move {
+                                path: self.path.clone(),
+                                new_path,
+                                value: &l1[i],
+                            });
+                        }
+                        self.leave();
+                    }
+                }
+                ListOp::Repetition(i, old_indexes, new_indexes) => {
+                    if self.enter(PathComponent::Index(i)) {
+                        if self.visible() {
+                            self.changes.push(NodeChange::Repetition {
+                                path: self.path.clone(),
+                                value: &l1[i],
+                                old_indexes,
+                                new_indexes,
+                            });
+                        }
+                        self.leave();
+                    }
+                }
+                ListOp::Unmatched(removed, added) => {
+                    self.changes.push(NodeChange::Unmatched {
+                        path: self.path.clone(),
+                        removed: removed.into_iter().map(|i| (i, &l1[i])).collect(),
+                        added: added.into_iter().map(|j| (j, &l2[j])).collect(),
+                    });
+                }
+            }
+        }
+    }
+
+    // Поле group_by для списка по текущему пути.
+    fn group_field(&self) -> Option<&'a Arc<str>> {
+        match self.options.group_by.as_ref()? {
+            GroupBy::All(field) => Some(field),
+            GroupBy::Paths(paths) => paths.get(&format_node_path(&self.path)),
+        }
+    }
+}
@@ -0,0 +1,345 @@
+use std::collections::HashMap;
+use std::sync::atomic::{AtomicBool, Ordering};
+use std::sync::Arc;
+use std::time::{Duration, Instant};
+
+use pyo3::exceptions::{PyTypeError, PyValueError};
+use pyo3::prelude::*;
+use pyo3::types::{PyDict, PyString};
+
+use crate::filter::{Filter, FilterSpec, PathFilter};
+use crate::node::ListHash;
+use crate::stats::SlowSubtree;
+
+// По какому полю сопоставлять записи списков: для всех списков или для
+// списков по заданным путям вида root['users'].
+#[derive(Debug, Clone)]
+pub enum GroupBy {
+    All(Arc<str>),
+    Paths(HashMap<String, Arc<str>>),
+}
+
+impl GroupBy {
+    fn extract(value: &PyAny) -> PyResult<Self> {
+        if let Ok(field) = value.downcast::<PyString>() {
+            Ok(GroupBy::All(field.to_str()?.into()))
+        } else if let Ok(paths) = value.downcast::<PyDict>() {
+            let paths: HashMap<String, String> = paths.extract()?;
+            Ok(GroupBy::Paths(paths.into_iter().map(|(path, field)| (path, field.into())).collect()))
+        } else {
+            Err(PyTypeError::new_err("group_by: ожидалась строка или словарь {путь: поле}"))
+        }
+    }
+}
+
+// Флаг отмены для параметра cancel: cancel() из любого потока
+// останавливает идущие с ним сравнения так же, как истекший timeout.
+#[pyclass]
+#[derive(Debug, Clone, Default)]
+pub struct CancelToken {
+    flag: Arc<AtomicBool>,
+}
+
+impl CancelToken {
+    pub fn is_cancelled(&self) -> bool {
+        self.flag.load(Ordering::Relaxed)
+    }
+}
+
+#[pymethods]
+impl CancelToken {
+    #[new]
+    fn new() -> Self {
+        CancelToken::default()
+    }
+
+    fn cancel(&self) {
+        self.flag.store(true, Ordering::Relaxed);
+    }
+
+    #[getter]
+    fn cancelled(&self) -> bool {
+        self.is_cancelled()
+    }
+
+    fn __repr__(&self) -> String {
+        format!("CancelToken(cancelled={})", if self.is_cancelled() { "True" } else { "False" })
+    }
+}
+
+// Параметры сравнения, общие для compare(), compare_many() и compare_pairs().
+#[derive(Debug, Clone, Default)]
+pub struct DiffOptions {
+    // Пропускать поддеревья с равными хешами.
+    pub use_hashes: bool,
+    // Число потоков; Some(0) — по числу ядер, None — без потоков.
+    pub parallelism: Option<usize>,
+    // Выравнивать списки и кортежи по хешам элементов, а не по позициям.
+    pub align_lists: bool,
+    // Сравнивать списки и кортежи без учета порядка.
+    pub ignore_order: bool,
+    // При ignore_order сообщать об изменении числа повторов элемента.
+    pub report_repetition: bool,
+    // Сопоставлять записи списков по значению поля, а не по позиции.
+    pub group_by: Option<GroupBy>,
+    // Сколько записей собрать, прежде чем остановить обход.
+    pub max_diffs: Option<usize>,
+    // Глубже этого пути контейнеры сравниваются целиком через ==.
+    pub max_depth: Option<usize>,
+    // Срок обхода, отсчитанный от вызова по параметру timeout (секунды).
+    pub deadline: Option<Instant>,
+    // Сам timeout: по нему срок отсчитывается заново для каждого сравнения
+    // DiffSession.
+    pub timeout: Option<Duration>,
+    // Отмена из другого потока.
+    pub cancel: Option<CancelToken>,
+    // Пути, которые обход пропускает, не читая.
+    pub filter: Option<Arc<Filter>>,
+    // Допуски для float и числовых буферов.
+    pub floats: FloatTolerance,
+    // Собирать счетчики обхода в DeepDiff.stats.
+    pub stats: bool,
+    // Сообщать о медленных поддеревьях.
+    pub slow_subtree: Option<SlowSubtree>,
+}
+
+// Порог медленного поддерева по умолчанию, секунды.
+const DEFAULT_SLOW_THRESHOLD: f64 = 0.1;
+
+fn seconds(name: &str, value: &PyAny) -> PyResult<Duration> {
+    let value: f64 = value.extract()?;
+    if value >= 0.0 && value.is_finite() {
+        Ok(Duration::from_secs_f64(value))
+    } else {
+        Err(PyValueError::new_err(format!("{}: ожидалось неотрицательное число секунд", name)))
+    }
+}
+
+// Допуски сравнения чисел с плавающей точкой: atol и rtol как у
+// math.isclose (rtol — от нового значения), significant_digits — равенство
+// после округления до стольких знаков после запятой, как в deepdiff.
+#[derive(Debug, Clone, Copy, Default)]
+pub struct FloatTolerance {
+    pub atol: f64,
+    pub rtol: f64,
+    pub significant_digits: Option<i32>,
+}
+
+impl FloatTolerance {
+    pub fn eq(&self, a: f64, b: f64) -> bool {
+        if a == b {
+            return true;
+        }
+        if let Some(digits) = self.significant_digits {
+            let scale = 10f64.powi(digits);
+            if (a * scale).round() == (b * scale).round() {
+                return true;
+            }
+        }
+        (a - b).abs() <= self.atol + self.rtol * b.abs()
+    }
+}
+
+fn tolerance(name: &str, value: &PyAny) -> PyResult<f64> {
+    let value: f64 = value.extract()?;
+    if value >= 0.0 && value.is_finite() {
+        Ok(value)
+    } else {
+        Err(PyValueError::new_err(format!("{}: ожидалось неотрицательное число", name)))
+    }
+}
+
+impl DiffOptions {
+    pub fn from_kwargs(kwargs: Option<&PyDict>) -> PyResult<Self> {
+        let mut options = DiffOptions::default();
+        let kwargs = match kwargs {
+            Some(kwargs) => kwargs,
+            None => return Ok(options),
+        };
+        let mut spec = FilterSpec::default();
+        let mut slow_callback: Option<PyObject> = None;
+        let mut slow_threshold: Option<Duration> = None;
+        for (key, value) in kwargs.iter() {
+            let name = key.extract::<&str>()?;
+            if spec.set(name, value)? {
+                continue;
+            }
+            match name {
+                "use_hashes" => options.use_hashes = value.extract()?,
+                "parallelism" => options.parallelism = value.extract()?,
+                "align_lists" => options.align_lists = value.extract()?,
+                "ignore_order" => options.ignore_order = value.extract()?,
+                "report_repetition" => options.report_repetition = value.extract()?,
+                "group_by" if value.is_none() => options.group_by = None,
+                "group_by" => options.group_by = Some(GroupBy::extract(value)?),
+                "max_diffs" => options.max_diffs = value.extract()?,
+                "max_depth" => options.max_depth = value.extract()?,
+                "timeout" if value.is_none() => options.timeout = None,
+                "timeout" => options.timeout = Some(seconds(name, value)?),
+                "cancel" if value.is_none() => options.cancel = None,
+                "cancel" => options.cancel = Some(value.extract::<PyRef<'_, CancelToken>>()?.clone()),
+                "atol" => options.floats.atol = tolerance(name, value)?,
+                "rtol" => options.floats.rtol = tolerance(name, value)?,
+                "significant_digits" => {
+                    let digits: Option<u8> = value.extract()?;
+                    options.floats.significant_digits = digits.map(i32::from);
+                }
+                "stats" => options.stats = value.extract()?,
+                "on_slow_subtree" if value.is_none() => slow_callback = None,
+                "on_slow_subtree" if value.is_callable() => slow_callback = Some(value.into()),
+                "on_slow_subtree" => return Err(PyTypeError::new_err("on_slow_subtree: ожидалась функция")),
+                "slow_threshold" => slow_threshold = Some(seconds(name, value)?),
+                "path_filter" if value.is_none() => options.filter = None,
+                "path_filter" => options.filter = Some(value.extract::<PyRef<'_, PathFilter>>()?.filter.clone()),
+                name => return Err(PyTypeError::new_err(format!("Неизвестный параметр: {}", name))),
+            }
+        }
+        if !spec.is_empty() {
+            if options.filter.is_some() {
+                return Err(PyTypeError::new_err(
+                    "path_filter нельзя сочетать с exclude_paths, include_paths и шаблонами путей",
+                ));
+            }
+            options.filter = Some(Arc::new(spec.compile()?));
+        }
+        options.deadline = options.timeout.map(|timeout| Instant::now() + timeout);
+        options.slow_subtree = slow_callback.map(|callback| SlowSubtree {
+            callback,
+            threshold: slow_threshold.unwrap_or_else(|| Duration::from_secs_f64(DEFAULT_SLOW_THRESHOLD)),
+        });
+        Ok(options)
+    }
+
+    // Нужны ли хеши поддеревьев: для отсечения, выравнивания списков и
+    // сопоставления элементов без учета порядка.
+    pub fn hashing(&self) -> bool {
+        self.use_hashes || self.align_lists || self.ignore_order
+    }
+
+    // Без учета порядка равные списки должны иметь равные хеши; без
+    // report_repetition повторы элемента тоже не различаются.
+    pub fn list_hash(&self) -> ListHash {
+        match (self.ignore_order, self.report_repetition) {
+            (false, _) => ListHash::Ordered,
+            (true, true) => ListHash::Multiset,
+            (true, false) => ListHash::Set,
+        }
+    }
+
+    // Сравнивать снимки без GIL вместо обхода объектов Python.
+    pub fn native(&self) -> bool {
+        self.hashing() || self.parallelism.is_some() || self.group_by.is_some()
+    }
+
+    pub fn threads(&self) -> usize {
+        match self.parallelism {
+            Some(0) => std::thread::available_parallelism().map_or(1, |n| n.get()),
+            Some(n) => n,
+            None => 1,
+        }
+    }
+}
+
+// Как часто обход сверяется с часами и флагом отмены: Instant::now()
+// заметно дороже сравнения скаляров.
+const DEADLINE_CHECK_EVERY: u32 = 1024;
+
+// Ограничения одного обхода по max_diffs, max_depth, timeout и cancel. Обход,
+// упершийся в ограничение, помечает результат как усеченный.
+#[derive(Debug, Clone)]
+pub struct Budget {
+    max_diffs: Option<usize>,
+    max_depth: Option<usize>,
+    deadline: Option<Instant>,
+    cancel: Option<CancelToken>,
+    recorded: usize,
+    // Запись не взята: max_diffs исчерпан.
+    refused: bool,
+    visits: u32,
+    stopped: bool,
+    // В результате есть не все различия.
+    pub truncated: bool,
+    // Обход прерван по сроку.
+    pub expired: bool,
+    // Обход прерван через CancelToken.
+    pub cancelled: bool,
+}
+
+impl Budget {
+    pub fn new(options: &DiffOptions) -> Self {
+        Budget {
+            max_diffs: options.max_diffs,
+            max_depth: options.max_depth,
+            deadline: options.deadline,
+            cancel: options.cancel.clone(),
+            recorded: 0,
+            refused: false,
+            visits: 0,
+            stopped: false,
+            truncated: false,
+            expired: false,
+            cancelled: false,
+        }
+    }
+
+    // Место для еще одной записи; если его нет, обход прекращается.
+    pub fn take_record(&mut self) -> bool {
+        if self.stopped {
+            return false;
+        }
+        if self.max_diffs.map_or(false, |max| self.recorded >= max) {
+            self.refused = true;
+            self.stop();
+            return false;
+        }
+        self.recorded += 1;
+        true
+    }
+
+    // Проверка на каждом узле: true — обход прекращен. Первая сверка — на
+    // первом же узле, чтобы маленькие обходы после отмены не начинались.
+    pub fn stopped(&mut self) -> bool {
+        if !self.stopped && (self.deadline.is_some() || self.cancel.is_some()) {
+            self.visits = self.visits.wrapping_add(1);
+            if self.visits % DEADLINE_CHECK_EVERY == 1 {
+                self.poll();
+            }
+        }
+        self.stopped
+    }
+
+    // Сверка с отменой и сроком сейчас же, без счетчика посещений.
+    pub fn poll(&mut self) -> bool {
+        if !self.stopped {
+            if self.cancel.as_ref().map_or(false, CancelToken::is_cancelled) {
+                self.cancelled = true;
+                self.stop();
+            } else if self.deadline.map_or(false, |deadline| Instant::now() >= deadline) {
+                self.expired = true;
+                self.stop();
+            }
+        }
+        self.stopped
+    }
+
+    // Сколько записей обход взял или хотел взять: на одну больше
+    // max_diffs, если хоть одна не поместилась.
+    pub fn demand(&self) -> usize {
+        self.recorded + self.refused as usize
+    }
+
+    // Не больше max записей в этом обходе.
+    pub fn limit_records(&mut self, max: usize) {
+        self.max_diffs = Some(self.max_diffs.map_or(max, |limit| limit.min(max)));
+    }
+
+    pub fn stop(&mut self) {
+        self.stopped = true;
+        self.truncated = true;
+    }
+
+    // Контейнеры на этой глубине не обходятся.
+    pub fn too_deep(&self, depth: usize) -> bool {
+        self.max_depth.map_or(false, |max| depth >= max)
+    }
+}
@@ -0,0 +1,187 @@
+use std::sync::atomic::{AtomicUsize, Ordering};
+use std::sync::Mutex;
+use std::thread;
+
+
+use crate::node::{ListHash, Node};
+use crate::node_diff::{NodeChange, NodeDiffer};
+use crate::options::DiffOptions;
+
+// Сколько порций работы приходится на один поток: мелкие порции
+// выравнивают нагрузку, когда одни поддеревья заметно тяжелее других.
+const BATCHES_PER_THREAD: usize = 8;
+
+// Глубже этого уровня документ на задачи не разбивается: узкие и глубокие
+// цепочки контейнеров задач не прибавляют.
+const MAX_SPLIT_DEPTH: usize = 8;
+
+// Выполняет задачи на threads потоках. Свободный поток сам берет
+// следующую задачу из общей очереди; результат i-й задачи стоит на i-м
+// месте независимо от того, кто и когда ее выполнил.
+pub fn run_tasks<T, R, F>(tasks: Vec<T>, threads: usize, work: F) -> Vec<R>
+where
+    T: Send,
+    R: Send,
+    F: Fn(T) -> R + Sync,
+{
+    let count = tasks.len();
+    if threads <= 1 || count <= 1 {
+        return tasks.into_iter().map(work).collect();
+    }
+
+    let queue = Mutex::new(tasks.into_iter().enumerate());
+    let done: Vec<Vec<(usize, R)>> = thread::scope(|scope| {
+        let workers: Vec<_> = (0..threads.min(count))
+            .map(|_| {
+                scope.spawn(|| {
+                    let mut out = Vec::new();
+                    loop {
+                        let next = queue.lock().unwrap().next();
+                        match next {
+                            Some((i, task)) => out.push((i, work(task))),
+                            None => break,
+                        }
+                    }
+                    out
+                })
+            })
+            .collect();
+        workers
+            .into_iter()
+            .map(|w| w.join().unwrap_or_else(|e| std::panic::resume_unwind(e)))
+            .collect()
+    });
+
+    let mut results: Vec<Option<R>> = (0..count).map(|_| None).collect();
+    for (i, result) in done.into_iter().flatten() {
+        results[i] = Some(result);
+    }
+    results.into_iter().map(|r| r.expect("задача не выполнена")).collect()
+}
+
+// Хеширует снимки без GIL: поддеревья под корнями обрабатываются
+// параллельно, после чего хеши верхних узлов собираются из хешей детей.
+// Узлы с готовым хешем не пересчитываются (Node::fill_hash).
+pub fn hash_snapshots(roots: Vec<&mut Node>, threads: usize, lists: ListHash) {
+    hash_level(roots, 0, threads, lists);
+}
+
+// Уровень depth: если узлов на нем меньше, чем порций на все потоки, они
+// раскрываются в детей (например, у корня с одним ключом), иначе
+// хешируются параллельно целиком.
+fn hash_level(mut nodes: Vec<&mut Node>, depth: usize, threads: usize, lists: ListHash) {
+    let enough = nodes.len() >= threads * BATCHES_PER_THREAD || depth > MAX_SPLIT_DEPTH;
+    if depth > 0 && (enough || threads <= 1) {
+        let batch = batch_size(nodes.len(), threads);
+        run_tasks(nodes.chunks_mut(batch).collect(), threads, |batch| {
+            for node in batch.iter_mut() {
+                node.fill_hash(lists);
+            }
+        });
+        return;
+    }
+    let mut children = Vec::new();
+    for node in nodes.iter_mut().filter(|node| node.hash.is_none()) {
+        children.extend(node.children_mut());
+    }
+    if !children.is_empty() {
+        hash_level(children, depth + 1, threads, lists);
+    }
+    for node in nodes.into_iter().filter(|node| node.hash.is_none()) {
+        node.combine_hash(lists);
+    }
+}
+
+// Разбиение документа на задачи: верх документа до глубины depth
+// обходится сразу, а пары поддеревьев на ней остаются как Pending. Если
+// задач меньше, чем порций на все потоки, и их можно разбить, глубина
+// растет: так и корень с одним большим ключом занимает все потоки.
+fn split_nodes<'a>(old: &'a Node, new: &'a Node, threads: usize, options: &'a DiffOptions) -> NodeDiffer<'a> {
+    let mut depth = 1;
+    loop {
+        let mut root = NodeDiffer::split(options, depth);
+        root.compare_nodes(old, new);
+        let (tasks, divisible) = root.pending();
+        if tasks >= threads * BATCHES_PER_THREAD || !divisible || depth >= MAX_SPLIT_DEPTH {
+            root.count_tasks(tasks);
+            return root;
+        }
+        depth += 1;
+    }
+}
+
+// Сравнение двух снимков без GIL. Пары поддеревьев сравниваются
+// параллельно, а результаты собираются в порядке обычного обхода.
+pub fn diff_nodes<'a>(old: &'a Node, new: &'a Node, threads: usize, options: &'a DiffOptions) -> Vec<NodeChange<'a>> {
+    if threads <= 1 {
+        let mut differ = NodeDiffer::new(options);
+        differ.compare_nodes(old, new);
+        return differ.finish();
+    }
+
+    let root_changes = split_nodes(old, new, threads, options).finish();
+
+    let pending: Vec<_> = root_changes
+        .iter()
+        .filter_map(|change| match change {
+            NodeChange::Pending { path, old, new, ancestors } => Some((path.clone(), *old, *new, ancestors.clone())),
+            _ => None,
+        })
+        .collect();
+    let batch = batch_size(pending.len(), threads);
+    let batches: Vec<_> = pending.chunks(batch).map(<[_]>::to_vec).enumerate().collect();
+    // Сколько записей взяли или хотели взять (Budget::demand) законченные
+    // задачи каждой порции. Порции раздаются по порядку, поэтому сумма по
+    // порциям до текущей включительно — нижняя оценка записей, которые в
+    // результате стоят раньше задачи.
+    let demand: Vec<AtomicUsize> = (0..batches.len()).map(|_| AtomicUsize::new(0)).collect();
+    let mut results = run_tasks(batches, threads, |(b, batch)| {
+        batch
+            .into_iter()
+            .map(|(path, old, new, ancestors)| {
+                let mut differ = NodeDiffer::with_path(path, ancestors, options);
+                // Срок и отмена общие для всех задач и проверяются до начала
+                // каждой: иначе задача на широком и мелком документе не
+                // доходит до очередной проверки в обходе.
+                if differ.budget.poll() {
+                    return differ.finish();
+                }
+                if let Some(max) = options.max_diffs {
+                    let before: usize = demand[..=b].iter().map(|d| d.load(Ordering::Relaxed)).sum();
+                    if before > max {
+                        // Записи задач раньше уже заполнили результат.
+                        differ.budget.stop();
+                        return differ.finish();
+                    }
+                    differ.budget.limit_records(max - before);
+                }
+                differ.compare_nodes(old, new);
+                demand[b].fetch_add(differ.budget.demand(), Ordering::Relaxed);
+                differ.finish()
+            })
+            .collect::<Vec<_>>()
+    })
+    .into_iter()
+    .flatten();
+
+    let mut changes = Vec::new();
+    for change in root_changes {
+        match change {
+            NodeChange::Pending { .. } => changes.extend(results.next().expect("нет результата для поддерева")),
+            change => changes.push(change),
+        }
+    }
+    changes
+}
+
+pub fn diff_snapshots<'a>(old: &'a mut Node, new: &'a mut Node, options: &'a DiffOptions) -> Vec<NodeChange<'a>> {
+    let threads = options.threads();
+    if options.hashing() {
+        hash_snapshots(vec![&mut *old, &mut *new], threads, options.list_hash());
+    }
+    diff_nodes(old, new, threads, options)
+}
+
+fn batch_size(len: usize, threads: usize) -> usize {
+    (len / (threads.max(1) * BATCHES_PER_THREAD)).max(1)
+}
@@ -0,0 +1,155 @@
+use std::sync::Arc;
+
+// Компонент пути. Тип ключа параметризован: при обходе в стеке лежат
+// заимствованные ключи, а в записях результата — владеющие.
+#[derive(Debug, Clone, PartialEq)]
+pub enum PathComponent<K = String> {
+    Key(K),
+    Index(usize),
+    // Атрибут объекта: root.name.
+    Attr(K),
+    // Запись списка, сопоставленная по полю group_by, и значение ключа:
+    // root['users'][id=42], чтобы не спутать с индексом.
+    Group(Arc<str>, K),
+}
+
+impl<K> PathComponent<K> {
+    pub fn map_key<T>(&self, f: impl FnOnce(&K) -> T) -> PathComponent<T> {
+        match self {
+            PathComponent::Key(key) => PathComponent::Key(f(key)),
+            PathComponent::Index(idx) => PathComponent::Index(*idx),
+            PathComponent::Attr(name) => PathComponent::Attr(f(name)),
+            PathComponent::Group(field, key) => PathComponent::Group(field.clone(), f(key)),
+        }
+    }
+}
+
+// Владеющая копия пути: делается только для узлов, давших запись.
+pub fn to_owned_path<K: AsRef<str>>(path: &[PathComponent<K>]) -> Vec<PathComponent> {
+    path.iter()
+        .map(|component| component.map_key(|key| key.as_ref().to_string()))
+        .collect()
+}
+
+// Строка в одинарных кавычках; ' и \ экранируются обратной косой чертой,
+// как в repr(), иначе ключ a']['b не отличить от двух вложенных ключей.
+pub fn push_quoted(result: &mut String, s: &str) {
+    result.push('\'');
+    if !s.contains(['\'', '\\']) {
+        result.push_str(s);
+        result.push('\'');
+        return;
+    }
+    for c in s.chars() {
+        if c == '\'' || c == '\\' {
+            result.push('\\');
+        }
+        result.push(c);
+    }
+    result.push('\'');
+}
+
+pub fn push_key(result: &mut String, key: &str) {
+    result.push('[');
+    push_quoted(result, key);
+    result.push(']');
+}
+
+pub fn push_index(result: &mut String, idx: usize) {
+    result.push('[');
+    result.push_str(&idx.to_string());
+    result.push(']');
+}
+
+pub fn push_attr(result: &mut String, name: &str) {
+    result.push('.');
+    result.push_str(name);
+}
+
+// Текст компонента group_by без скобок: id=42 или name='bob'. Строковый
+// ключ берется в кавычки, иначе '42' и 42 не различить.
+pub fn group_text(field: &str, key: &str, quoted: bool) -> String {
+    if quoted {
+        let mut text = format!("{}=", field);
+        push_quoted(&mut text, key);
+        text
+    } else {
+        format!("{}={}", field, key)
+    }
+}
+
+pub fn push_group(result: &mut String, text: &str) {
+    result.push('[');
+    result.push_str(text);
+    result.push(']');
+}
+
+pub fn format_path<K: AsRef<str>>(path: &[PathComponent<K>]) -> String {
+    let mut result = String::from("root");
+
+    for component in path {
+        match component {
+            PathComponent::Key(key) => push_key(&mut result, key.as_ref()),
+            PathComponent::Index(idx) => push_index(&mut result, *idx),
+            PathComponent::Attr(name) => push_attr(&mut result, name.as_ref()),
+            PathComponent::Group(field, key) => push_group(&mut result, &group_text(field, key.as_ref(), false)),
+        }
+    }
+
+    result
+}
+
+// Ключ из push_key без открывающих [' и длина разобранного вместе с
+// закрывающими '].
+fn unquote(tail: &str) -> Option<(String, usize)> {
+    let mut key = String::new();
+    let mut chars = tail.char_indices();
+    while let Some((i, c)) = chars.next() {
+        match c {
+            '\\' => key.push(chars.next()?.1),
+            '\'' => return tail[i + 1..].starts_with(']').then(|| (key, i + 2)),
+            c => key.push(c),
+        }
+    }
+    None
+}
+
+// Разбирает путь вида root['key'][0].attr обратно в компоненты.
+// Нераспознанный хвост строки игнорируется. .name читается как атрибут;
+// старый вид root.key[0], где .key — ключ словаря, фильтр понимает и так
+// (см. Filter::step).
+pub fn parse_path(path_str: &str) -> Vec<PathComponent> {
+    let mut components = Vec::new();
+    let mut rest = path_str.strip_prefix("root").unwrap_or(path_str);
+
+    while !rest.is_empty() {
+        if let Some(tail) = rest.strip_prefix("['") {
+            match unquote(tail) {
+                Some((key, end)) => {
+                    components.push(PathComponent::Key(key));
+                    rest = &tail[end..];
+                }
+                None => break,
+            }
+        } else if let Some(tail) = rest.strip_prefix('[') {
+            let end = match tail.find(']') {
+                Some(end) => end,
+                None => break,
+            };
+            let inner = &tail[..end];
+            match inner.parse::<usize>() {
+                Ok(idx) => components.push(PathComponent::Index(idx)),
+                Err(_) => components.push(PathComponent::Key(inner.trim_matches('"').to_string())),
+            }
+            rest = &tail[end + 1..];
+        } else if let Some(tail) = rest.strip_prefix('.') {
+            let end = tail.find(|c| c == '.' || c == '[').unwrap_or(tail.len());
+            components.push(PathComponent::Attr(tail[..end].to_string()));
+            rest = &tail[end..];
+        } else {
+            break;
+        }
+    }
+
+    components
+}
@@ -0,0 +1,575 @@
+use pyo3::exceptions::{PyKeyError, PyValueError};
+use pyo3::prelude::*;
+use pyo3::types::{PyBytes, PyDict, PyList, PyString, PyTuple};
+
+use crate::convert::json_to_py;
+use crate::json_diff;
+use crate::json_out::{self, Fallback};
+use crate::path::{group_text, push_attr, push_group, push_index, push_key, PathComponent};
+use crate::stats::Stats;
+
+#[derive(Debug, Clone, Copy, PartialEq, Eq)]
+pub enum Category {
+    ValuesChanged,
+    TypeChanges,
+    DictionaryItemAdded,
+    DictionaryItemRemoved,
+    IterableItemAdded,
+    IterableItemRemoved,
+    IterableItemMoved,
+    RepetitionChange,
+    SetItemAdded,
+    SetItemRemoved,
+    AttributeAdded,
+    AttributeRemoved,
+}
+
+impl Category {
+    pub const ALL: [Category; 12] = [
+        Category::ValuesChanged,
+        Category::TypeChanges,
+        Category::DictionaryItemAdded,
+        Category::DictionaryItemRemoved,
+        Category::IterableItemAdded,
+        Category::IterableItemRemoved,
+        Category::IterableItemMoved,
+        Category::RepetitionChange,
+        Category::SetItemAdded,
+        Category::SetItemRemoved,
+        Category::AttributeAdded,
+        Category::AttributeRemoved,
+    ];
+
+    pub fn name(self) -> &'static str {
+        match self {
+            Category::ValuesChanged => "values_changed",
+            Category::TypeChanges => "type_changes",
+            Category::DictionaryItemAdded => "dictionary_item_added",
+            Category::DictionaryItemRemoved => "dictionary_item_removed",
+            Category::IterableItemAdded => "iterable_item_added",
+            Category::IterableItemRemoved => "iterable_item_removed",
+            Category::IterableItemMoved => "iterable_item_moved",
+            Category::RepetitionChange => "repetition_change",
+            Category::SetItemAdded => "set_item_added",
+            Category::SetItemRemoved => "set_item_removed",
+            Category::AttributeAdded => "attribute_added",
+            Category::AttributeRemoved => "attribute_removed",
+        }
+    }
+
+    pub fn from_name(name: &str) -> Option<Category> {
+        Category::ALL.iter().copied().find(|c| c.name() == name)
+    }
+}
+
+// Значение внутри записи: исходный объект Python либо значение JSON,
+// которое превращается в объект Python только при обращении.
+pub enum ChangeValue {
+    Py(PyObject),
+    Json(serde_json::Value),
+}
+
+impl ChangeValue {
+    pub fn to_object(&self, py: Python) -> PyObject {
+        match self {
+            ChangeValue::Py(obj) => obj.clone_ref(py),
+            ChangeValue::Json(value) => json_to_py(py, value),
+        }
+    }
+
+    pub fn type_name(&self, py: Python) -> PyResult<String> {
+        match self {
+            ChangeValue::Py(obj) => Ok(obj.as_ref(py).get_type().name()?.to_string()),
+            ChangeValue::Json(value) => Ok(json_diff::type_name(value).to_string()),
+        }
+    }
+}
+
+// Ключ в пути записи: строка из JSON либо исходный ключ словаря Python.
+pub enum PathKey {
+    Str(String),
+    Py(PyObject),
+}
+
+impl PathKey {
+    pub fn to_object(&self, py: Python) -> PyObject {
+        match self {
+            PathKey::Str(s) => s.as_str().into_py(py),
+            PathKey::Py(obj) => obj.clone_ref(py),
+        }
+    }
+}
+
+pub type ChangePath = Vec<PathComponent<PathKey>>;
+
+// Строка пути в виде root['key'][0]: строковые ключи в кавычках,
+// остальные — через repr(), как в deepdiff.
+pub fn format_change_path(py: Python, path: &[PathComponent<PathKey>]) -> PyResult<String> {
+    let mut result = String::from("root");
+    for component in path {
+        match component {
+            PathComponent::Key(PathKey::Str(key)) => push_key(&mut result, key),
+            PathComponent::Key(PathKey::Py(obj)) => {
+                let obj = obj.as_ref(py);
+                if let Ok(key) = obj.downcast::<PyString>() {
+                    push_key(&mut result, key.to_str()?);
+                } else {
+                    result.push('[');
+                    result.push_str(obj.repr()?.to_str()?);
+                    result.push(']');
+                }
+            }
+            PathComponent::Index(idx) => push_index(&mut result, *idx),
+            PathComponent::Attr(PathKey::Str(name)) => push_attr(&mut result, name),
+            PathComponent::Attr(PathKey::Py(name)) => push_attr(&mut result, name.as_ref(py).str()?.to_str()?),
+            PathComponent::Group(field, PathKey::Str(key)) => push_group(&mut result, &group_text(field, key, true)),
+            PathComponent::Group(field, PathKey::Py(key)) => {
+                let key = key.as_ref(py);
+                let text = match key.downcast::<PyString>() {
+                    Ok(key) => group_text(field, key.to_str()?, true),
+                    Err(_) => group_text(field, key.str()?.to_str()?, false),
+                };
+                push_group(&mut result, &text);
+            }
+        }
+    }
+    Ok(result)
+}
+
+// Путь кортежем из исходных ключей и индексов, без сборки строки.
+fn change_path_tuple(py: Python, path: &[PathComponent<PathKey>]) -> PyObject {
+    let items: Vec<PyObject> = path
+        .iter()
+        .map(|component| match component {
+            PathComponent::Key(key) | PathComponent::Attr(key) => key.to_object(py),
+            PathComponent::Index(idx) => idx.into_py(py),
+            // Запись group_by — парой (поле, ключ), а не индексом.
+            PathComponent::Group(field, key) => (&**field, key.to_object(py)).into_py(py),
+        })
+        .collect();
+    PyTuple::new(py, items).into()
+}
+
+// Дополнительные сведения записей, у которых есть не только значения.
+pub enum Detail {
+    None,
+    // Новое место элемента для iterable_item_moved.
+    Moved(ChangePath),
+    // Позиции повторов элемента для repetition_change.
+    Repetition { old_indexes: Vec<usize>, new_indexes: Vec<usize> },
+}
+
+pub struct Change {
+    pub path: ChangePath,
+    pub old: Option<ChangeValue>,
+    pub new: Option<ChangeValue>,
+    pub detail: Detail,
+}
+
+fn path_object(py: Python, path: &[PathComponent<PathKey>], structured: bool) -> PyResult<PyObject> {
+    if structured {
+        Ok(change_path_tuple(py, path))
+    } else {
+        Ok(format_change_path(py, path)?.into_py(py))
+    }
+}
+
+impl Change {
+    fn path_object(&self, py: Python, structured: bool) -> PyResult<PyObject> {
+        path_object(py, &self.path, structured)
+    }
+
+    // Значение записи в том виде, в каком оно лежит в to_dict().
+    fn payload(&self, py: Python, category: Category, structured: bool) -> PyResult<PyObject> {
+        match (&self.detail, &self.old) {
+            (Detail::Moved(new_path), Some(value)) => {
+                let change = PyDict::new(py);
+                change.set_item("new_path", path_object(py, new_path, structured)?)?;
+                change.set_item("value", value.to_object(py))?;
+                return Ok(change.into());
+            }
+            (Detail::Repetition { old_indexes, new_indexes }, Some(value)) => {
+                let change = PyDict::new(py);
+                change.set_item("old_repeat", old_indexes.len())?;
+                change.set_item("new_repeat", new_indexes.len())?;
+                change.set_item("old_indexes", old_indexes.clone())?;
+                change.set_item("new_indexes", new_indexes.clone())?;
+                change.set_item("value", value.to_object(py))?;
+                return Ok(change.into());
+            }
+            _ => {}
+        }
+        match (&self.old, &self.new) {
+            (Some(old), Some(new)) => {
+                let change = PyDict::new(py);
+                if category == Category::TypeChanges {
+                    change.set_item("old_type", old.type_name(py)?)?;
+                    change.set_item("new_type", new.type_name(py)?)?;
+                }
+                change.set_item("old_value", old.to_object(py))?;
+                change.set_item("new_value", new.to_object(py))?;
+                Ok(change.into())
+            }
+            (Some(value), None) | (None, Some(value)) => Ok(value.to_object(py)),
+            (None, None) => Ok(py.None()),
+        }
+    }
+}
+
+// Результат сравнения. Изменения хранятся компактными записями по
+// категориям, а объекты Python создаются только при обращении к ним.
+#[pyclass]
+#[derive(Default)]
+pub struct DeepDiff {
+    changes: [Vec<Change>; 12],
+    // Списки сравнивались без учета порядка: индексы в путях не задают
+    // позиций элементов.
+    pub unordered: bool,
+    // Обход остановлен по max_diffs, max_depth, timeout или cancel.
+    pub truncated: bool,
+    // Пути, на которых обход встретил цикл ссылок и не пошел по нему
+    // второй раз.
+    pub cycles: Vec<ChangePath>,
+    // Счетчики обхода при stats=True.
+    pub stats: Option<Stats>,
+}
+
+impl DeepDiff {
+    pub fn push(&mut self, category: Category, change: Change) {
+        self.changes[category as usize].push(change);
+    }
+
+    pub fn record(&mut self, category: Category, path: ChangePath, old: Option<ChangeValue>, new: Option<ChangeValue>) {
+        self.push(
+            category,
+            Change {
+                path,
+                old,
+                new,
+                detail: Detail::None,
+            },
+        );
+    }
+
+    // Элемент, переехавший внутри списка с path на new_path.
+    pub fn record_move(&mut self, path: ChangePath, new_path: ChangePath, value: ChangeValue) {
+        self.push(
+            Category::IterableItemMoved,
+            Change {
+                path,
+                old: Some(value),
+                new: None,
+                detail: Detail::Moved(new_path),
+            },
+        );
+    }
+
+    // Элемент, число повторов которого в списке изменилось.
+    pub fn record_repetition(
+        &mut self,
+        path: ChangePath,
+        value: ChangeValue,
+        old_indexes: Vec<usize>,
+        new_indexes: Vec<usize>,
+    ) {
+        self.push(
+            Category::RepetitionChange,
+            Change {
+                path,
+                old: Some(value),
+                new: None,
+                detail: Detail::Repetition { old_indexes, new_indexes },
+            },
+        );
+    }
+
+    pub fn entries(&self, category: Category) -> &[Change] {
+        &self.changes[category as usize]
+    }
+
+    fn category(name: &str) -> PyResult<Category> {
+        Category::from_name(name)
+            .ok_or_else(|| PyValueError::new_err(format!("Неизвестная категория: {}", name)))
+    }
+
+    fn present(&self) -> impl Iterator<Item = Category> + '_ {
+        Category::ALL
+            .iter()
+            .copied()
+            .filter(move |c| !self.entries(*c).is_empty())
+    }
+
+    fn category_dict(&self, py: Python, category: Category, structured: bool) -> PyResult<PyObject> {
+        let dict = PyDict::new(py);
+        for change in self.entries(category) {
+            dict.set_item(change.path_object(py, structured)?, change.payload(py, category, structured)?)?;
+        }
+        Ok(dict.into())
+    }
+}
+
+fn json_path(path: Vec<PathComponent>) -> ChangePath {
+    path.into_iter()
+        .map(|component| match component {
+            PathComponent::Key(key) => PathComponent::Key(PathKey::Str(key)),
+            PathComponent::Index(idx) => PathComponent::Index(idx),
+            PathComponent::Attr(name) => PathComponent::Attr(PathKey::Str(name)),
+            PathComponent::Group(field, key) => PathComponent::Group(field, PathKey::Str(key)),
+        })
+        .collect()
+}
+
+impl From<json_diff::Diff> for DeepDiff {
+    fn from(diff: json_diff::Diff) -> Self {
+        let mut result = DeepDiff::default();
+        result.truncated = diff.truncated;
+        let pairs = [
+            (Category::ValuesChanged, diff.values_changed),
+            (Category::TypeChanges, diff.type_changes),
+        ];
+        for (category, entries) in pairs {
+            for (path, (old, new)) in entries {
+                result.record(category, json_path(path), Some(ChangeValue::Json(old)), Some(ChangeValue::Json(new)));
+            }
+        }
+        for (path, value) in diff.dictionary_item_added {
+            result.record(Category::DictionaryItemAdded, json_path(path), None, Some(ChangeValue::Json(value)));
+        }
+        for (path, value) in diff.dictionary_item_removed {
+            result.record(Category::DictionaryItemRemoved, json_path(path), Some(ChangeValue::Json(value)), None);
+        }
+        for (path, value) in diff.iterable_item_added {
+            result.record(Category::IterableItemAdded, json_path(path), None, Some(ChangeValue::Json(value)));
+        }
+        for (path, value) in diff.iterable_item_removed {
+            result.record(Category::IterableItemRemoved, json_path(path), Some(ChangeValue::Json(value)), None);
+        }
+        result
+    }
+}
+
+#[pymethods]
+impl DeepDiff {
+    #[new]
+    fn new() -> Self {
+        DeepDiff::default()
+    }
+
+    fn __len__(&self) -> usize {
+        self.changes.iter().map(Vec::len).sum()
+    }
+
+    fn __bool__(&self) -> bool {
+        self.changes.iter().any(|c| !c.is_empty())
+    }
+
+    fn __contains__(&self, category: &str) -> bool {
+        Category::from_name(category).map_or(false, |c| !self.entries(c).is_empty())
+    }
+
+    fn __getitem__(&self, py: Python, category: &str) -> PyResult<PyObject> {
+        match Category::from_name(category) {
+            Some(c) if !self.entries(c).is_empty() => self.category_dict(py, c, false),
+            _ => Err(PyKeyError::new_err(category.to_string())),
+        }
+    }
+
+    fn __iter__(&self, py: Python) -> PyResult<PyObject> {
+        let keys = self.keys(py);
+        let keys: &PyAny = keys.as_ref(py);
+        Ok(keys.iter()?.into())
+    }
+
+    fn __repr__(&self) -> String {
+        let mut counts: Vec<String> = self
+            .present()
+            .map(|c| format!("{}={}", c.name(), self.entries(c).len()))
+            .collect();
+        if self.truncated {
+            counts.push("truncated=True".to_string());
+        }
+        if !self.cycles.is_empty() {
+            counts.push(format!("cycles={}", self.cycles.len()));
+        }
+        format!("DeepDiff({})", counts.join(", "))
+    }
+
+    // Обход остановлен раньше времени, и записей может быть больше.
+    #[getter(truncated)]
+    fn is_truncated(&self) -> bool {
+        self.truncated
+    }
+
+    // Пути контейнеров, которые ссылаются на самих себя (или пара которых
+    // уже сравнивается выше по пути): там обход остановился, чтобы не
+    // зациклиться. Различия внутри цикла сообщены при первом проходе.
+    #[getter]
+    fn cycles(&self, py: Python) -> PyResult<Py<PyList>> {
+        let paths = self
+            .cycles
+            .iter()
+            .map(|path| format_change_path(py, path))
+            .collect::<PyResult<Vec<_>>>()?;
+        Ok(PyList::new(py, paths).into())
+    }
+
+    // Счетчики обхода словарем или None, если сравнение шло без stats=True.
+    #[getter]
+    fn stats(&self, py: Python) -> PyResult<Option<PyObject>> {
+        self.stats.as_ref().map(|stats| stats.to_object(py)).transpose()
+    }
+
+    // Имена непустых категорий, как у словаря из to_dict().
+    fn keys(&self, py: Python) -> Py<PyList> {
+        let names: Vec<&str> = self.present().map(Category::name).collect();
+        PyList::new(py, names).into()
+    }
+
+    // Количество записей в категории без создания объектов Python.
+    fn count(&self, category: &str) -> PyResult<usize> {
+        Ok(self.entries(Self::category(category)?).len())
+    }
+
+    // Ленивый обход категории: пары (путь, значение) создаются по одной.
+    // При structured_paths=True путь отдается кортежем ключей и индексов.
+    #[pyo3(signature = (category, structured_paths=false))]
+    fn iter_category(slf: PyRef<'_, Self>, category: &str, structured_paths: bool) -> PyResult<ChangeIter> {
+        let category = Self::category(category)?;
+        Ok(ChangeIter {
+            diff: slf.into(),
+            category,
+            index: 0,
+            structured: structured_paths,
+        })
+    }
+
+    #[pyo3(signature = (structured_paths=false))]
+    fn to_dict(&self, py: Python, structured_paths: bool) -> PyResult<PyObject> {
+        let result = PyDict::new(py);
+        for category in self.present() {
+            result.set_item(category.name(), self.category_dict(py, category, structured_paths)?)?;
+        }
+        Ok(result.into())
+    }
+
+    // JSON того же вида, что json.dumps(to_dict()), прямо из записей:
+    // значения снимаются с GIL, байты собираются без него. lines=True —
+    // JSON Lines, по записи на строку. default — что писать вместо значений
+    // не для JSON: 'repr' (по умолчанию), 'str', 'error' или функция.
+    #[pyo3(signature = (lines=false, default=None))]
+    fn to_json(&self, py: Python, lines: bool, default: Option<&PyAny>) -> PyResult<Py<PyBytes>> {
+        let fallback = Fallback::extract(default)?;
+        let entries = json_out::collect(py, self, &fallback)?;
+        let mut buffer = Vec::new();
+        py.allow_threads(|| json_out::write(&mut buffer, &entries, lines))?;
+        Ok(PyBytes::new(py, &buffer).into())
+    }
+
+    // То же, что to_json(), но в файл: дескриптор или файл с fileno()
+    // пишутся без GIL, прочие объекты получают байты через write().
+    #[pyo3(signature = (file, lines=false, default=None))]
+    fn write_json(&self, py: Python, file: &PyAny, lines: bool, default: Option<&PyAny>) -> PyResult<()> {
+        let fallback = Fallback::extract(default)?;
+        let entries = json_out::collect(py, self, &fallback)?;
+        if let Some(fd) = json_out::descriptor(file)? {
+            py.allow_threads(|| json_out::write_fd(fd, &entries, lines))?;
+            return Ok(());
+        }
+        let mut buffer = Vec::new();
+        py.allow_threads(|| json_out::write(&mut buffer, &entries, lines))?;
+        json_out::write_file(file, &buffer)
+    }
+
+    #[getter]
+    fn values_changed(&self, py: Python) -> PyResult<PyObject> {
+        self.category_dict(py, Category::ValuesChanged, false)
+    }
+
+    #[getter]
+    fn type_changes(&self, py: Python) -> PyResult<PyObject> {
+        self.category_dict(py, Category::TypeChanges, false)
+    }
+
+    #[getter]
+    fn dictionary_item_added(&self, py: Python) -> PyResult<PyObject> {
+        self.category_dict(py, Category::DictionaryItemAdded, false)
+    }
+
+    #[getter]
+    fn dictionary_item_removed(&self, py: Python) -> PyResult<PyObject> {
+        self.category_dict(py, Category::DictionaryItemRemoved, false)
+    }
+
+    #[getter]
+    fn iterable_item_added(&self, py: Python) -> PyResult<PyObject> {
+        self.category_dict(py, Category::IterableItemAdded, false)
+    }
+
+    #[getter]
+    fn iterable_item_removed(&self, py: Python) -> PyResult<PyObject> {
+        self.category_dict(py, Category::IterableItemRemoved, false)
+    }
+
+    #[getter]
+    fn iterable_item_moved(&self, py: Python) -> PyResult<PyObject> {
+        self.category_dict(py, Category::IterableItemMoved, false)
+    }
+
+    #[getter]
+    fn repetition_change(&self, py: Python) -> PyResult<PyObject> {
+        self.category_dict(py, Category::RepetitionChange, false)
+    }
+
+    #[getter]
+    fn set_item_added(&self, py: Python) -> PyResult<PyObject> {
+        self.category_dict(py, Category::SetItemAdded, false)
+    }
+
+    #[getter]
+    fn set_item_removed(&self, py: Python) -> PyResult<PyObject> {
+        self.category_dict(py, Category::SetItemRemoved, false)
+    }
+
+    #[getter]
+    fn attribute_added(&self, py: Python) -> PyResult<PyObject> {
+        self.category_dict(py, Category::AttributeAdded, false)
+    }
+
+    #[getter]
+    fn attribute_removed(&self, py: Python) -> PyResult<PyObject> {
+        self.category_dict(py, Category::AttributeRemoved, false)
+    }
+}
+
+#[pyclass]
+pub struct ChangeIter {
+    diff: Py<DeepDiff>,
+    category: Category,
+    index: usize,
+    structured: bool,
+}
+
+#[pymethods]
+impl ChangeIter {
+    fn __iter__(slf: PyRef<'_, Self>) -> PyRef<'_, Self> {
+        slf
+    }
+
+    fn __next__(mut slf: PyRefMut<'_, Self>, py: Python) -> PyResult<Option<PyObject>> {
+        let item = {
+            let diff = slf.diff.borrow(py);
+            match diff.entries(slf.category).get(slf.index) {
+                Some(change) => Some(
+                    (
+                        change.path_object(py, slf.structured)?,
+                        change.payload(py, slf.category, slf.structured)?,
+                    )
+                        .into_py(py),
+                ),
+                None => None,
+            }
+        };
+        slf.index += 1;
+        Ok(item)
+    }
+}
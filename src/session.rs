@@ -0,0 +1,128 @@
+use std::time::Instant;
+
+use pyo3::exceptions::PyValueError;
+use pyo3::prelude::*;
+use pyo3::types::PyDict;
+
+use crate::node::Node;
+use crate::options::DiffOptions;
+use crate::parallel;
+use crate::result::DeepDiff;
+use crate::walker::Walker;
+
+// Сравнение очередных версий одного объекта с живым исходным. Снимок
+// baseline и хеши его поддеревьев строятся один раз и переживают вызовы:
+// diff(new) снимает и хеширует только те части new, что не являются теми
+// же объектами, что в baseline, а обход спускается лишь в поддеревья с
+// разными хешами, так что записи и работа с Python пропорциональны
+// изменению. advance() принимает версию, уже снятую
+// diff(), без повторного снимка.
+//
+// Сессия держит ссылки на объекты baseline, и записи ссылаются на них:
+// новые версии передаются новыми объектами, а не правкой прежних на месте.
+// Исключение — сам корень: тот же объект, что baseline, снимается заново
+// целиком, так что правка корня на месте видна в diff(). Вложенные
+// объекты, общие с baseline, по-прежнему считаются неизменными.
+#[pyclass]
+pub struct DiffSession {
+    baseline: Node,
+    // Снимок из последнего diff() для advance() без аргумента.
+    pending: Option<Node>,
+    options: DiffOptions,
+}
+
+impl DiffSession {
+    // Параметры одного сравнения: срок timeout отсчитывается от вызова.
+    fn run_options(&self) -> DiffOptions {
+        let mut options = self.options.clone();
+        options.deadline = options.timeout.map(|timeout| Instant::now() + timeout);
+        options
+    }
+}
+
+// Снимок с хешами поддеревьев. Поддеревья, общие с base (тот же объект
+// на том же месте), берутся из base готовыми, с хешами: снимаются и
+// хешируются только изменившиеся части. Корень, совпавший с корнем base,
+// могли править на месте, и он снимается заново.
+fn hashed_snapshot(py: Python, obj: &PyAny, base: Option<&Node>, options: &DiffOptions) -> PyResult<Node> {
+    let mut node = match base {
+        Some(base) if !base.obj.as_ref(py).is(obj) => Node::snapshot_reusing(obj, base)?,
+        _ => Node::snapshot(obj)?,
+    };
+    let (root, threads, lists) = (&mut node, options.threads(), options.list_hash());
+    py.allow_threads(move || parallel::hash_snapshots(vec![root], threads, lists));
+    Ok(node)
+}
+
+#[pymethods]
+impl DiffSession {
+    // Параметры те же, что у compare(); use_hashes включен всегда, на нем
+    // держится отсечение равных поддеревьев.
+    #[new]
+    #[pyo3(signature = (baseline, **options))]
+    fn new(py: Python, baseline: &PyAny, options: Option<&PyDict>) -> PyResult<Self> {
+        let mut options = DiffOptions::from_kwargs(options)?;
+        options.use_hashes = true;
+        Ok(DiffSession {
+            baseline: hashed_snapshot(py, baseline, None, &options)?,
+            pending: None,
+            options,
+        })
+    }
+
+    // Исходный объект, с которым сравниваются версии.
+    #[getter]
+    fn baseline(&self, py: Python) -> PyObject {
+        self.baseline.obj.clone_ref(py)
+    }
+
+    // Хеш baseline (при ignore_order — без учета порядка списков); None —
+    // в нем есть NaN или значения неподдерживаемых типов.
+    #[getter]
+    fn fingerprint(&self) -> Option<u64> {
+        self.baseline.hash
+    }
+
+    // Разница между baseline и new. Снимок new запоминается для advance().
+    fn diff(&mut self, py: Python, new: &PyAny) -> PyResult<DeepDiff> {
+        let options = self.run_options();
+        let started = Instant::now();
+        let node = hashed_snapshot(py, new, Some(&self.baseline), &options)?;
+        let converted = Instant::now();
+
+        let mut walker = Walker::new(py, &options);
+        let (old, candidate, threads) = (&self.baseline, &node, options.threads());
+        let changes = py.allow_threads(|| parallel::diff_nodes(old, candidate, threads, &options));
+        let diffed = Instant::now();
+        let deferred = walker.stats.as_ref().map(|stats| stats.traversal).unwrap_or_default();
+        walker.merge_node_changes(changes)?;
+        if let Some(stats) = &mut walker.stats {
+            let deferred = stats.traversal - deferred;
+            stats.conversion += converted - started;
+            stats.traversal += diffed - converted;
+            stats.materialization += diffed.elapsed().saturating_sub(deferred);
+        }
+
+        self.pending = Some(node);
+        Ok(walker.finish())
+    }
+
+    // Делает new новым baseline. Без аргумента берется версия из
+    // последнего diff(), и снимок не строится заново.
+    #[pyo3(signature = (new=None))]
+    fn advance(&mut self, py: Python, new: Option<&PyAny>) -> PyResult<()> {
+        self.baseline = match (new, self.pending.take()) {
+            (Some(new), _) => hashed_snapshot(py, new, Some(&self.baseline), &self.options)?,
+            (None, Some(pending)) => pending,
+            (None, None) => {
+                return Err(PyValueError::new_err("advance(): нет версии из diff(), передайте объект явно"))
+            }
+        };
+        Ok(())
+    }
+
+    fn __repr__(&self, py: Python) -> PyResult<String> {
+        let baseline = self.baseline.obj.as_ref(py).get_type().name()?.to_string();
+        Ok(format!("DiffSession(baseline={}, pending={})", baseline, self.pending.is_some()))
+    }
+}
@@ -0,0 +1,681 @@
+use std::collections::HashMap;
+use std::fs::File;
+use std::ops::Deref;
+use std::path::Path;
+
+use memmap2::Mmap;
+use pyo3::exceptions::{PyTypeError, PyValueError};
+use pyo3::prelude::*;
+use pyo3::types::{PyBytes, PyDict, PyList, PyLong, PyTuple};
+use serde_json::Value;
+
+use crate::filter::{Cursor, Filter, Step};
+use crate::json_diff;
+use crate::node::{self, Kind, ListHash, Node};
+use crate::options::{Budget, DiffOptions, FloatTolerance};
+use crate::path::PathComponent;
+use crate::result::{Category, ChangePath, ChangeValue, DeepDiff, PathKey};
+
+// Файл снимка. Заголовок: MAGIC, версия, три зарезервированных байта и
+// длина файла. Дальше корневой узел: метка, флаги, хеш поддерева и
+// данные — скаляр фиксированной длины, длина и байты строки или bytes,
+// у контейнера — число детей, длина тела в байтах и дети подряд (у
+// словаря — ключ, значение). По длине тела равное поддерево пропускается
+// без чтения. Все числа — little-endian.
+const MAGIC: &[u8; 4] = b"RDDS";
+const FORMAT_VERSION: u8 = 1;
+const HEADER_LEN: usize = 16;
+
+const HAS_HASH: u8 = 1;
+
+mod tag {
+    pub const NONE: u8 = 0;
+    pub const FALSE: u8 = 1;
+    pub const TRUE: u8 = 2;
+    pub const INT: u8 = 3;
+    pub const BIG_INT: u8 = 4;
+    pub const FLOAT: u8 = 5;
+    pub const STR: u8 = 6;
+    pub const BYTES: u8 = 7;
+    pub const LIST: u8 = 8;
+    pub const TUPLE: u8 = 9;
+    pub const DICT: u8 = 10;
+}
+
+// Вложенность, глубже которой файл считается испорченным: снимки
+// объектов не глубже предела Node, а документ JSON глубже не сохраняется.
+const MAX_DEPTH: usize = 512;
+
+fn corrupt(reason: &str) -> PyErr {
+    PyValueError::new_err(format!("Некорректный файл снимка: {}", reason))
+}
+
+fn put_u64(out: &mut Vec<u8>, value: u64) {
+    out.extend_from_slice(&value.to_le_bytes());
+}
+
+fn put_bytes(out: &mut Vec<u8>, tag: u8, hash: Option<u64>, bytes: &[u8]) {
+    put_head(out, tag, hash);
+    put_u64(out, bytes.len() as u64);
+    out.extend_from_slice(bytes);
+}
+
+fn put_head(out: &mut Vec<u8>, tag: u8, hash: Option<u64>) {
+    out.push(tag);
+    out.push(hash.map_or(0, |_| HAS_HASH));
+    put_u64(out, hash.unwrap_or(0));
+}
+
+// Начало контейнера: длина тела дописывается в end_container().
+fn begin_container(out: &mut Vec<u8>, tag: u8, hash: Option<u64>, count: usize) -> usize {
+    put_head(out, tag, hash);
+    put_u64(out, count as u64);
+    put_u64(out, 0);
+    out.len()
+}
+
+fn end_container(out: &mut [u8], body: usize) {
+    let len = (out.len() - body) as u64;
+    out[body - 8..body].copy_from_slice(&len.to_le_bytes());
+}
+
+fn header(out: &mut Vec<u8>) {
+    out.extend_from_slice(MAGIC);
+    out.push(FORMAT_VERSION);
+    out.extend_from_slice(&[0; 3]);
+    put_u64(out, 0);
+}
+
+fn finish(out: &mut [u8]) {
+    let len = out.len() as u64;
+    out[8..16].copy_from_slice(&len.to_le_bytes());
+}
+
+// Узел снимка с посчитанными хешами. Err — узел, которого нет в формате:
+// непрозрачный объект или контейнер глубже предела снимка.
+fn encode_node<'a>(out: &mut Vec<u8>, node: &'a Node) -> Result<(), &'a Node> {
+    match &node.kind {
+        Kind::None => put_head(out, tag::NONE, node.hash),
+        Kind::Bool(b) => put_head(out, if *b { tag::TRUE } else { tag::FALSE }, node.hash),
+        Kind::Int(value) => {
+            put_head(out, tag::INT, node.hash);
+            out.extend_from_slice(&value.to_le_bytes());
+        }
+        Kind::BigInt(digits) => put_bytes(out, tag::BIG_INT, node.hash, digits.as_bytes()),
+        Kind::Float(value) => {
+            put_head(out, tag::FLOAT, node.hash);
+            out.extend_from_slice(&value.to_le_bytes());
+        }
+        Kind::Str(s) => put_bytes(out, tag::STR, node.hash, s.as_bytes()),
+        Kind::Bytes(b) => put_bytes(out, tag::BYTES, node.hash, b),
+        Kind::List(items) | Kind::Tuple(items) => {
+            let tag = if matches!(node.kind, Kind::List(_)) { tag::LIST } else { tag::TUPLE };
+            let body = begin_container(out, tag, node.hash, items.len());
+            for item in items.iter() {
+                encode_node(out, item)?;
+            }
+            end_container(out, body);
+        }
+        Kind::Dict(entries) => {
+            let body = begin_container(out, tag::DICT, node.hash, entries.len());
+            for (key, value) in entries.iter() {
+                encode_node(out, key)?;
+                encode_node(out, value)?;
+            }
+            end_container(out, body);
+        }
+        Kind::Opaque => return Err(node),
+    }
+    Ok(())
+}
+
+// Значение JSON с хешами, как у снимка того же объекта после json.loads().
+fn encode_json(out: &mut Vec<u8>, value: &Value) -> Option<u64> {
+    let start = out.len();
+    let hash = match value {
+        Value::Null => Some(node::hash_bytes(node::TAG_NONE, &[])),
+        Value::Bool(b) => Some(node::hash_bytes(node::TAG_BOOL, &[*b as u8])),
+        Value::Number(n) if json_diff::is_float(n) => node::hash_float(json_diff::float_value(n)),
+        Value::Number(n) => match n.as_i64() {
+            Some(i) => Some(node::hash_bytes(node::TAG_INT, &i.to_le_bytes())),
+            None => Some(node::hash_bytes(node::TAG_INT, json_diff::int_text(n).as_bytes())),
+        },
+        Value::String(s) => Some(node::hash_bytes(node::TAG_STR, s.as_bytes())),
+        Value::Array(items) => {
+            let body = begin_container(out, tag::LIST, None, items.len());
+            let children: Option<Vec<u64>> = items.iter().map(|item| encode_json(out, item)).collect();
+            end_container(out, body);
+            children.map(|children| node::hash_sequence(node::TAG_LIST, children, ListHash::Ordered))
+        }
+        Value::Object(map) => {
+            let body = begin_container(out, tag::DICT, None, map.len());
+            let mut hash = Some(0u64);
+            for (key, value) in map {
+                let key = encode_json(out, &Value::String(key.clone()));
+                let value = encode_json(out, value);
+                hash = hash.zip(key.zip(value)).map(|(h, (k, v))| h.wrapping_add(node::hash_entry(k, v)));
+            }
+            end_container(out, body);
+            hash.map(|h| node::hash_dict(h, map.len()))
+        }
+    };
+
+    // Скаляры пишутся после хеша, у контейнеров хеш дописывается в
+    // заголовок, уже записанный перед детьми.
+    match value {
+        Value::Null => put_head(out, tag::NONE, hash),
+        Value::Bool(b) => put_head(out, if *b { tag::TRUE } else { tag::FALSE }, hash),
+        Value::Number(n) if json_diff::is_float(n) => {
+            put_head(out, tag::FLOAT, hash);
+            out.extend_from_slice(&json_diff::float_value(n).to_le_bytes());
+        }
+        Value::Number(n) => match n.as_i64() {
+            Some(i) => {
+                put_head(out, tag::INT, hash);
+                out.extend_from_slice(&i.to_le_bytes());
+            }
+            None => put_bytes(out, tag::BIG_INT, hash, json_diff::int_text(n).as_bytes()),
+        },
+        Value::String(s) => put_bytes(out, tag::STR, hash, s.as_bytes()),
+        Value::Array(_) | Value::Object(_) => {
+            out[start + 1] = hash.map_or(0, |_| HAS_HASH);
+            out[start + 2..start + 10].copy_from_slice(&hash.unwrap_or(0).to_le_bytes());
+        }
+    }
+    hash
+}
+
+// Сохраняет снимок объекта Python. Хеши и запись в файл идут без GIL.
+pub fn save_object(py: Python, path: &Path, obj: &PyAny) -> PyResult<()> {
+    let mut node = Node::snapshot(obj)?;
+    let encoded = py.allow_threads(|| {
+        node.compute_hash(ListHash::Ordered);
+        let mut out = Vec::new();
+        header(&mut out);
+        encode_node(&mut out, &node)?;
+        finish(&mut out);
+        Ok(out)
+    });
+    let out = encoded.map_err(|unsupported: &Node| match unsupported.obj.as_ref(py).get_type().name() {
+        Ok(name) => PyTypeError::new_err(format!("Значение типа {} не сохраняется в снимке", name)),
+        Err(e) => e,
+    })?;
+    py.allow_threads(|| std::fs::write(path, out))?;
+    Ok(())
+}
+
+// Сохраняет снимок документа JSON без создания объектов Python.
+pub fn save_json(py: Python, path: &Path, data: &[u8]) -> PyResult<()> {
+    py.allow_threads(|| {
+        if json_diff::depth(data) > MAX_DEPTH {
+            return Err(PyValueError::new_err(format!(
+                "Документ JSON глубже {} уровней не сохраняется в снимке",
+                MAX_DEPTH
+            )));
+        }
+        let value =
+            json_diff::parse(data).map_err(|e| PyValueError::new_err(format!("Некорректный JSON: {}", e)))?;
+        let mut out = Vec::new();
+        header(&mut out);
+        encode_json(&mut out, &value);
+        finish(&mut out);
+        std::fs::write(path, out)?;
+        Ok(())
+    })
+}
+
+// Содержимое файла снимка: отображение в память либо, если оно
+// невозможно, прочитанные байты.
+enum Data {
+    Mapped(Mmap),
+    Read(Vec<u8>),
+}
+
+impl Deref for Data {
+    type Target = [u8];
+
+    fn deref(&self) -> &[u8] {
+        match self {
+            Data::Mapped(map) => map,
+            Data::Read(bytes) => bytes,
+        }
+    }
+}
+
+fn open(path: &Path) -> PyResult<Data> {
+    let file = File::open(path)?;
+    // Файл не должен меняться, пока идет сравнение.
+    let data = match unsafe { Mmap::map(&file) } {
+        Ok(map) => Data::Mapped(map),
+        Err(_) => Data::Read(std::fs::read(path)?),
+    };
+    if data.len() < HEADER_LEN || &data[..4] != MAGIC {
+        return Err(corrupt("нет заголовка"));
+    }
+    if data[4] != FORMAT_VERSION {
+        return Err(PyValueError::new_err(format!("Версия снимка {} не поддерживается", data[4])));
+    }
+    if u64::from_le_bytes(data[8..16].try_into().expect("8 байт")) != data.len() as u64 {
+        return Err(corrupt("длина не совпадает с заголовком"));
+    }
+    Ok(data)
+}
+
+// Узел файла: заголовок разобран, данные контейнера не тронуты.
+#[derive(Clone, Copy)]
+struct Stored<'a> {
+    kind: StoredKind<'a>,
+    hash: Option<u64>,
+    at: usize,
+    end: usize,
+}
+
+#[derive(Clone, Copy)]
+enum StoredKind<'a> {
+    None,
+    Bool(bool),
+    Int(i64),
+    BigInt(&'a str),
+    Float(f64),
+    Str(&'a str),
+    Bytes(&'a [u8]),
+    // Дети лежат в data[start..end узла].
+    List { count: usize, start: usize },
+    Tuple { count: usize, start: usize },
+    Dict { count: usize, start: usize },
+}
+
+impl StoredKind<'_> {
+    // Метка типа, как у Node::type_tag().
+    fn type_tag(&self) -> u8 {
+        match self {
+            StoredKind::None => node::TAG_NONE,
+            StoredKind::Bool(_) => node::TAG_BOOL,
+            StoredKind::Int(_) | StoredKind::BigInt(_) => node::TAG_INT,
+            StoredKind::Float(_) => node::TAG_FLOAT,
+            StoredKind::Str(_) => node::TAG_STR,
+            StoredKind::Bytes(_) => node::TAG_BYTES,
+            StoredKind::List { .. } => node::TAG_LIST,
+            StoredKind::Tuple { .. } => node::TAG_TUPLE,
+            StoredKind::Dict { .. } => node::TAG_DICT,
+        }
+    }
+}
+
+// Разбор заголовков узлов с проверкой границ. Ошибки — строки, чтобы
+// чтение шло без GIL.
+fn take(data: &[u8], at: usize, len: usize) -> Result<&[u8], &'static str> {
+    at.checked_add(len)
+        .filter(|&end| end <= data.len())
+        .map(|end| &data[at..end])
+        .ok_or("неожиданный конец данных")
+}
+
+fn u64_at(data: &[u8], at: usize) -> Result<u64, &'static str> {
+    Ok(u64::from_le_bytes(take(data, at, 8)?.try_into().expect("8 байт")))
+}
+
+fn len_at(data: &[u8], at: usize) -> Result<usize, &'static str> {
+    usize::try_from(u64_at(data, at)?).map_err(|_| "слишком большая длина")
+}
+
+fn str_at(data: &[u8], at: usize) -> Result<(&str, usize), &'static str> {
+    let len = len_at(data, at)?;
+    let bytes = take(data, at + 8, len)?;
+    let s = std::str::from_utf8(bytes).map_err(|_| "строка не в UTF-8")?;
+    Ok((s, at + 8 + len))
+}
+
+fn read(data: &[u8], at: usize) -> Result<Stored<'_>, &'static str> {
+    let head = take(data, at, 10)?;
+    let hash = (head[1] & HAS_HASH != 0).then(|| u64::from_le_bytes(head[2..10].try_into().expect("8 байт")));
+    let body = at + 10;
+    let container = |make: fn(usize, usize) -> StoredKind<'static>| -> Result<(StoredKind<'static>, usize), &'static str> {
+        let count = len_at(data, body)?;
+        let len = len_at(data, body + 8)?;
+        let start = body + 16;
+        take(data, start, len)?;
+        Ok((make(count, start), start + len))
+    };
+    let (kind, end) = match head[0] {
+        tag::NONE => (StoredKind::None, body),
+        tag::FALSE => (StoredKind::Bool(false), body),
+        tag::TRUE => (StoredKind::Bool(true), body),
+        tag::INT => (StoredKind::Int(u64_at(data, body)? as i64), body + 8),
+        tag::FLOAT => (StoredKind::Float(f64::from_bits(u64_at(data, body)?)), body + 8),
+        tag::BIG_INT => {
+            let (digits, end) = str_at(data, body)?;
+            (StoredKind::BigInt(digits), end)
+        }
+        tag::STR => {
+            let (s, end) = str_at(data, body)?;
+            (StoredKind::Str(s), end)
+        }
+        tag::BYTES => {
+            let len = len_at(data, body)?;
+            (StoredKind::Bytes(take(data, body + 8, len)?), body + 8 + len)
+        }
+        tag::LIST => container(|count, start| StoredKind::List { count, start })?,
+        tag::TUPLE => container(|count, start| StoredKind::Tuple { count, start })?,
+        tag::DICT => container(|count, start| StoredKind::Dict { count, start })?,
+        _ => return Err("неизвестная метка узла"),
+    };
+    Ok(Stored { kind, hash, at, end })
+}
+
+// Дети контейнера по порядку; следующий ребенок начинается там, где
+// кончился предыдущий.
+fn children<'a>(data: &'a [u8], start: usize, count: usize) -> impl Iterator<Item = Result<Stored<'a>, &'static str>> {
+    let mut at = start;
+    (0..count).map(move |_| {
+        let child = read(data, at)?;
+        at = child.end;
+        Ok(child)
+    })
+}
+
+// Ключ словаря в пути: в снимках только str и int.
+#[derive(Clone, Copy, PartialEq, Eq, Hash)]
+enum Key<'a> {
+    Str(&'a str),
+    Int(i64),
+}
+
+fn node_key(node: &Node) -> Key<'_> {
+    match &node.kind {
+        Kind::Str(s) => Key::Str(s),
+        Kind::Int(value) => Key::Int(*value),
+        _ => unreachable!("ключи словаря снимка — только str и int"),
+    }
+}
+
+// Запись обхода: старое значение — смещение узла в файле, новое — узел
+// снимка объекта. category None — новый объект непрозрачен, и категорию
+// решает сравнение типов при сборке.
+struct Record<'a> {
+    category: Option<Category>,
+    path: Vec<PathComponent<Key<'a>>>,
+    old: Option<usize>,
+    new: Option<&'a Node>,
+}
+
+// Обход файла снимка против снимка объекта без GIL. Поддеревья с равными
+// хешами пропускаются по длине тела, не читаясь.
+struct FileDiffer<'a> {
+    data: &'a [u8],
+    floats: FloatTolerance,
+    budget: Budget,
+    filter: Option<&'a Filter>,
+    cursors: Vec<Cursor>,
+    text: String,
+    path: Vec<PathComponent<Key<'a>>>,
+    records: Vec<Record<'a>>,
+}
+
+impl<'a> FileDiffer<'a> {
+    fn enter(&mut self, component: PathComponent<Key<'a>>) -> bool {
+        if let Some(filter) = self.filter {
+            let cursor = *self.cursors.last().expect("курсор корня есть всегда");
+            let text = &mut self.text;
+            let next = match component {
+                _ if !filter.needs_step(cursor) => Some(filter.inherit(cursor)),
+                PathComponent::Index(idx) => filter.step(cursor, Step::Index(idx), text),
+                PathComponent::Key(Key::Str(s)) => filter.step(cursor, Step::Key(s), text),
+                PathComponent::Key(Key::Int(value)) if value >= 0 => filter.step(cursor, Step::Index(value as usize), text),
+                PathComponent::Key(Key::Int(value)) => filter.step(cursor, Step::Repr(&value.to_string()), text),
+                PathComponent::Attr(_) | PathComponent::Group(..) => unreachable!("файл снимка сравнивается без group_by"),
+            };
+            match next {
+                Some(next) => self.cursors.push(next),
+                None => return false,
+            }
+        }
+        self.path.push(component);
+        true
+    }
+
+    fn leave(&mut self) {
+        self.path.pop();
+        if self.filter.is_some() {
+            self.cursors.pop();
+        }
+    }
+
+    fn record(&mut self, category: Option<Category>, old: Option<usize>, new: Option<&'a Node>) {
+        if !self.cursors.last().map_or(true, |cursor| cursor.included) || !self.budget.take_record() {
+            return;
+        }
+        self.records.push(Record {
+            category,
+            path: self.path.clone(),
+            old,
+            new,
+        });
+    }
+
+    fn compare(&mut self, old: Stored<'a>, new: &'a Node) -> Result<(), &'static str> {
+        if old.hash.is_some() && old.hash == new.hash {
+            return Ok(());
+        }
+        if self.budget.stopped() {
+            return Ok(());
+        }
+        if new.is_opaque() {
+            self.record(None, Some(old.at), Some(new));
+            return Ok(());
+        }
+        if old.kind.type_tag() != new.type_tag() {
+            self.record(Some(Category::TypeChanges), Some(old.at), Some(new));
+            return Ok(());
+        }
+
+        let equal = match (old.kind, &new.kind) {
+            (StoredKind::None, Kind::None) => true,
+            (StoredKind::Bool(a), Kind::Bool(b)) => a == *b,
+            (StoredKind::Int(a), Kind::Int(b)) => a == *b,
+            (StoredKind::BigInt(a), Kind::BigInt(b)) => a == b,
+            (StoredKind::Int(_), Kind::BigInt(_)) | (StoredKind::BigInt(_), Kind::Int(_)) => false,
+            (StoredKind::Float(a), Kind::Float(b)) => self.floats.eq(a, *b),
+            (StoredKind::Str(a), Kind::Str(b)) => a == b,
+            (StoredKind::Bytes(a), Kind::Bytes(b)) => a == b.as_slice(),
+            (StoredKind::List { count, start }, Kind::List(items))
+            | (StoredKind::Tuple { count, start }, Kind::Tuple(items)) => {
+                return self.compare_items(start, count, items);
+            }
+            (StoredKind::Dict { count, start }, Kind::Dict(entries)) => {
+                return self.compare_dicts(start, count, entries);
+            }
+            _ => unreachable!("метки типов совпадают"),
+        };
+        if !equal {
+            self.record(Some(Category::ValuesChanged), Some(old.at), Some(new));
+        }
+        Ok(())
+    }
+
+    fn compare_items(&mut self, start: usize, count: usize, items: &'a [Node]) -> Result<(), &'static str> {
+        let mut stored = children(self.data, start, count);
+        for i in 0..count.max(items.len()) {
+            if self.budget.stopped() {
+                return Ok(());
+            }
+            let old = stored.next().transpose()?;
+            if !self.enter(PathComponent::Index(i)) {
+                continue;
+            }
+            match (old, items.get(i)) {
+                (Some(old), Some(new)) => self.compare(old, new)?,
+                (Some(old), None) => self.record(Some(Category::IterableItemRemoved), Some(old.at), None),
+                (None, Some(new)) => self.record(Some(Category::IterableItemAdded), None, Some(new)),
+                (None, None) => {}
+            }
+            self.leave();
+        }
+        Ok(())
+    }
+
+    fn compare_dicts(&mut self, start: usize, count: usize, entries: &'a [(Node, Node)]) -> Result<(), &'static str> {
+        let new: HashMap<Key<'a>, &'a Node> = entries.iter().map(|(k, v)| (node_key(k), v)).collect();
+        let mut seen = Vec::with_capacity(count);
+        let mut stored = children(self.data, start, count * 2);
+        while let Some(key) = stored.next().transpose()? {
+            let value = stored.next().transpose()?.ok_or("словарь без значения")?;
+            let key = match key.kind {
+                StoredKind::Str(s) => Key::Str(s),
+                StoredKind::Int(value) => Key::Int(value),
+                _ => return Err("ключ словаря не str и не int"),
+            };
+            seen.push(key);
+            if self.budget.stopped() {
+                return Ok(());
+            }
+            if !self.enter(PathComponent::Key(key)) {
+                continue;
+            }
+            match new.get(&key) {
+                Some(new) => self.compare(value, new)?,
+                None => self.record(Some(Category::DictionaryItemRemoved), Some(value.at), None),
+            }
+            self.leave();
+        }
+
+        let seen: std::collections::HashSet<Key<'a>> = seen.into_iter().collect();
+        for (key, value) in entries {
+            let key = node_key(key);
+            if seen.contains(&key) {
+                continue;
+            }
+            if self.budget.stopped() {
+                return Ok(());
+            }
+            if self.enter(PathComponent::Key(key)) {
+                self.record(Some(Category::DictionaryItemAdded), None, Some(value));
+                self.leave();
+            }
+        }
+        Ok(())
+    }
+}
+
+// Объект Python из узла файла: только для значений, попавших в записи.
+fn decode(py: Python, data: &[u8], at: usize, depth: usize) -> PyResult<PyObject> {
+    if depth > MAX_DEPTH {
+        return Err(corrupt("слишком глубокая вложенность"));
+    }
+    let stored = read(data, at).map_err(corrupt)?;
+    let items = |start, count| -> PyResult<Vec<PyObject>> {
+        children(data, start, count)
+            .map(|child| decode(py, data, child.map_err(corrupt)?.at, depth + 1))
+            .collect()
+    };
+    Ok(match stored.kind {
+        StoredKind::None => py.None(),
+        StoredKind::Bool(b) => b.into_py(py),
+        StoredKind::Int(value) => value.into_py(py),
+        StoredKind::BigInt(digits) => py.get_type::<PyLong>().call1((digits,))?.into(),
+        StoredKind::Float(value) => value.into_py(py),
+        StoredKind::Str(s) => s.into_py(py),
+        StoredKind::Bytes(b) => PyBytes::new(py, b).into(),
+        StoredKind::List { count, start } => PyList::new(py, items(start, count)?).into(),
+        StoredKind::Tuple { count, start } => PyTuple::new(py, items(start, count)?).into(),
+        StoredKind::Dict { count, start } => {
+            let dict = PyDict::new(py);
+            let mut pairs = items(start, count * 2)?.into_iter();
+            while let (Some(key), Some(value)) = (pairs.next(), pairs.next()) {
+                dict.set_item(key, value)?;
+            }
+            dict.into()
+        }
+    })
+}
+
+fn change_path(py: Python, path: &[PathComponent<Key<'_>>]) -> ChangePath {
+    path.iter()
+        .map(|component| match component {
+            PathComponent::Key(Key::Str(s)) => PathComponent::Key(PathKey::Str(s.to_string())),
+            PathComponent::Key(Key::Int(value)) => PathComponent::Key(PathKey::Py(value.into_py(py))),
+            PathComponent::Index(idx) => PathComponent::Index(*idx),
+            PathComponent::Attr(_) | PathComponent::Group(..) => unreachable!("файл снимка сравнивается без group_by"),
+        })
+        .collect()
+}
+
+// Параметры, которым нужен Python или снимки обеих сторон.
+fn check_options(options: &DiffOptions) -> PyResult<()> {
+    if options.ignore_order
+        || options.align_lists
+        || options.group_by.is_some()
+        || options.parallelism.is_some()
+        || options.max_depth.is_some()
+        || options.stats
+        || options.slow_subtree.is_some()
+    {
+        return Err(PyTypeError::new_err(
+            "compare_to_snapshot: ignore_order, align_lists, group_by, parallelism, max_depth, stats \
+             и on_slow_subtree не поддерживаются",
+        ));
+    }
+    Ok(())
+}
+
+// Сравнивает сохраненный снимок с объектом. Файл отображается в память
+// и читается без копирования и без GIL; объекты Python создаются только
+// для старых значений в записях.
+pub fn compare(py: Python, path: &Path, obj: &PyAny, options: &DiffOptions) -> PyResult<DeepDiff> {
+    check_options(options)?;
+    let data = open(path)?;
+    let mut new = Node::snapshot(obj)?;
+
+    let data: &[u8] = &data;
+    let new = &mut new;
+    let (records, truncated) = py
+        .allow_threads(move || -> Result<_, &'static str> {
+            new.compute_hash(ListHash::Ordered);
+            let new: &Node = new;
+            let mut differ = FileDiffer {
+                data,
+                floats: options.floats,
+                budget: Budget::new(options),
+                filter: options.filter.as_deref(),
+                cursors: Vec::new(),
+                text: String::new(),
+                path: Vec::new(),
+                records: Vec::new(),
+            };
+            if let Some(filter) = differ.filter {
+                differ.cursors.push(filter.root(&mut differ.text));
+            }
+            differ.compare(read(data, HEADER_LEN)?, new)?;
+            Ok((differ.records, differ.budget.truncated))
+        })
+        .map_err(corrupt)?;
+
+    let mut diff = DeepDiff::default();
+    for record in records {
+        let old = record.old.map(|at| decode(py, data, at, 0)).transpose()?;
+        let new = record.new.map(|node| node.obj.clone_ref(py));
+        // Непрозрачный узел (объект не встроенного типа или поддерево
+        // глубже предела снимка, а файл JSON бывает глубже) без GIL не
+        // сравнить: запись остается, только если значения не равны.
+        if let (None, Some(old), Some(new)) = (record.category, &old, &new) {
+            if old.as_ref(py).eq(new.as_ref(py))? {
+                continue;
+            }
+        }
+        let category = match (record.category, &old, &new) {
+            (Some(category), _, _) => category,
+            (None, Some(old), Some(new)) if old.as_ref(py).get_type().is(new.as_ref(py).get_type()) => {
+                Category::ValuesChanged
+            }
+            (None, _, _) => Category::TypeChanges,
+        };
+        diff.record(
+            category,
+            change_path(py, &record.path),
+            old.map(ChangeValue::Py),
+            new.map(ChangeValue::Py),
+        );
+    }
+    diff.truncated = truncated;
+    Ok(diff)
+}
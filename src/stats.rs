@@ -0,0 +1,106 @@
+use std::time::Duration;
+
+use pyo3::prelude::*;
+use pyo3::types::PyDict;
+
+// Виды узлов для счетчиков обхода, в порядке NodeKind.
+const NODE_KINDS: [&str; 12] = [
+    "none", "bool", "int", "float", "str", "bytes", "dict", "list", "tuple", "set", "buffer", "object",
+];
+
+#[derive(Debug, Clone, Copy)]
+pub enum NodeKind {
+    None,
+    Bool,
+    Int,
+    Float,
+    Str,
+    Bytes,
+    Dict,
+    List,
+    Tuple,
+    Set,
+    Buffer,
+    Object,
+}
+
+// Счетчики одного сравнения при stats=True. Обходы снимков ведут свои
+// счетчики без GIL, при сборке результата они складываются.
+#[derive(Debug, Clone, Default)]
+pub struct Stats {
+    // Сравненные пары узлов по виду.
+    nodes: [u64; NODE_KINDS.len()],
+    // Поддеревья, пропущенные как общие: тот же объект или равные хеши.
+    pub skipped: u64,
+    // Поддеревья, исключенные фильтром путей.
+    pub filtered: u64,
+    // Пропущенные циклы ссылок: пара контейнеров снова на своем же пути.
+    pub cycles: u64,
+    // Наибольшая глубина сравненной пары.
+    pub max_depth: usize,
+    // Вызовы == с возможным кодом Python: __eq__ прочих объектов и
+    // сравнение целиком глубже max_depth.
+    pub python_eq_calls: u64,
+    // Задачи параллельного обхода: пары поддеревьев, сравненные отдельно.
+    pub parallel_tasks: u64,
+    // Снимки объектов, обход и перенос записей снимков в результат.
+    pub conversion: Duration,
+    pub traversal: Duration,
+    pub materialization: Duration,
+}
+
+impl Stats {
+    #[inline]
+    pub fn visit(&mut self, kind: NodeKind, depth: usize) {
+        self.nodes[kind as usize] += 1;
+        self.max_depth = self.max_depth.max(depth);
+    }
+
+    pub fn add(&mut self, other: &Stats) {
+        for (total, count) in self.nodes.iter_mut().zip(other.nodes) {
+            *total += count;
+        }
+        self.skipped += other.skipped;
+        self.filtered += other.filtered;
+        self.cycles += other.cycles;
+        self.max_depth = self.max_depth.max(other.max_depth);
+        self.python_eq_calls += other.python_eq_calls;
+        self.parallel_tasks += other.parallel_tasks;
+        self.conversion += other.conversion;
+        self.traversal += other.traversal;
+        self.materialization += other.materialization;
+    }
+
+    pub fn to_object(&self, py: Python) -> PyResult<PyObject> {
+        let nodes = PyDict::new(py);
+        for (name, count) in NODE_KINDS.iter().zip(self.nodes) {
+            if count > 0 {
+                nodes.set_item(name, count)?;
+            }
+        }
+        let seconds = PyDict::new(py);
+        seconds.set_item("conversion", self.conversion.as_secs_f64())?;
+        seconds.set_item("traversal", self.traversal.as_secs_f64())?;
+        seconds.set_item("materialization", self.materialization.as_secs_f64())?;
+
+        let result = PyDict::new(py);
+        result.set_item("nodes", nodes)?;
+        result.set_item("nodes_total", self.nodes.iter().sum::<u64>())?;
+        result.set_item("skipped_subtrees", self.skipped)?;
+        result.set_item("filtered_subtrees", self.filtered)?;
+        result.set_item("cycles", self.cycles)?;
+        result.set_item("max_depth", self.max_depth)?;
+        result.set_item("python_eq_calls", self.python_eq_calls)?;
+        result.set_item("parallel_tasks", self.parallel_tasks)?;
+        result.set_item("seconds", seconds)?;
+        Ok(result.into())
+    }
+}
+
+// Обратный вызов для поддеревьев, сравнение которых заняло не меньше
+// threshold: callback(path, seconds).
+#[derive(Debug, Clone)]
+pub struct SlowSubtree {
+    pub callback: PyObject,
+    pub threshold: Duration,
+}
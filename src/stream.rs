@@ -0,0 +1,811 @@
+use std::collections::{BTreeMap, VecDeque};
+use std::fmt;
+use std::fs::File;
+use std::io::{self, BufRead, BufReader, Cursor, Read};
+use std::path::Path;
+
+use memmap2::Mmap;
+use serde_json::{Map, Number, Value};
+
+use crate::json_diff::{self, type_name};
+use crate::path::{format_path, PathComponent};
+
+#[derive(Debug)]
+pub enum StreamError {
+    Io(io::Error),
+    Syntax { offset: u64, message: String },
+}
+
+impl fmt::Display for StreamError {
+    fn fmt(&self, f: &mut fmt::Formatter<'_>) -> fmt::Result {
+        match self {
+            StreamError::Io(e) => write!(f, "{}", e),
+            StreamError::Syntax { offset, message } => {
+                write!(f, "{} (смещение {})", message, offset)
+            }
+        }
+    }
+}
+
+impl From<io::Error> for StreamError {
+    fn from(e: io::Error) -> Self {
+        StreamError::Io(e)
+    }
+}
+
+pub type Result<T> = std::result::Result<T, StreamError>;
+
+// Источник байтов: файл отображается в память, а если это невозможно
+// (пайп, пустой файл, специальная ФС), читается через буфер.
+pub enum Input {
+    Mapped(Cursor<Mmap>),
+    Buffered(BufReader<File>),
+}
+
+impl Input {
+    pub fn open(path: &Path) -> io::Result<Input> {
+        let file = File::open(path)?;
+        // Файл не должен меняться, пока идет сравнение.
+        match unsafe { Mmap::map(&file) } {
+            Ok(map) => Ok(Input::Mapped(Cursor::new(map))),
+            Err(_) => Ok(Input::Buffered(BufReader::with_capacity(1 << 16, file))),
+        }
+    }
+}
+
+impl Read for Input {
+    fn read(&mut self, buf: &mut [u8]) -> io::Result<usize> {
+        match self {
+            Input::Mapped(r) => r.read(buf),
+            Input::Buffered(r) => r.read(buf),
+        }
+    }
+}
+
+impl BufRead for Input {
+    fn fill_buf(&mut self) -> io::Result<&[u8]> {
+        match self {
+            Input::Mapped(r) => r.fill_buf(),
+            Input::Buffered(r) => r.fill_buf(),
+        }
+    }
+
+    fn consume(&mut self, amt: usize) {
+        match self {
+            Input::Mapped(r) => r.consume(amt),
+            Input::Buffered(r) => r.consume(amt),
+        }
+    }
+}
+
+#[derive(Debug, PartialEq)]
+pub enum Event {
+    StartObject,
+    EndObject,
+    StartArray,
+    EndArray,
+    Key(String),
+    Scalar(Value),
+}
+
+struct Context {
+    is_object: bool,
+    first: bool,
+    after_key: bool,
+}
+
+// Инкрементальный токенизатор: память растет только с глубиной вложенности.
+pub struct Tokenizer<R> {
+    reader: R,
+    offset: u64,
+    context: Vec<Context>,
+}
+
+impl<R: BufRead> Tokenizer<R> {
+    pub fn new(reader: R) -> Self {
+        Tokenizer {
+            reader,
+            offset: 0,
+            context: Vec::new(),
+        }
+    }
+
+    fn error<T>(&self, message: impl Into<String>) -> Result<T> {
+        Err(StreamError::Syntax {
+            offset: self.offset,
+            message: message.into(),
+        })
+    }
+
+    fn peek(&mut self) -> Result<Option<u8>> {
+        Ok(self.reader.fill_buf()?.first().copied())
+    }
+
+    fn bump(&mut self) {
+        self.reader.consume(1);
+        self.offset += 1;
+    }
+
+    fn next_byte(&mut self) -> Result<u8> {
+        match self.peek()? {
+            Some(c) => {
+                self.bump();
+                Ok(c)
+            }
+            None => self.error("Неожиданный конец документа"),
+        }
+    }
+
+    fn skip_whitespace(&mut self) -> Result<()> {
+        loop {
+            let (skipped, more) = {
+                let buf = self.reader.fill_buf()?;
+                let n = buf
+                    .iter()
+                    .position(|c| !matches!(c, b' ' | b'\t' | b'\n' | b'\r'))
+                    .unwrap_or(buf.len());
+                (n, n == buf.len() && n > 0)
+            };
+            self.reader.consume(skipped);
+            self.offset += skipped as u64;
+            if !more {
+                return Ok(());
+            }
+        }
+    }
+
+    fn expect(&mut self, expected: u8) -> Result<()> {
+        self.skip_whitespace()?;
+        let c = self.next_byte()?;
+        if c != expected {
+            return self.error(format!(
+                "Ожидался символ '{}', найден '{}'",
+                expected as char, c as char
+            ));
+        }
+        Ok(())
+    }
+
+    pub fn next_event(&mut self) -> Result<Event> {
+        self.skip_whitespace()?;
+
+        let (is_object, first, after_key) = match self.context.last() {
+            None => return self.value_start(),
+            Some(ctx) => (ctx.is_object, ctx.first, ctx.after_key),
+        };
+
+        if is_object && after_key {
+            if let Some(ctx) = self.context.last_mut() {
+                ctx.after_key = false;
+            }
+            return self.value_start();
+        }
+
+        let close = if is_object { b'}' } else { b']' };
+        if self.peek()? == Some(close) {
+            self.bump();
+            self.context.pop();
+            return Ok(if is_object { Event::EndObject } else { Event::EndArray });
+        }
+        if !first {
+            self.expect(b',')?;
+        }
+        if let Some(ctx) = self.context.last_mut() {
+            ctx.first = false;
+            ctx.after_key = is_object;
+        }
+
+        if !is_object {
+            return self.value_start();
+        }
+        self.expect(b'"')?;
+        let key = self.read_string()?;
+        self.expect(b':')?;
+        Ok(Event::Key(key))
+    }
+
+    fn value_start(&mut self) -> Result<Event> {
+        self.skip_whitespace()?;
+        let open = matches!(self.peek()?, Some(b'{') | Some(b'['));
+        if open && self.context.len() >= json_diff::MAX_DEPTH {
+            return self.error(format!("Вложенность глубже {} уровней", json_diff::MAX_DEPTH));
+        }
+        match self.peek()? {
+            Some(b'{') => {
+                self.bump();
+                self.context.push(Context {
+                    is_object: true,
+                    first: true,
+                    after_key: false,
+                });
+                Ok(Event::StartObject)
+            }
+            Some(b'[') => {
+                self.bump();
+                self.context.push(Context {
+                    is_object: false,
+                    first: true,
+                    after_key: false,
+                });
+                Ok(Event::StartArray)
+            }
+            Some(b'"') => {
+                self.bump();
+                Ok(Event::Scalar(Value::String(self.read_string()?)))
+            }
+            Some(b't') => self.literal(b"true", Value::Bool(true)),
+            Some(b'f') => self.literal(b"false", Value::Bool(false)),
+            Some(b'n') => self.literal(b"null", Value::Null),
+            Some(c) if c == b'-' || c.is_ascii_digit() => self.number(),
+            Some(c) => self.error(format!("Неожиданный символ '{}'", c as char)),
+            None => self.error("Неожиданный конец документа"),
+        }
+    }
+
+    fn literal(&mut self, text: &[u8], value: Value) -> Result<Event> {
+        for &expected in text {
+            if self.next_byte()? != expected {
+                return self.error("Некорректный литерал");
+            }
+        }
+        Ok(Event::Scalar(value))
+    }
+
+    fn number(&mut self) -> Result<Event> {
+        let mut text = String::new();
+        while let Some(c) = self.peek()? {
+            if c.is_ascii_digit() || matches!(c, b'-' | b'+' | b'.' | b'e' | b'E') {
+                text.push(c as char);
+                self.bump();
+            } else {
+                break;
+            }
+        }
+
+        // Запись числа сохраняется как есть: целые любой длины остаются int.
+        let number = serde_json::from_str::<Number>(&text).ok();
+
+        match number {
+            Some(n) => Ok(Event::Scalar(Value::Number(n))),
+            None => self.error(format!("Некорректное число '{}'", text)),
+        }
+    }
+
+    fn read_string(&mut self) -> Result<String> {
+        let mut out = Vec::new();
+        loop {
+            let (taken, stop) = {
+                let buf = self.reader.fill_buf()?;
+                if buf.is_empty() {
+                    return self.error("Незакрытая строка");
+                }
+                match buf.iter().position(|&c| c == b'"' || c == b'\\') {
+                    Some(p) => {
+                        out.extend_from_slice(&buf[..p]);
+                        (p + 1, Some(buf[p]))
+                    }
+                    None => {
+                        out.extend_from_slice(buf);
+                        (buf.len(), None)
+                    }
+                }
+            };
+            self.reader.consume(taken);
+            self.offset += taken as u64;
+
+            match stop {
+                Some(b'"') => break,
+                Some(_) => self.escape(&mut out)?,
+                None => {}
+            }
+        }
+
+        match String::from_utf8(out) {
+            Ok(s) => Ok(s),
+            Err(_) => self.error("Строка не в UTF-8"),
+        }
+    }
+
+    fn escape(&mut self, out: &mut Vec<u8>) -> Result<()> {
+        let c = match self.next_byte()? {
+            b'"' => '"',
+            b'\\' => '\\',
+            b'/' => '/',
+            b'b' => '\u{8}',
+            b'f' => '\u{c}',
+            b'n' => '\n',
+            b'r' => '\r',
+            b't' => '\t',
+            b'u' => {
+                let high = self.hex4()?;
+                let code = if (0xD800..0xDC00).contains(&high) {
+                    if self.next_byte()? != b'\\' || self.next_byte()? != b'u' {
+                        return self.error("Непарный суррогат в строке");
+                    }
+                    let low = self.hex4()?;
+                    if !(0xDC00..0xE000).contains(&low) {
+                        return self.error("Непарный суррогат в строке");
+                    }
+                    0x10000 + ((high - 0xD800) << 10) + (low - 0xDC00)
+                } else {
+                    high
+                };
+                match char::from_u32(code) {
+                    Some(c) => c,
+                    None => return self.error("Некорректная escape-последовательность"),
+                }
+            }
+            _ => return self.error("Некорректная escape-последовательность"),
+        };
+        let mut buf = [0u8; 4];
+        out.extend_from_slice(c.encode_utf8(&mut buf).as_bytes());
+        Ok(())
+    }
+
+    fn hex4(&mut self) -> Result<u32> {
+        let mut code = 0;
+        for _ in 0..4 {
+            let digit = match (self.next_byte()? as char).to_digit(16) {
+                Some(d) => d,
+                None => return self.error("Некорректная escape-последовательность"),
+            };
+            code = code * 16 + digit;
+        }
+        Ok(code)
+    }
+
+    // Следующее значение — скаляр: смотрит первый байт, не читая значения.
+    pub fn scalar_ahead(&mut self) -> Result<bool> {
+        self.skip_whitespace()?;
+        Ok(!matches!(self.peek()?, Some(b'{') | Some(b'[')))
+    }
+
+    // Собирает значение целиком, начиная с уже прочитанного события.
+    // Незакрытые контейнеры лежат в явном стеке, а не на стеке вызовов.
+    pub fn read_value(&mut self, first: Event) -> Result<Value> {
+        enum Open {
+            Array(Vec<Value>),
+            // Объект и ключ, ждущий значения.
+            Object(Map<String, Value>, Option<String>),
+        }
+
+        let mut open: Vec<Open> = Vec::new();
+        let mut event = first;
+        loop {
+            let value = match event {
+                Event::Scalar(value) => value,
+                Event::StartArray => {
+                    open.push(Open::Array(Vec::new()));
+                    event = self.next_event()?;
+                    continue;
+                }
+                Event::StartObject => {
+                    open.push(Open::Object(Map::new(), None));
+                    event = self.next_event()?;
+                    continue;
+                }
+                Event::Key(key) => match open.last_mut() {
+                    Some(Open::Object(_, pending)) if pending.is_none() => {
+                        *pending = Some(key);
+                        event = self.next_event()?;
+                        continue;
+                    }
+                    _ => return self.error("Ожидалось значение"),
+                },
+                Event::EndArray => match open.pop() {
+                    Some(Open::Array(items)) => Value::Array(items),
+                    _ => return self.error("Ожидалось значение"),
+                },
+                Event::EndObject => match open.pop() {
+                    Some(Open::Object(map, None)) => Value::Object(map),
+                    _ => return self.error("Ожидалось значение"),
+                },
+            };
+
+            match open.last_mut() {
+                None => return Ok(value),
+                Some(Open::Array(items)) => items.push(value),
+                Some(Open::Object(map, pending)) => match pending.take() {
+                    Some(key) => {
+                        map.insert(key, value);
+                    }
+                    None => return self.error("Ожидался ключ объекта"),
+                },
+            }
+            event = self.next_event()?;
+        }
+    }
+
+    pub fn finish(&mut self) -> Result<()> {
+        self.skip_whitespace()?;
+        if self.peek()?.is_some() {
+            return self.error("Лишние данные после документа");
+        }
+        Ok(())
+    }
+}
+
+#[derive(Debug, Clone, PartialEq)]
+pub struct Entry {
+    pub category: &'static str,
+    pub path: String,
+    pub old: Option<Value>,
+    pub new: Option<Value>,
+}
+
+enum Frame {
+    Object {
+        old_done: bool,
+        new_done: bool,
+        // Прочитанный ключ, значение которого еще не прочитано: при разных
+        // ключах продвигается одна сторона, другая держит свой ключ.
+        held_old: Option<String>,
+        held_new: Option<String>,
+        // Какую сторону продвигать, когда по ключам этого не понять:
+        // стороны чередуются, и одна вставка или удаление стоит не больше
+        // двух прочитанных целиком значений, после чего ключи снова идут
+        // в ногу.
+        advance_old: bool,
+        // Ключи, пришедшие в разном порядке, ждут пару здесь; для файлов
+        // с одинаковым порядком ключей эти карты остаются пустыми.
+        pending_old: BTreeMap<String, Value>,
+        pending_new: BTreeMap<String, Value>,
+    },
+    Array {
+        old_done: bool,
+        new_done: bool,
+        index: usize,
+    },
+}
+
+// Обходит два документа синхронно и отдает записи по мере обнаружения.
+pub struct StreamDiff<R> {
+    old: Tokenizer<R>,
+    new: Tokenizer<R>,
+    stack: Vec<Frame>,
+    path: Vec<PathComponent>,
+    queue: VecDeque<Entry>,
+    started: bool,
+    finished: bool,
+}
+
+impl StreamDiff<Input> {
+    pub fn open(old: &Path, new: &Path) -> io::Result<Self> {
+        Ok(StreamDiff::new(Input::open(old)?, Input::open(new)?))
+    }
+}
+
+impl<R: BufRead> StreamDiff<R> {
+    pub fn new(old: R, new: R) -> Self {
+        StreamDiff {
+            old: Tokenizer::new(old),
+            new: Tokenizer::new(new),
+            stack: Vec::new(),
+            path: Vec::new(),
+            queue: VecDeque::new(),
+            started: false,
+            finished: false,
+        }
+    }
+
+    // Продвигает обход, пока не наберется до `limit` записей или документы
+    // не закончатся. Пустой результат означает конец сравнения.
+    pub fn next_batch(&mut self, limit: usize) -> Result<Vec<Entry>> {
+        while self.queue.len() < limit && !self.finished {
+            self.step()?;
+        }
+        let n = self.queue.len().min(limit);
+        Ok(self.queue.drain(..n).collect())
+    }
+
+    fn emit(&mut self, category: &'static str, old: Option<Value>, new: Option<Value>) {
+        self.queue.push_back(Entry {
+            category,
+            path: format_path(&self.path),
+            old,
+            new,
+        });
+    }
+
+    fn emit_diff(&mut self, diff: json_diff::Diff) {
+        let pair = |category, (path, (old, new)): (Vec<PathComponent>, _)| Entry {
+            category,
+            path: format_path(&path),
+            old: Some(old),
+            new: Some(new),
+        };
+        let added = |category, (path, value): (Vec<PathComponent>, _)| Entry {
+            category,
+            path: format_path(&path),
+            old: None,
+            new: Some(value),
+        };
+        let removed = |category, (path, value): (Vec<PathComponent>, _)| Entry {
+            category,
+            path: format_path(&path),
+            old: Some(value),
+            new: None,
+        };
+
+        let queue = &mut self.queue;
+        queue.extend(diff.values_changed.into_iter().map(|e| pair("values_changed", e)));
+        queue.extend(diff.type_changes.into_iter().map(|e| pair("type_changes", e)));
+        queue.extend(diff.dictionary_item_added.into_iter().map(|e| added("dictionary_item_added", e)));
+        queue.extend(diff.dictionary_item_removed.into_iter().map(|e| removed("dictionary_item_removed", e)));
+        queue.extend(diff.iterable_item_added.into_iter().map(|e| added("iterable_item_added", e)));
+        queue.extend(diff.iterable_item_removed.into_iter().map(|e| removed("iterable_item_removed", e)));
+    }
+
+    fn step(&mut self) -> Result<()> {
+        if !self.started {
+            self.started = true;
+            let a = self.old.next_event()?;
+            let b = self.new.next_event()?;
+            self.compare_pair(a, b)?;
+            return Ok(());
+        }
+
+        match self.stack.last() {
+            None => {
+                self.old.finish()?;
+                self.new.finish()?;
+                self.finished = true;
+                Ok(())
+            }
+            Some(Frame::Array { .. }) => self.step_array(),
+            Some(Frame::Object { .. }) => self.step_object(),
+        }
+    }
+
+    fn pop_frame(&mut self) {
+        self.stack.pop();
+        // У корневого кадра нет компонента пути.
+        if !self.stack.is_empty() {
+            self.path.pop();
+        }
+    }
+
+    // Сравнивает значения, начинающиеся с событий `a` и `b`. Компонент пути
+    // уже лежит в self.path; возвращает true, если открыт новый кадр.
+    fn compare_pair(&mut self, a: Event, b: Event) -> Result<bool> {
+        match (a, b) {
+            (Event::StartObject, Event::StartObject) => {
+                self.stack.push(Frame::Object {
+                    old_done: false,
+                    new_done: false,
+                    held_old: None,
+                    held_new: None,
+                    advance_old: true,
+                    pending_old: BTreeMap::new(),
+                    pending_new: BTreeMap::new(),
+                });
+                Ok(true)
+            }
+            (Event::StartArray, Event::StartArray) => {
+                self.stack.push(Frame::Array {
+                    old_done: false,
+                    new_done: false,
+                    index: 0,
+                });
+                Ok(true)
+            }
+            (Event::Scalar(x), Event::Scalar(y)) => {
+                if type_name(&x) != type_name(&y) {
+                    self.emit("type_changes", Some(x), Some(y));
+                } else if !json_diff::scalars_equal(&x, &y) {
+                    self.emit("values_changed", Some(x), Some(y));
+                }
+                Ok(false)
+            }
+            (a, b) => {
+                let x = self.old.read_value(a)?;
+                let y = self.new.read_value(b)?;
+                self.emit("type_changes", Some(x), Some(y));
+                Ok(false)
+            }
+        }
+    }
+
+    fn step_array(&mut self) -> Result<()> {
+        let (old_done, new_done, index) = match self.stack.last() {
+            Some(Frame::Array { old_done, new_done, index }) => (*old_done, *new_done, *index),
+            _ => unreachable!(),
+        };
+
+        let a = if old_done {
+            None
+        } else {
+            match self.old.next_event()? {
+                Event::EndArray => None,
+                event => Some(event),
+            }
+        };
+        let b = if new_done {
+            None
+        } else {
+            match self.new.next_event()? {
+                Event::EndArray => None,
+                event => Some(event),
+            }
+        };
+
+        if let Some(Frame::Array { old_done, new_done, index }) = self.stack.last_mut() {
+            *old_done = a.is_none();
+            *new_done = b.is_none();
+            *index += 1;
+        }
+
+        match (a, b) {
+            (None, None) => self.pop_frame(),
+            (Some(a), Some(b)) => {
+                self.path.push(PathComponent::Index(index));
+                if !self.compare_pair(a, b)? {
+                    self.path.pop();
+                }
+            }
+            (Some(a), None) => {
+                let value = self.old.read_value(a)?;
+                self.path.push(PathComponent::Index(index));
+                self.emit("iterable_item_removed", Some(value), None);
+                self.path.pop();
+            }
+            (None, Some(b)) => {
+                let value = self.new.read_value(b)?;
+                self.path.push(PathComponent::Index(index));
+                self.emit("iterable_item_added", None, Some(value));
+                self.path.pop();
+            }
+        }
+        Ok(())
+    }
+
+    fn next_key(tokenizer: &mut Tokenizer<R>) -> Result<Option<String>> {
+        match tokenizer.next_event()? {
+            Event::EndObject => Ok(None),
+            Event::Key(key) => Ok(Some(key)),
+            _ => tokenizer.error("Ожидался ключ объекта"),
+        }
+    }
+
+    fn step_object(&mut self) -> Result<()> {
+        let (old_done, new_done, held_old, held_new) = match self.stack.last_mut() {
+            Some(Frame::Object { old_done, new_done, held_old, held_new, .. }) => {
+                (*old_done, *new_done, held_old.take(), held_new.take())
+            }
+            _ => unreachable!(),
+        };
+
+        let k1 = match held_old {
+            Some(key) => Some(key),
+            None if old_done => None,
+            None => Self::next_key(&mut self.old)?,
+        };
+        let k2 = match held_new {
+            Some(key) => Some(key),
+            None if new_done => None,
+            None => Self::next_key(&mut self.new)?,
+        };
+
+        if let Some(Frame::Object { old_done, new_done, .. }) = self.stack.last_mut() {
+            *old_done = k1.is_none();
+            *new_done = k2.is_none();
+        }
+
+        match (k1, k2) {
+            (None, None) => {
+                let (removed, added) = match self.stack.last_mut() {
+                    Some(Frame::Object { pending_old, pending_new, .. }) => {
+                        (std::mem::take(pending_old), std::mem::take(pending_new))
+                    }
+                    _ => unreachable!(),
+                };
+                for (key, value) in removed {
+                    self.path.push(PathComponent::Key(key));
+                    self.emit("dictionary_item_removed", Some(value), None);
+                    self.path.pop();
+                }
+                for (key, value) in added {
+                    self.path.push(PathComponent::Key(key));
+                    self.emit("dictionary_item_added", None, Some(value));
+                    self.path.pop();
+                }
+                self.pop_frame();
+            }
+            (Some(k1), Some(k2)) if k1 == k2 => {
+                let a = self.old.next_event()?;
+                let b = self.new.next_event()?;
+                self.path.push(PathComponent::Key(k1));
+                if !self.compare_pair(a, b)? {
+                    self.path.pop();
+                }
+            }
+            (k1, k2) => {
+                // Продвигается сторона, чей ключ уже ждет пару у другой
+                // стороны или у которой другая сторона кончилась; затем та,
+                // у которой дальше скаляр: ошибка в выборе стоит одного
+                // скаляра. Иначе стороны идут по очереди.
+                let scalars = match (&k1, &k2) {
+                    (Some(_), Some(_)) => (self.old.scalar_ahead()?, self.new.scalar_ahead()?),
+                    _ => (false, false),
+                };
+                let advance_old = match (&k1, &k2, self.stack.last_mut()) {
+                    (Some(_), None, _) => true,
+                    (None, Some(_), _) => false,
+                    (Some(k1), Some(k2), Some(Frame::Object { advance_old, pending_old, pending_new, .. })) => {
+                        if pending_new.contains_key(k1) {
+                            true
+                        } else if pending_old.contains_key(k2) {
+                            false
+                        } else if scalars.0 != scalars.1 {
+                            scalars.0
+                        } else {
+                            *advance_old = !*advance_old;
+                            !*advance_old
+                        }
+                    }
+                    _ => unreachable!(),
+                };
+                if let Some(Frame::Object { held_old, held_new, .. }) = self.stack.last_mut() {
+                    if advance_old {
+                        *held_new = k2.clone();
+                    } else {
+                        *held_old = k1.clone();
+                    }
+                }
+                if advance_old {
+                    let key = k1.expect("ключ старой стороны");
+                    let event = self.old.next_event()?;
+                    let value = self.old.read_value(event)?;
+                    self.place(key, value, true);
+                } else {
+                    let key = k2.expect("ключ новой стороны");
+                    let event = self.new.next_event()?;
+                    let value = self.new.read_value(event)?;
+                    self.place(key, value, false);
+                }
+            }
+        }
+        Ok(())
+    }
+
+    // Ключ без пары на той же позиции: сравниваем с уже отложенным значением
+    // другой стороны, откладываем до конца объекта или, если другая
+    // сторона кончилась, сразу отдаем как удаленный или добавленный.
+    fn place(&mut self, key: String, value: Value, is_old: bool) {
+        let other = match self.stack.last_mut() {
+            Some(Frame::Object { old_done, new_done, pending_old, pending_new, .. }) => {
+                let (mine, theirs, other_done) = if is_old {
+                    (pending_old, pending_new, *new_done)
+                } else {
+                    (pending_new, pending_old, *old_done)
+                };
+                match theirs.remove(&key) {
+                    Some(other) => other,
+                    None if other_done => {
+                        let (category, old, new) = if is_old {
+                            ("dictionary_item_removed", Some(value), None)
+                        } else {
+                            ("dictionary_item_added", None, Some(value))
+                        };
+                        self.path.push(PathComponent::Key(key));
+                        self.emit(category, old, new);
+                        self.path.pop();
+                        return;
+                    }
+                    None => {
+                        mine.insert(key, value);
+                        return;
+                    }
+                }
+            }
+            _ => unreachable!(),
+        };
+
+        let (old, new) = if is_old { (value, other) } else { (other, value) };
+        let mut diff = json_diff::Diff::default();
+        self.path.push(PathComponent::Key(key));
+        json_diff::compare_values(&mut diff, &old, &new, &mut self.path);
+        self.path.pop();
+        self.emit_diff(diff);
+    }
+}
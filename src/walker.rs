@@ -0,0 +1,1171 @@
+use std::collections::{HashMap, HashSet};
+use std::rc::Rc;
+use std::sync::{Arc, Mutex};
+use std::time::{Duration, Instant};
+
+use pyo3::buffer::PyBuffer;
+use pyo3::exceptions::PyAttributeError;
+use pyo3::prelude::*;
+use pyo3::{ffi, AsPyPointer};
+use pyo3::types::{
+    PyBool, PyByteArray, PyBytes, PyDict, PyFloat, PyFrozenSet, PyList, PyLong, PyMemoryView, PySet, PyString, PyTuple,
+    PyType,
+};
+
+use crate::buffer::{self, Number, Numeric};
+use crate::node::{ListHash, Node};
+use crate::node_diff::{self, ListOp, NodeChange, NodePath};
+use crate::filter::{Cursor, Filter, Step};
+use crate::options::{Budget, DiffOptions, FloatTolerance, GroupBy};
+use crate::path::{group_text, PathComponent};
+use crate::result::{format_change_path, Category, ChangePath, ChangeValue, DeepDiff, PathKey};
+use crate::stats::{NodeKind, SlowSubtree, Stats};
+
+// Список или кортеж, читаемый по индексу без копирования в Vec.
+#[derive(Clone, Copy)]
+enum Seq<'p> {
+    List(&'p PyList),
+    Tuple(&'p PyTuple),
+}
+
+impl<'p> Seq<'p> {
+    fn len(self) -> usize {
+        match self {
+            Seq::List(l) => l.len(),
+            Seq::Tuple(t) => t.len(),
+        }
+    }
+
+    fn get(self, i: usize) -> PyResult<&'p PyAny> {
+        match self {
+            Seq::List(l) => l.get_item(i),
+            Seq::Tuple(t) => t.get_item(i),
+        }
+    }
+}
+
+// Сравнение встроенных скаляров без вызова Python-кода. Только для точных
+// типов: у подклассов может быть свой __eq__. None — тип не скалярный.
+fn scalar_eq(py: Python, ty: &PyType, t1: &PyAny, t2: &PyAny, floats: &FloatTolerance) -> PyResult<Option<bool>> {
+    if ty.is(py.get_type::<PyString>()) {
+        // str сравнивается самим CPython по длине и memcmp; to_str()
+        // создал бы в объекте лишнюю UTF-8 копию.
+        Ok(Some(t1.eq(t2)?))
+    } else if ty.is(py.get_type::<PyLong>()) {
+        match (t1.extract::<i64>(), t2.extract::<i64>()) {
+            (Ok(a), Ok(b)) => Ok(Some(a == b)),
+            _ => Ok(Some(t1.eq(t2)?)),
+        }
+    } else if ty.is(py.get_type::<PyFloat>()) {
+        let (a, b) = (t1.downcast::<PyFloat>()?, t2.downcast::<PyFloat>()?);
+        Ok(Some(floats.eq(a.value(), b.value())))
+    } else if ty.is(py.get_type::<PyBool>()) || t1.is_none() {
+        // True, False и None — синглтоны, совпадение уже проверено через is.
+        Ok(Some(t1.is(t2)))
+    } else {
+        Ok(None)
+    }
+}
+
+// Работа обхода, отложенная на стек.
+enum Frame<'p> {
+    // Сравнить пару по текущему пути.
+    Compare(&'p PyAny, &'p PyAny),
+    // Вернуться из ребенка к родителю.
+    Leave,
+    // Продолжить словарь с позиции PyDict_Next; added — проход по ключам
+    // d2, attrs — это __dict__ объектов, и ключи в пути — атрибуты.
+    Dict {
+        d1: &'p PyDict,
+        d2: &'p PyDict,
+        pos: isize,
+        added: bool,
+        attrs: bool,
+    },
+    // Продолжить список или кортеж с индекса i.
+    Seq { l1: Seq<'p>, l2: Seq<'p>, i: usize },
+    // Продолжить сопоставление элементов списков с шага k.
+    Matched { l1: Seq<'p>, l2: Seq<'p>, matching: Rc<Matching>, k: usize },
+    // Продолжить поля объекта по плану plan с поля i.
+    Object { t1: &'p PyAny, t2: &'p PyAny, plan: usize, i: usize },
+    // Контейнер пройден: снять пару с учета циклов и сообщить о медленном
+    // поддереве.
+    Done { pair: (usize, usize), started: Option<Instant> },
+}
+
+// Шаги сопоставления элементов списков и снимки элементов, по которым
+// они посчитаны.
+struct Matching {
+    ops: Vec<ListOp>,
+    old: Vec<Node>,
+    new: Vec<Node>,
+    // Поле group_by, по которому сопоставлены записи: в их пути вместо
+    // индекса стоит поле и значение ключа.
+    group: Option<Arc<str>>,
+}
+
+// Следующая пара словаря, как в PyDict_Next: все состояние итерации —
+// позиция pos, и ее можно хранить в кадре обхода.
+fn dict_next<'p>(dict: &'p PyDict, pos: &mut isize) -> Option<(&'p PyAny, &'p PyAny)> {
+    let py = dict.py();
+    let mut key = std::ptr::null_mut();
+    let mut value = std::ptr::null_mut();
+    unsafe {
+        if ffi::PyDict_Next(dict.as_ptr(), pos, &mut key, &mut value) == 0 {
+            return None;
+        }
+        Some((py.from_borrowed_ptr(key), py.from_borrowed_ptr(value)))
+    }
+}
+
+// Как сравнивать объекты одного типа по атрибутам: поля по порядку
+// (у namedtuple — по индексу кортежа, у прочих — через getattr), затем,
+// если у экземпляров есть __dict__, его ключи.
+struct Plan<'p> {
+    fields: Vec<&'p PyString>,
+    tuple: bool,
+    dict: bool,
+}
+
+// Тот же план в кэше процесса: имена полей принадлежат ему.
+struct SharedPlan {
+    fields: Vec<Py<PyString>>,
+    tuple: bool,
+    dict: bool,
+}
+
+// Запись кэша планов: слабая ссылка на тип и план для него.
+struct CachedPlan {
+    ty: PyObject,
+    plan: Option<Arc<SharedPlan>>,
+}
+
+// Кэш планов по адресу типа, общий для всех сравнений: import enum и
+// dataclasses.fields не повторяются от вызова к вызову. Обращения к нему
+// идут под GIL; замок не держится во время вызовов Python, иначе поток,
+// отпустивший GIL внутри build_plan, ждал бы поток, ждущий замок. Запись
+// верна, пока жив ее тип: адрес умершего типа может занять новый класс.
+struct PlanCache {
+    entries: HashMap<usize, CachedPlan>,
+    // Размер, при котором из кэша убираются записи умерших типов.
+    prune_at: usize,
+}
+
+const PLAN_CACHE_PRUNE_AT: usize = 1024;
+
+static PLANS: Mutex<Option<PlanCache>> = Mutex::new(None);
+
+// Жив ли тип ty, на который ссылается запись кэша.
+fn cached_type_is(entry: &CachedPlan, ty: &PyType) -> bool {
+    unsafe { ffi::PyWeakref_GetObject(entry.ty.as_ptr()) == ty.as_ptr() }
+}
+
+// План для типа из кэша процесса; при промахе строится и запоминается.
+fn shared_plan(py: Python, ty: &PyType) -> PyResult<Option<Arc<SharedPlan>>> {
+    let key = ty.as_ptr() as usize;
+    if let Some(cache) = PLANS.lock().unwrap().as_ref() {
+        if let Some(entry) = cache.entries.get(&key).filter(|entry| cached_type_is(entry, ty)) {
+            return Ok(entry.plan.clone());
+        }
+    }
+
+    let plan = build_plan(py, ty)?.map(Arc::new);
+    let weak: PyObject =
+        unsafe { py.from_owned_ptr_or_err::<PyAny>(ffi::PyWeakref_NewRef(ty.as_ptr(), std::ptr::null_mut()))? }.into();
+    let mut cache = PLANS.lock().unwrap();
+    let cache = cache.get_or_insert_with(|| PlanCache { entries: HashMap::new(), prune_at: PLAN_CACHE_PRUNE_AT });
+    if cache.entries.len() >= cache.prune_at {
+        let none = py.None();
+        cache.entries.retain(|_, entry| unsafe { ffi::PyWeakref_GetObject(entry.ty.as_ptr()) != none.as_ptr() });
+        cache.prune_at = (cache.entries.len() * 2).max(PLAN_CACHE_PRUNE_AT);
+    }
+    cache.entries.insert(key, CachedPlan { ty: weak, plan: plan.clone() });
+    Ok(plan)
+}
+
+// Имя слота, как его хранит класс: __x в классе _Cls становится _Cls__x.
+fn mangle(class_name: &str, name: &str) -> String {
+    let owner = class_name.trim_start_matches('_');
+    if name.starts_with("__") && !name.ends_with("__") && !owner.is_empty() {
+        format!("_{}{}", owner, name)
+    } else {
+        name.to_string()
+    }
+}
+
+// Атрибут или None, если он не задан (пустой слот, удаленное поле).
+fn attr_value<'p>(obj: &'p PyAny, name: &PyString) -> PyResult<Option<&'p PyAny>> {
+    match obj.getattr(name) {
+        Ok(value) => Ok(Some(value)),
+        Err(e) if e.is_instance_of::<PyAttributeError>(obj.py()) => Ok(None),
+        Err(e) => Err(e),
+    }
+}
+
+// План для типа или None, если его экземпляры сравниваются через ==.
+// По атрибутам сравниваются только классы, написанные на Python: в MRO
+// кроме них лишь object (и tuple у namedtuple), и не перечисления.
+// namedtuple и dataclass идут по полям и со своим __eq__, прочие классы с
+// __eq__ в MRO — через ==.
+fn build_plan(py: Python, ty: &PyType) -> PyResult<Option<SharedPlan>> {
+    let object = py.get_type::<PyAny>();
+    let tuple = py.get_type::<PyTuple>();
+    let mro = ty.getattr("__mro__")?.downcast::<PyTuple>()?;
+    let mut is_tuple = false;
+    for class in mro.iter() {
+        let class = class.downcast::<PyType>()?;
+        let heap = unsafe { ffi::PyType_GetFlags(class.as_type_ptr()) } & ffi::Py_TPFLAGS_HEAPTYPE != 0;
+        if class.is(tuple) {
+            is_tuple = true;
+        } else if !heap && !class.is(object) {
+            return Ok(None);
+        }
+    }
+    if ty.is_subclass(py.import("enum")?.getattr("Enum")?)? {
+        return Ok(None);
+    }
+
+    if is_tuple {
+        // namedtuple; прочие подклассы tuple сравниваются как кортежи.
+        return match ty.getattr("_fields") {
+            Ok(fields) => {
+                let fields = fields.iter()?.map(|name| Ok(name?.downcast::<PyString>()?.into())).collect::<PyResult<_>>()?;
+                Ok(Some(SharedPlan { fields, tuple: true, dict: false }))
+            }
+            Err(_) => Ok(None),
+        };
+    }
+
+    // dataclass: поля с compare=False не сравниваются.
+    if ty.hasattr("__dataclass_fields__")? {
+        let mut fields = Vec::new();
+        for field in py.import("dataclasses")?.getattr("fields")?.call1((ty,))?.iter()? {
+            let field = field?;
+            if field.getattr("compare")?.is_true()? {
+                fields.push(field.getattr("name")?.downcast::<PyString>()?.into());
+            }
+        }
+        return Ok(Some(SharedPlan { fields, tuple: false, dict: false }));
+    }
+
+    // Класс со своим __eq__ сам знает, что в нем значимо: в слотах и
+    // __dict__ бывают кэши (PurePath._str после str(p)), из-за которых
+    // равные объекты разошлись бы по полям.
+    for class in mro.iter() {
+        if !class.is(object) && class.getattr("__dict__")?.contains("__eq__")? {
+            return Ok(None);
+        }
+    }
+
+    // __slots__ по MRO от базовых классов к производным, затем __dict__.
+    let mut fields = Vec::new();
+    let mro: Vec<&PyAny> = mro.iter().collect();
+    for class in mro.into_iter().rev() {
+        let class = class.downcast::<PyType>()?;
+        let slots = match class.getattr("__dict__")?.get_item("__slots__") {
+            Ok(slots) => slots,
+            Err(_) => continue,
+        };
+        let slots: Vec<&PyAny> = if slots.downcast::<PyString>().is_ok() {
+            vec![slots]
+        } else {
+            slots.iter()?.collect::<PyResult<_>>()?
+        };
+        let class_name = class.name()?;
+        for slot in slots {
+            let slot = slot.downcast::<PyString>()?.to_str()?;
+            if slot != "__dict__" && slot != "__weakref__" {
+                fields.push(PyString::new(py, &mangle(class_name, slot)).into());
+            }
+        }
+    }
+    let dict = ty.getattr("__dictoffset__")?.extract::<isize>()? != 0;
+    if fields.is_empty() && !dict {
+        return Ok(None);
+    }
+    Ok(Some(SharedPlan { fields, tuple: false, dict }))
+}
+
+// Вид объекта для счетчиков, по тем же проверкам, что в compare_pair.
+fn node_kind(py: Python, ty: &PyType, obj: &PyAny) -> NodeKind {
+    if obj.is_none() {
+        NodeKind::None
+    } else if ty.is(py.get_type::<PyBool>()) {
+        NodeKind::Bool
+    } else if ty.is(py.get_type::<PyLong>()) {
+        NodeKind::Int
+    } else if ty.is(py.get_type::<PyFloat>()) {
+        NodeKind::Float
+    } else if ty.is(py.get_type::<PyString>()) {
+        NodeKind::Str
+    } else if obj.downcast::<PyBytes>().is_ok() || obj.downcast::<PyByteArray>().is_ok() {
+        NodeKind::Bytes
+    } else if obj.downcast::<PyDict>().is_ok() {
+        NodeKind::Dict
+    } else if obj.downcast::<PyList>().is_ok() {
+        NodeKind::List
+    } else if obj.downcast::<PyTuple>().is_ok() {
+        NodeKind::Tuple
+    } else if obj.downcast::<PySet>().is_ok() || obj.downcast::<PyFrozenSet>().is_ok() {
+        NodeKind::Set
+    } else if buffer::is_buffer(obj) {
+        NodeKind::Buffer
+    } else {
+        NodeKind::Object
+    }
+}
+
+// Обход объектов Python. Путь до текущего узла — один стек на весь обход
+// с заимствованными ключами; строка пути собирается только при выдаче.
+// При ошибке обход прерывается целиком, поэтому стек после нее не важен.
+pub struct Walker<'p> {
+    py: Python<'p>,
+    path: Vec<PathComponent<&'p PyAny>>,
+    pub diff: DeepDiff,
+    pub budget: Budget,
+    floats: FloatTolerance,
+    // group_by, ignore_order и align_lists для списков внутри непрозрачных
+    // объектов: обход снимков их не видит, и элементы сопоставляет этот
+    // обход по их снимкам.
+    group_by: Option<GroupBy>,
+    ignore_order: bool,
+    report_repetition: bool,
+    align_lists: bool,
+    lists: ListHash,
+    // Фильтр путей и курсоры в нем для каждого уровня пути, корня тоже;
+    // text — строка текущего пути для шаблонов фильтра.
+    filter: Option<Arc<Filter>>,
+    cursors: Vec<Cursor>,
+    text: String,
+    pub stats: Option<Box<Stats>>,
+    slow: Option<SlowSubtree>,
+    // Пары контейнеров (по адресам) на текущем пути, для поиска циклов.
+    ancestors: HashSet<(usize, usize)>,
+    // Планы из кэша процесса, взятые этим обходом, по адресу типа. Типы
+    // живы, пока жив обход: на них ссылаются сравниваемые объекты.
+    plans: Vec<Plan<'p>>,
+    plan_ids: HashMap<usize, Option<usize>>,
+}
+
+// Шаг фильтра для ключа Python: str, неотрицательный int или repr().
+fn key_step<R>(key: &PyAny, f: impl FnOnce(Step<'_>) -> R) -> PyResult<R> {
+    let py = key.py();
+    if let Ok(s) = key.downcast::<PyString>() {
+        if let Ok(s) = s.to_str() {
+            return Ok(f(Step::Key(s)));
+        }
+    }
+    if key.get_type().is(py.get_type::<PyLong>()) {
+        if let Ok(idx) = key.extract::<usize>() {
+            return Ok(f(Step::Index(idx)));
+        }
+    }
+    Ok(f(Step::Repr(key.repr()?.to_str()?)))
+}
+
+impl<'p> Walker<'p> {
+    pub fn new(py: Python<'p>, options: &DiffOptions) -> Self {
+        let mut diff = DeepDiff::default();
+        diff.unordered = options.ignore_order;
+        let mut walker = Walker {
+            py,
+            path: Vec::new(),
+            diff,
+            budget: Budget::new(options),
+            floats: options.floats,
+            group_by: options.group_by.clone(),
+            ignore_order: options.ignore_order,
+            report_repetition: options.report_repetition,
+            align_lists: options.align_lists,
+            lists: options.list_hash(),
+            filter: options.filter.clone(),
+            cursors: Vec::new(),
+            text: String::new(),
+            stats: options.stats.then(Box::default),
+            slow: options.slow_subtree.clone(),
+            ancestors: HashSet::new(),
+            plans: Vec::new(),
+            plan_ids: HashMap::new(),
+        };
+        walker.reset_path();
+        walker
+    }
+
+    fn reset_path(&mut self) {
+        self.path.clear();
+        self.cursors.clear();
+        if let Some(filter) = &self.filter {
+            self.cursors.push(filter.root(&mut self.text));
+        }
+    }
+
+    // Спуск к ребенку. false — поддерево отфильтровано и пропускается,
+    // в стек ничего не положено.
+    fn enter(&mut self, component: PathComponent<&'p PyAny>) -> PyResult<bool> {
+        if let Some(filter) = &self.filter {
+            let cursor = *self.cursors.last().expect("курсор корня есть всегда");
+            let text = &mut self.text;
+            let next = match component {
+                _ if !filter.needs_step(cursor) => Some(filter.inherit(cursor)),
+                PathComponent::Index(idx) => filter.step(cursor, Step::Index(idx), text),
+                PathComponent::Key(key) => key_step(key, |step| filter.step(cursor, step, text))?,
+                PathComponent::Attr(name) => filter.step(cursor, Step::Attr(name.downcast::<PyString>()?.to_str()?), text),
+                PathComponent::Group(ref field, key) => {
+                    let (key, quoted) = match key.downcast::<PyString>() {
+                        Ok(key) => (key.to_str()?, true),
+                        Err(_) => (key.str()?.to_str()?, false),
+                    };
+                    filter.step(cursor, Step::Repr(&group_text(field, key, quoted)), text)
+                }
+            };
+            match next {
+                Some(next) => self.cursors.push(next),
+                None => {
+                    if let Some(stats) = &mut self.stats {
+                        stats.filtered += 1;
+                    }
+                    return Ok(false);
+                }
+            }
+        }
+        self.path.push(component);
+        Ok(true)
+    }
+
+    fn leave(&mut self) {
+        self.path.pop();
+        if self.filter.is_some() {
+            self.cursors.pop();
+        }
+    }
+
+    // Попадает ли текущий путь в результат при include_paths.
+    fn included(&self) -> bool {
+        self.cursors.last().map_or(true, |cursor| cursor.included)
+    }
+
+    pub fn finish(mut self) -> DeepDiff {
+        self.diff.truncated = self.budget.truncated;
+        self.diff.stats = self.stats.map(|stats| *stats);
+        self.diff
+    }
+
+    fn current_path(&self) -> ChangePath {
+        self.path
+            .iter()
+            .map(|component| component.map_key(|key| PathKey::Py((*key).into())))
+            .collect()
+    }
+
+    fn record(&mut self, category: Category, old: Option<&PyAny>, new: Option<&PyAny>) {
+        if !self.included() || !self.budget.take_record() {
+            return;
+        }
+        let path = self.current_path();
+        self.diff.record(
+            category,
+            path,
+            old.map(|o| ChangeValue::Py(o.into())),
+            new.map(|n| ChangeValue::Py(n.into())),
+        );
+    }
+
+    // Сообщает on_slow_subtree о поддереве, если его сравнение заняло не
+    // меньше порога; путь собирается только в этом случае.
+    fn report_slow(&self, path: impl FnOnce() -> ChangePath, elapsed: Duration) -> PyResult<()> {
+        if let Some(slow) = self.slow.as_ref().filter(|slow| elapsed >= slow.threshold) {
+            let path = format_change_path(self.py, &path())?;
+            slow.callback.call1(self.py, (path, elapsed.as_secs_f64()))?;
+        }
+        Ok(())
+    }
+
+    fn node_path(&self, path: &NodePath<'_>) -> ChangePath {
+        path.iter()
+            .map(|component| component.map_key(|key| PathKey::Py(key.obj.clone_ref(self.py))))
+            .collect()
+    }
+
+    // Входит в путь из снимка; false — путь отфильтрован. Снимки живут
+    // меньше обхода, поэтому ключи переводятся в ссылки пула GIL.
+    fn enter_node_path(&mut self, path: &NodePath<'_>) -> PyResult<bool> {
+        let py = self.py;
+        for component in path.iter() {
+            let component = component.map_key(|key| key.obj.clone_ref(py).into_ref(py));
+            if !self.enter(component)? {
+                return Ok(false);
+            }
+        }
+        Ok(true)
+    }
+
+    // Остаток ignore_order без хешей по текущему пути списка: элемент,
+    // равный через is или == элементу того же типа с другой стороны, не
+    // изменился, прочие — iterable_item_removed и iterable_item_added.
+    fn match_unhashed(&mut self, removed: Vec<(usize, &Node)>, added: Vec<(usize, &Node)>) -> PyResult<()> {
+        let py = self.py;
+        let added: Vec<(usize, &'p PyAny)> =
+            added.into_iter().map(|(j, node)| (j, node.obj.clone_ref(py).into_ref(py))).collect();
+        let mut paired = vec![false; added.len()];
+        let mut left = Vec::new();
+        for (i, node) in removed {
+            let old = node.obj.clone_ref(py).into_ref(py);
+            let mut found = None;
+            for (k, &(_, new)) in added.iter().enumerate() {
+                if paired[k] {
+                    continue;
+                }
+                if let Some(stats) = &mut self.stats {
+                    stats.python_eq_calls += 1;
+                }
+                if old.is(new) || (old.get_type().is(new.get_type()) && old.eq(new)?) {
+                    found = Some(k);
+                    break;
+                }
+            }
+            match found {
+                Some(k) => paired[k] = true,
+                None => left.push((i, old)),
+            }
+        }
+
+        for (i, old) in left {
+            if self.budget.stopped() {
+                return Ok(());
+            }
+            if self.enter(PathComponent::Index(i))? {
+                self.record(Category::IterableItemRemoved, Some(old), None);
+                self.leave();
+            }
+        }
+        for (k, (j, new)) in added.into_iter().enumerate() {
+            if self.budget.stopped() {
+                return Ok(());
+            }
+            if !paired[k] && self.enter(PathComponent::Index(j))? {
+                self.record(Category::IterableItemAdded, None, Some(new));
+                self.leave();
+            }
+        }
+        Ok(())
+    }
+
+    // Переносит записи обхода снимков в результат, по пути досравнивая
+    // отложенные пары непрозрачных объектов, с сохранением порядка.
+    pub fn merge_node_changes(&mut self, changes: Vec<NodeChange<'_>>) -> PyResult<()> {
+        let py = self.py;
+        for change in changes {
+            let counted = matches!(
+                change,
+                NodeChange::Record { .. } | NodeChange::Move { .. } | NodeChange::Repetition { .. }
+            );
+            if counted && !self.budget.take_record() {
+                break;
+            }
+            match change {
+                NodeChange::Record { category, path, old, new } => {
+                    let path = self.node_path(&path);
+                    self.diff.record(
+                        category,
+                        path,
+                        old.map(|o| ChangeValue::Py(o.obj.clone_ref(py))),
+                        new.map(|n| ChangeValue::Py(n.obj.clone_ref(py))),
+                    );
+                }
+                NodeChange::Deferred { path, old, new, ancestors } => {
+                    if self.enter_node_path(&path)? {
+                        self.ancestors.extend(ancestors);
+                        let started = Instant::now();
+                        self.compare_objects(old.obj.clone_ref(py).into_ref(py), new.obj.clone_ref(py).into_ref(py))?;
+                        if let Some(stats) = &mut self.stats {
+                            stats.traversal += started.elapsed();
+                        }
+                    }
+                    self.reset_path();
+                }
+                NodeChange::Unmatched { path, removed, added } => {
+                    if self.enter_node_path(&path)? {
+                        self.match_unhashed(removed, added)?;
+                    }
+                    self.reset_path();
+                }
+                NodeChange::Move { path, new_path, value } => {
+                    let path = self.node_path(&path);
+                    let new_path = self.node_path(&new_path);
+                    self.diff.record_move(path, new_path, ChangeValue::Py(value.obj.clone_ref(py)));
+                }
+                NodeChange::Repetition { path, value, old_indexes, new_indexes } => {
+                    let path = self.node_path(&path);
+                    let value = ChangeValue::Py(value.obj.clone_ref(py));
+                    self.diff.record_repetition(path, value, old_indexes, new_indexes);
+                }
+                NodeChange::Truncated { expired, cancelled } => {
+                    self.budget.truncated = true;
+                    self.budget.expired |= expired;
+                    self.budget.cancelled |= cancelled;
+                }
+                NodeChange::Stats(stats) => {
+                    if let Some(total) = &mut self.stats {
+                        total.add(&stats);
+                    }
+                }
+                NodeChange::Slow { path, elapsed } => {
+                    self.report_slow(|| self.node_path(&path), elapsed)?;
+                }
+                NodeChange::Pending { .. } => unreachable!("Pending раскрывается при параллельном обходе"),
+            }
+        }
+        Ok(())
+    }
+
+    // Сравнение пары с явным стеком кадров в куче вместо рекурсии, так что
+    // глубина входа ограничена только памятью.
+    pub fn compare_objects(&mut self, t1: &'p PyAny, t2: &'p PyAny) -> PyResult<()> {
+        let depth = self.path.len();
+        let mut stack = vec![Frame::Compare(t1, t2)];
+        while let Some(frame) = stack.pop() {
+            if self.budget.stopped() {
+                break;
+            }
+            match frame {
+                Frame::Compare(t1, t2) => self.compare_pair(t1, t2, &mut stack)?,
+                Frame::Leave => self.leave(),
+                Frame::Dict { d1, d2, pos, added, attrs } => self.compare_dicts(d1, d2, pos, added, attrs, &mut stack)?,
+                Frame::Seq { l1, l2, i } => self.compare_iterables(l1, l2, i, &mut stack)?,
+                Frame::Matched { l1, l2, matching, k } => self.compare_matched(l1, l2, matching, k, &mut stack)?,
+                Frame::Object { t1, t2, plan, i } => self.compare_fields(t1, t2, plan, i, &mut stack)?,
+                Frame::Done { pair, started } => {
+                    self.ancestors.remove(&pair);
+                    if let Some(started) = started {
+                        self.report_slow(|| self.current_path(), started.elapsed())?;
+                    }
+                }
+            }
+        }
+        // Прерванный обход оставляет в пути свои компоненты.
+        while self.path.len() > depth {
+            self.leave();
+        }
+        self.ancestors.clear();
+        Ok(())
+    }
+
+    // Сравнивает пару по текущему пути: листья сразу, а для словарей,
+    // списков и кортежей кладет на стек кадры их обхода.
+    fn compare_pair(&mut self, t1: &'p PyAny, t2: &'p PyAny, stack: &mut Vec<Frame<'p>>) -> PyResult<()> {
+        let py = self.py;
+
+        // Общие для обоих документов поддеревья пропускаются целиком.
+        if t1.is(t2) {
+            if let Some(stats) = &mut self.stats {
+                stats.skipped += 1;
+            }
+            return Ok(());
+        }
+
+        let t1_type = t1.get_type();
+        if let Some(stats) = &mut self.stats {
+            stats.visit(node_kind(py, t1_type, t1), self.path.len());
+        }
+        if !t1_type.is(t2.get_type()) {
+            self.record(Category::TypeChanges, Some(t1), Some(t2));
+            return Ok(());
+        }
+
+        if let Some(is_equal) = scalar_eq(py, t1_type, t1, t2, &self.floats)? {
+            if !is_equal {
+                self.record(Category::ValuesChanged, Some(t1), Some(t2));
+            }
+            return Ok(());
+        }
+
+        // Ниже max_depth различие поддерева — одна запись о нем целиком.
+        if self.budget.too_deep(self.path.len()) {
+            if let Some(stats) = &mut self.stats {
+                stats.python_eq_calls += 1;
+            }
+            if !self.subtree_eq(t1, t2)? {
+                self.budget.truncated = true;
+                self.record(Category::ValuesChanged, Some(t1), Some(t2));
+            }
+            return Ok(());
+        }
+
+        if let (Ok(d1), Ok(d2)) = (t1.downcast::<PyDict>(), t2.downcast::<PyDict>()) {
+            let frame = Frame::Dict { d1, d2, pos: 0, added: false, attrs: false };
+            self.push_container(t1, t2, frame, stack);
+            return Ok(());
+        }
+        if let (Ok(l1), Ok(l2)) = (t1.downcast::<PyList>(), t2.downcast::<PyList>()) {
+            let frame = self.seq_frame(Seq::List(l1), Seq::List(l2))?;
+            self.push_container(t1, t2, frame, stack);
+            return Ok(());
+        }
+        if let Some(plan) = self.plan(t1_type)? {
+            self.push_container(t1, t2, Frame::Object { t1, t2, plan, i: 0 }, stack);
+            return Ok(());
+        }
+        if let (Ok(l1), Ok(l2)) = (t1.downcast::<PyTuple>(), t2.downcast::<PyTuple>()) {
+            let frame = self.seq_frame(Seq::Tuple(l1), Seq::Tuple(l2))?;
+            self.push_container(t1, t2, frame, stack);
+            return Ok(());
+        }
+
+        let started = self.slow.as_ref().map(|_| Instant::now());
+        if t1.downcast::<PySet>().is_ok() || t1.downcast::<PyFrozenSet>().is_ok() {
+            self.compare_sets(t1, t2)?;
+        }
+        else if buffer::is_buffer(t1) {
+            self.compare_buffers(t1, t2)?;
+        }
+        else {
+            if let Some(stats) = &mut self.stats {
+                stats.python_eq_calls += 1;
+            }
+            if !t1.eq(t2)? {
+                self.record(Category::ValuesChanged, Some(t1), Some(t2));
+            }
+        }
+
+        if let Some(started) = started {
+            self.report_slow(|| self.current_path(), started.elapsed())?;
+        }
+        Ok(())
+    }
+
+    // Равенство поддерева ниже max_depth. При ignore_order списки равны
+    // без учета порядка: сначала сверяются хеши снимков, а если они
+    // разные или их нет, решает ==.
+    fn subtree_eq(&mut self, t1: &'p PyAny, t2: &'p PyAny) -> PyResult<bool> {
+        if self.ignore_order {
+            let (mut old, mut new) = (Node::snapshot(t1)?, Node::snapshot(t2)?);
+            let (h1, h2) = (old.compute_hash(self.lists), new.compute_hash(self.lists));
+            if h1.is_some() && h1 == h2 {
+                return Ok(true);
+            }
+        }
+        t1.eq(t2)
+    }
+
+    // Кадр обхода пары списков: по позициям или, при group_by, ignore_order
+    // и align_lists, по шагам сопоставления элементов, как в обходе снимков.
+    fn seq_frame(&mut self, l1: Seq<'p>, l2: Seq<'p>) -> PyResult<Frame<'p>> {
+        let group = self.group_field()?;
+        if group.is_none() && !self.ignore_order && !self.align_lists {
+            return Ok(Frame::Seq { l1, l2, i: 0 });
+        }
+        let (old, new) = (self.snapshot_items(l1)?, self.snapshot_items(l2)?);
+        let grouped = group.and_then(|field| Some((node_diff::grouped_ops(&old, &new, &field)?, field)));
+        let (ops, group) = match grouped {
+            Some((ops, field)) => (Some(ops), Some(field)),
+            None if self.ignore_order => (Some(node_diff::unordered_ops(&old, &new, self.report_repetition)), None),
+            None if self.align_lists => (node_diff::aligned_ops(&old, &new), None),
+            None => (None, None),
+        };
+        Ok(match ops {
+            Some(ops) => Frame::Matched { l1, l2, matching: Rc::new(Matching { ops, old, new, group }), k: 0 },
+            None => Frame::Seq { l1, l2, i: 0 },
+        })
+    }
+
+    // Поле group_by для списка по текущему пути.
+    fn group_field(&self) -> PyResult<Option<Arc<str>>> {
+        Ok(match &self.group_by {
+            Some(GroupBy::All(field)) => Some(field.clone()),
+            Some(GroupBy::Paths(paths)) => paths.get(&format_change_path(self.py, &self.current_path())?).cloned(),
+            None => None,
+        })
+    }
+
+    // Компонент пути i-го элемента списка items: индекс или поле и ключ
+    // записи, если списки сопоставлены по group_by.
+    fn item_component(&self, group: &Option<Arc<str>>, items: &[Node], i: usize) -> PathComponent<&'p PyAny> {
+        match group {
+            Some(field) => {
+                let key = node_diff::group_key(&items[i], field);
+                PathComponent::Group(field.clone(), key.obj.clone_ref(self.py).into_ref(self.py))
+            }
+            None => PathComponent::Index(i),
+        }
+    }
+
+    // Снимки элементов с хешами. Элементы-контейнеры снимаются целиком:
+    // пара, сопоставленная по близости, при спуске снимается еще раз.
+    fn snapshot_items(&self, items: Seq<'p>) -> PyResult<Vec<Node>> {
+        (0..items.len())
+            .map(|i| {
+                let mut node = Node::snapshot(items.get(i)?)?;
+                node.compute_hash(self.lists);
+                Ok(node)
+            })
+            .collect()
+    }
+
+    // Номер плана для типа, из кэша обхода или кэша процесса.
+    fn plan(&mut self, ty: &'p PyType) -> PyResult<Option<usize>> {
+        let key = ty.as_ptr() as usize;
+        if let Some(&id) = self.plan_ids.get(&key) {
+            return Ok(id);
+        }
+        let id = match shared_plan(self.py, ty)? {
+            Some(plan) => {
+                let py = self.py;
+                let fields = plan.fields.iter().map(|name| name.clone_ref(py).into_ref(py)).collect();
+                self.plans.push(Plan { fields, tuple: plan.tuple, dict: plan.dict });
+                Some(self.plans.len() - 1)
+            }
+            None => None,
+        };
+        self.plan_ids.insert(key, id);
+        Ok(id)
+    }
+
+    // Кладет на стек обход контейнера. Пара, которая уже сравнивается выше
+    // по пути, — цикл ссылок: повторный спуск ничего не добавит, и путь
+    // попадает в DeepDiff.cycles.
+    fn push_container(&mut self, t1: &'p PyAny, t2: &'p PyAny, frame: Frame<'p>, stack: &mut Vec<Frame<'p>>) {
+        let pair = (t1.as_ptr() as usize, t2.as_ptr() as usize);
+        if !self.ancestors.insert(pair) {
+            if let Some(stats) = &mut self.stats {
+                stats.cycles += 1;
+            }
+            if self.included() {
+                let path = self.current_path();
+                self.diff.cycles.push(path);
+            }
+            return;
+        }
+        let started = self.slow.as_ref().map(|_| Instant::now());
+        stack.push(Frame::Done { pair, started });
+        stack.push(frame);
+    }
+
+    // Сравнивает ребенка, путь к которому уже вошел в стек пути. Листья
+    // сравниваются сразу; у контейнера кадры ложатся поверх resume и
+    // Leave, и true велит родителю уступить им стек.
+    fn descend(&mut self, t1: &'p PyAny, t2: &'p PyAny, resume: Frame<'p>, stack: &mut Vec<Frame<'p>>) -> PyResult<bool> {
+        let mark = stack.len();
+        stack.push(resume);
+        stack.push(Frame::Leave);
+        self.compare_pair(t1, t2, stack)?;
+        if stack.len() > mark + 2 {
+            return Ok(true);
+        }
+        stack.truncate(mark);
+        self.leave();
+        Ok(false)
+    }
+
+    // Словарь с позиции pos: сначала ключи d1, затем (added) ключи d2.
+    // attrs — словари __dict__ объектов: ключи идут в путь как атрибуты.
+    fn compare_dicts(
+        &mut self,
+        d1: &'p PyDict,
+        d2: &'p PyDict,
+        mut pos: isize,
+        added: bool,
+        attrs: bool,
+        stack: &mut Vec<Frame<'p>>,
+    ) -> PyResult<()> {
+        let (component, removed, inserted): (fn(&'p PyAny) -> PathComponent<&'p PyAny>, _, _) = if attrs {
+            (PathComponent::Attr, Category::AttributeRemoved, Category::AttributeAdded)
+        } else {
+            (PathComponent::Key, Category::DictionaryItemRemoved, Category::DictionaryItemAdded)
+        };
+
+        if !added {
+            while let Some((k, v1)) = dict_next(d1, &mut pos) {
+                if self.budget.stopped() {
+                    return Ok(());
+                }
+                if self.enter(component(k))? {
+                    match d2.get_item(k) {
+                        Some(v2) => {
+                            let resume = Frame::Dict { d1, d2, pos, added: false, attrs };
+                            if self.descend(v1, v2, resume, stack)? {
+                                return Ok(());
+                            }
+                        }
+                        None => {
+                            self.record(removed, Some(v1), None);
+                            self.leave();
+                        }
+                    }
+                }
+            }
+            pos = 0;
+        }
+
+        while let Some((k, v2)) = dict_next(d2, &mut pos) {
+            if self.budget.stopped() {
+                return Ok(());
+            }
+            if d1.get_item(k).is_none() && self.enter(component(k))? {
+                self.record(inserted, None, Some(v2));
+                self.leave();
+            }
+        }
+
+        Ok(())
+    }
+
+    // Поля объекта по плану с поля i, затем его __dict__. Незаданный
+    // атрибут с одной стороны — attribute_added/removed.
+    fn compare_fields(
+        &mut self,
+        t1: &'p PyAny,
+        t2: &'p PyAny,
+        plan: usize,
+        mut i: usize,
+        stack: &mut Vec<Frame<'p>>,
+    ) -> PyResult<()> {
+        let (count, tuple) = (self.plans[plan].fields.len(), self.plans[plan].tuple);
+        while i < count {
+            if self.budget.stopped() {
+                return Ok(());
+            }
+            let name = self.plans[plan].fields[i];
+            let (v1, v2) = if tuple {
+                let (r1, r2) = (t1.downcast::<PyTuple>()?, t2.downcast::<PyTuple>()?);
+                (Some(r1.get_item(i)?), Some(r2.get_item(i)?))
+            } else {
+                (attr_value(t1, name)?, attr_value(t2, name)?)
+            };
+            if self.enter(PathComponent::Attr(name))? {
+                match (v1, v2) {
+                    (Some(v1), Some(v2)) => {
+                        let resume = Frame::Object { t1, t2, plan, i: i + 1 };
+                        if self.descend(v1, v2, resume, stack)? {
+                            return Ok(());
+                        }
+                    }
+                    (Some(v1), None) => {
+                        self.record(Category::AttributeRemoved, Some(v1), None);
+                        self.leave();
+                    }
+                    (None, Some(v2)) => {
+                        self.record(Category::AttributeAdded, None, Some(v2));
+                        self.leave();
+                    }
+                    (None, None) => self.leave(),
+                }
+            }
+            i += 1;
+        }
+
+        if self.plans[plan].dict {
+            let d1 = t1.getattr("__dict__")?.downcast::<PyDict>()?;
+            let d2 = t2.getattr("__dict__")?.downcast::<PyDict>()?;
+            self.compare_dicts(d1, d2, 0, false, true, stack)?;
+        }
+        Ok(())
+    }
+
+    // Поэлементная разница множеств: проверка вхождения идет по хешам,
+    // которые CPython уже хранит в таблице множества. Путь элемента —
+    // сам элемент, как в deepdiff: root[3], root['a'].
+    fn compare_sets(&mut self, s1: &'p PyAny, s2: &'p PyAny) -> PyResult<()> {
+        // Равные множества отсекаются одним проходом на C, который
+        // останавливается на первом несовпадении.
+        if s1.len()? == s2.len()? && s1.eq(s2)? {
+            return Ok(());
+        }
+
+        for item in s1.iter()? {
+            if self.budget.stopped() {
+                return Ok(());
+            }
+            let item = item?;
+            if !s2.contains(item)? && self.enter(PathComponent::Key(item))? {
+                self.record(Category::SetItemRemoved, Some(item), None);
+                self.leave();
+            }
+        }
+
+        for item in s2.iter()? {
+            if self.budget.stopped() {
+                return Ok(());
+            }
+            let item = item?;
+            if !s1.contains(item)? && self.enter(PathComponent::Key(item))? {
+                self.record(Category::SetItemAdded, None, Some(item));
+                self.leave();
+            }
+        }
+
+        Ok(())
+    }
+
+    // Буферы сравниваются по памяти без копирования: числовые поэлементно
+    // с допусками для float, прочие — целиком, как memoryview.
+    fn compare_buffers(&mut self, t1: &'p PyAny, t2: &'p PyAny) -> PyResult<()> {
+        let format = buffer::numeric_format(t1)?;
+        if format.is_some() && format == buffer::numeric_format(t2)? {
+            let compared = match format {
+                Some(Numeric::I8) => self.compare_numeric::<i8>(t1, t2)?,
+                Some(Numeric::I16) => self.compare_numeric::<i16>(t1, t2)?,
+                Some(Numeric::I32) => self.compare_numeric::<i32>(t1, t2)?,
+                Some(Numeric::I64) => self.compare_numeric::<i64>(t1, t2)?,
+                Some(Numeric::U8) => self.compare_numeric::<u8>(t1, t2)?,
+                Some(Numeric::U16) => self.compare_numeric::<u16>(t1, t2)?,
+                Some(Numeric::U32) => self.compare_numeric::<u32>(t1, t2)?,
+                Some(Numeric::U64) => self.compare_numeric::<u64>(t1, t2)?,
+                Some(Numeric::F32) => self.compare_numeric::<f32>(t1, t2)?,
+                Some(Numeric::F64) => self.compare_numeric::<f64>(t1, t2)?,
+                None => false,
+            };
+            if compared {
+                return Ok(());
+            }
+        }
+
+        // Разные форматы или форма, несмежная память: одна запись о буфере
+        // целиком. == у memoryview не зависит от __eq__ самого объекта.
+        if !PyMemoryView::from(t1)?.eq(PyMemoryView::from(t2)?)? {
+            self.record(Category::ValuesChanged, Some(t1), Some(t2));
+        }
+        Ok(())
+    }
+
+    // Поэлементное сравнение C-смежных буферов одной формы. Путь элемента —
+    // индекс по каждой оси: root[2][5]. false — буферы так не сравнить.
+    fn compare_numeric<T: Number>(&mut self, t1: &'p PyAny, t2: &'p PyAny) -> PyResult<bool> {
+        let py = self.py;
+        let (b1, b2) = match (PyBuffer::<T>::get(t1), PyBuffer::<T>::get(t2)) {
+            (Ok(b1), Ok(b2)) if b1.shape() == b2.shape() => (b1, b2),
+            _ => return Ok(false),
+        };
+        let (s1, s2) = match (b1.as_slice(py), b2.as_slice(py)) {
+            (Some(s1), Some(s2)) => (s1, s2),
+            _ => return Ok(false),
+        };
+
+        for i in buffer::differing_indexes(s1, s2, &self.floats) {
+            if self.budget.stopped() {
+                break;
+            }
+            let index = buffer::unravel(i, b1.shape());
+            let mut depth = 0;
+            while depth < index.len() && self.enter(PathComponent::Index(index[depth]))? {
+                depth += 1;
+            }
+            if depth == index.len() {
+                let old = s1[i].get().into_py(py).into_ref(py);
+                let new = s2[i].get().into_py(py).into_ref(py);
+                self.record(Category::ValuesChanged, Some(old), Some(new));
+            }
+            for _ in 0..depth {
+                self.leave();
+            }
+        }
+        Ok(true)
+    }
+
+    // Список или кортеж с индекса i; хвосты сравниваются, когда общая
+    // часть пройдена.
+    fn compare_iterables(&mut self, l1: Seq<'p>, l2: Seq<'p>, mut i: usize, stack: &mut Vec<Frame<'p>>) -> PyResult<()> {
+        let (len1, len2) = (l1.len(), l2.len());
+
+        while i < std::cmp::min(len1, len2) {
+            if self.budget.stopped() {
+                return Ok(());
+            }
+            if self.enter(PathComponent::Index(i))? {
+                let resume = Frame::Seq { l1, l2, i: i + 1 };
+                if self.descend(l1.get(i)?, l2.get(i)?, resume, stack)? {
+                    return Ok(());
+                }
+            }
+            i += 1;
+        }
+
+        for i in len2..len1 {
+            if self.budget.stopped() {
+                return Ok(());
+            }
+            if self.enter(PathComponent::Index(i))? {
+                self.record(Category::IterableItemRemoved, Some(l1.get(i)?), None);
+                self.leave();
+            }
+        }
+
+        for i in len1..len2 {
+            if self.budget.stopped() {
+                return Ok(());
+            }
+            if self.enter(PathComponent::Index(i))? {
+                self.record(Category::IterableItemAdded, None, Some(l2.get(i)?));
+                self.leave();
+            }
+        }
+
+        Ok(())
+    }
+
+    // Сопоставление элементов списков с шага k: пары сравниваются вглубь
+    // по пути элемента l1, прочие шаги становятся записями.
+    fn compare_matched(
+        &mut self,
+        l1: Seq<'p>,
+        l2: Seq<'p>,
+        matching: Rc<Matching>,
+        mut k: usize,
+        stack: &mut Vec<Frame<'p>>,
+    ) -> PyResult<()> {
+        while k < matching.ops.len() {
+            if self.budget.stopped() {
+                return Ok(());
+            }
+            match &matching.ops[k] {
+                &ListOp::Pair(i, j) => {
+                    if self.enter(self.item_component(&matching.group, &matching.old, i))? {
+                        let resume = Frame::Matched { l1, l2, matching: matching.clone(), k: k + 1 };
+                        if self.descend(l1.get(i)?, l2.get(j)?, resume, stack)? {
+                            return Ok(());
+                        }
+                    }
+                }
+                &ListOp::Removed(i) => {
+                    if self.enter(self.item_component(&matching.group, &matching.old, i))? {
+                        self.record(Category::IterableItemRemoved, Some(l1.get(i)?), None);
+                        self.leave();
+                    }
+                }
+                &ListOp::Added(j) => {
+                    if self.enter(self.item_component(&matching.group, &matching.new, j))? {
+                        self.record(Category::IterableItemAdded, None, Some(l2.get(j)?));
+                        self.leave();
+                    }
+                }
+                &ListOp::Move(i, j) => {
+                    let mut new_path = self.current_path();
+                    new_path.push(PathComponent::Index(j));
+                    if self.enter(PathComponent::Index(i))? {
+                        if self.included() && self.budget.take_record() {
+                            let path = self.current_path();
+                            self.diff.record_move(path, new_path, ChangeValue::Py(l1.get(i)?.into()));
+                        }
+                        self.leave();
+                    }
+                }
+                ListOp::Repetition(i, old_indexes, new_indexes) => {
+                    if self.enter(PathComponent::Index(*i))? {
+                        if self.included() && self.budget.take_record() {
+                            let value = ChangeValue::Py(l1.get(*i)?.into());
+                            let path = self.current_path();
+                            self.diff.record_repetition(path, value, old_indexes.clone(), new_indexes.clone());
+                        }
+                        self.leave();
+                    }
+                }
+                ListOp::Unmatched(removed, added) => {
+                    let removed = removed.iter().map(|&i| (i, &matching.old[i])).collect();
+                    let added = added.iter().map(|&j| (j, &matching.new[j])).collect();
+                    self.match_unhashed(removed, added)?;
+                }
+            }
+            k += 1;
+        }
+        Ok(())
+    }
+}
@@ -0,0 +1,45 @@
+"""compare(..., align_lists=True): выравнивание списков по хешам элементов."""
+
+import dataclasses
+
+import pytest
+
+from rustdeepdiff import compare
+
+
+@dataclasses.dataclass
+class Tagged:
+    tags: list
+
+
+class Attrs(dict):
+    pass
+
+
+# Списки внутри dataclass и подкласса dict выравнивает обход Python.
+WRAPS = [
+    (lambda tags: tags, "root"),
+    (Tagged, "root.tags"),
+    (lambda tags: Attrs(tags=tags), "root['tags']"),
+]
+
+
+@pytest.mark.parametrize("wrap, path", WRAPS, ids=["list", "dataclass", "dict-subclass"])
+def test_insertion_shifts_nothing(wrap, path):
+    diff = compare(wrap([1, 2, 3]), wrap([0, 1, 2, 3]), align_lists=True).to_dict()
+    assert diff == {"iterable_item_added": {path + "[0]": 0}}
+
+
+@pytest.mark.parametrize("wrap, path", WRAPS, ids=["list", "dataclass", "dict-subclass"])
+def test_changed_item_between_equal_ones(wrap, path):
+    diff = compare(wrap(["a", {"k": 1}, "c"]), wrap(["x", "a", {"k": 2}, "c"]), align_lists=True).to_dict()
+    assert diff == {
+        "values_changed": {path + "[1]['k']": {"old_value": 1, "new_value": 2}},
+        "iterable_item_added": {path + "[0]": "x"},
+    }
+
+
+@pytest.mark.parametrize("wrap, path", WRAPS, ids=["list", "dataclass", "dict-subclass"])
+def test_moved_item(wrap, path):
+    diff = compare(wrap([1, 2, 3]), wrap([2, 3, 1]), align_lists=True).to_dict()
+    assert diff == {"iterable_item_moved": {path + "[0]": {"new_path": path + "[2]", "value": 1}}}
@@ -0,0 +1,146 @@
+"""Асинхронные обертки: результат, отмена и предел одновременных сравнений."""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+import rustdeepdiff
+from rustdeepdiff import CancelToken, _async, compare, compare_many, compare_pairs
+
+
+@pytest.fixture(autouse=True)
+def concurrency():
+    previous = rustdeepdiff.get_async_concurrency()
+    yield
+    rustdeepdiff.set_async_concurrency(previous)
+
+
+def test_compare_async_matches_compare():
+    old, new = {"a": [1, 2], "b": 1.5}, {"a": [1, 3], "b": 1.5}
+    diff = asyncio.run(rustdeepdiff.compare_async(old, new))
+    assert diff.to_dict() == compare(old, new).to_dict()
+
+
+def test_compare_async_passes_options_as_is(monkeypatch):
+    seen = []
+    monkeypatch.setattr(_async, "compare", lambda t1, t2, **options: seen.append(options))
+    asyncio.run(rustdeepdiff.compare_async(1, 2, atol=0.5))
+    assert list(seen[0]) == ["atol", "cancel"]
+
+
+def test_batch_async():
+    pairs = [([1], [2]), ({"a": 1}, {"a": 1})]
+    diffs = asyncio.run(rustdeepdiff.compare_pairs_async(pairs))
+    assert [d.to_dict() for d in diffs] == [d.to_dict() for d in compare_pairs(pairs)]
+    diffs = asyncio.run(rustdeepdiff.compare_many_async([1], [[1], [2]]))
+    assert [bool(d) for d in diffs] == [False, True]
+
+
+def test_cancel_stops_running_comparison(monkeypatch):
+    started = threading.Event()
+    tokens = []
+
+    def slow_compare(t1, t2, cancel, **options):
+        tokens.append(cancel)
+        started.set()
+        deadline = time.monotonic() + 5
+        while not cancel.cancelled and time.monotonic() < deadline:
+            time.sleep(0.001)
+
+    monkeypatch.setattr(_async, "compare", slow_compare)
+
+    async def main():
+        task = asyncio.ensure_future(rustdeepdiff.compare_async(1, 2))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+    assert tokens[0].cancelled
+
+
+def test_cancel_removes_queued_comparison(monkeypatch):
+    rustdeepdiff.set_async_concurrency(1)
+    release = threading.Event()
+    calls = []
+
+    def blocking_compare(t1, t2, **options):
+        calls.append(t1)
+        release.wait(5)
+
+    monkeypatch.setattr(_async, "compare", blocking_compare)
+
+    async def main():
+        first = asyncio.ensure_future(rustdeepdiff.compare_async("first", 0))
+        queued = asyncio.ensure_future(rustdeepdiff.compare_async("queued", 0))
+        await asyncio.sleep(0.05)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        release.set()
+        await first
+
+    asyncio.run(main())
+    assert calls == ["first"]
+
+
+def test_concurrency_limit(monkeypatch):
+    rustdeepdiff.set_async_concurrency(2)
+    lock = threading.Lock()
+    active = [0]
+    peak = [0]
+
+    def counting_compare(t1, t2, **options):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+
+    monkeypatch.setattr(_async, "compare", counting_compare)
+
+    async def main():
+        await asyncio.gather(*(rustdeepdiff.compare_async(i, i) for i in range(8)))
+
+    asyncio.run(main())
+    assert peak[0] == 2
+
+
+@pytest.mark.parametrize("limit", [0, -1, 1.5, True])
+def test_invalid_concurrency(limit):
+    with pytest.raises(ValueError):
+        rustdeepdiff.set_async_concurrency(limit)
+
+
+def test_cancelled_batch_keeps_one_result_per_pair():
+    token = CancelToken()
+    token.cancel()
+    pairs = [([i], [i + 1]) for i in range(100)]
+    diffs = compare_pairs(pairs, cancel=token)
+    assert len(diffs) == 100
+    assert all(diff.truncated and not diff for diff in diffs)
+
+
+def test_expired_batch():
+    diffs = compare_many([0], [[i] for i in range(100)], timeout=0)
+    assert len(diffs) == 100
+    assert all(diff.truncated and not diff for diff in diffs)
+
+
+def test_cancelled_compare_json():
+    token = CancelToken()
+    token.cancel()
+    diff = rustdeepdiff.compare_json('{"a": 1}', '{"a": 2}', cancel=token)
+    assert diff.truncated and not diff
+    assert rustdeepdiff.compare_json('{"a": 1}', '{"a": 2}')
+
+
+def test_compare_json_async_passes_cancel(monkeypatch):
+    seen = []
+    monkeypatch.setattr(_async, "compare_json", lambda t1, t2, **options: seen.append(options))
+    asyncio.run(rustdeepdiff.compare_json_async("1", "2"))
+    assert isinstance(seen[0]["cancel"], CancelToken)
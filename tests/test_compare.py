@@ -0,0 +1,130 @@
+"""compare и is_equal: обход объектов Python и обход снимков."""
+
+import dataclasses
+import pathlib
+
+import pytest
+
+from rustdeepdiff import compare, is_equal
+
+# Параметры, с которыми сравнение идет по снимкам без GIL. Результат должен
+# совпадать с обходом под GIL.
+ENGINES = [{}, {"use_hashes": True}, {"use_hashes": True, "parallelism": 2}]
+
+
+class Text(str):
+    """Подкласс str со своим __eq__: сравнивается без учета регистра."""
+
+    def __eq__(self, other):
+        return str.lower(self) == str.lower(other)
+
+    __hash__ = str.__hash__
+
+
+@dataclasses.dataclass
+class Point:
+    x: int
+    y: int
+    label: str = dataclasses.field(default="", compare=False)
+
+
+@pytest.mark.parametrize("options", ENGINES)
+def test_dict_and_list_changes(options):
+    old = {"a": 1, "b": [1, 2, 3], "c": {"x": "y"}, "gone": None}
+    new = {"a": 2, "b": [1, 2], "c": {"x": "y"}, "new": True}
+    assert compare(old, new, **options).to_dict() == {
+        "values_changed": {"root['a']": {"old_value": 1, "new_value": 2}},
+        "iterable_item_removed": {"root['b'][2]": 3},
+        "dictionary_item_removed": {"root['gone']": None},
+        "dictionary_item_added": {"root['new']": True},
+    }
+
+
+@pytest.mark.parametrize("options", ENGINES)
+def test_type_change(options):
+    change = compare({"a": 1}, {"a": "1"}, **options).to_dict()["type_changes"]["root['a']"]
+    assert (change["old_type"], change["new_type"]) == ("int", "str")
+    assert (change["old_value"], change["new_value"]) == (1, "1")
+
+
+@pytest.mark.parametrize("options", ENGINES)
+def test_equal_documents(options):
+    document = {"a": [1, 2.5, "s", None, True, (1, 2)], "b": {"c": b"bytes"}}
+    copy = {"a": [1, 2.5, "s", None, True, (1, 2)], "b": {"c": b"bytes"}}
+    assert not compare(document, copy, **options)
+    assert is_equal(document, copy, **options)
+    assert not is_equal(document, {**copy, "d": 1}, **options)
+
+
+@pytest.mark.parametrize("options", ENGINES)
+def test_subclass_compares_with_its_eq(options):
+    assert not compare([Text("Hello")], [Text("HELLO")], **options)
+    diff = compare([Text("Hello")], [Text("World")], **options).to_dict()
+    assert list(diff["values_changed"]) == ["root[0]"]
+
+
+@pytest.mark.parametrize("options", ENGINES)
+def test_big_integers(options):
+    diff = compare([2**64, 2**100], [2**64, 2**100 + 1], **options).to_dict()
+    assert diff == {"values_changed": {"root[1]": {"old_value": 2**100, "new_value": 2**100 + 1}}}
+
+
+@pytest.mark.parametrize("options", ENGINES)
+def test_dataclass_compares_by_fields(options):
+    assert not compare(Point(1, 2, "a"), Point(1, 2, "b"), **options)
+    diff = compare({"p": Point(1, 2)}, {"p": Point(1, 3)}, **options).to_dict()
+    assert diff == {"values_changed": {"root['p'].y": {"old_value": 2, "new_value": 3}}}
+
+
+def test_shared_subtree_is_skipped():
+    shared = {"big": list(range(1000))}
+    diff = compare({"s": shared, "v": 1}, {"s": shared, "v": 2}, stats=True)
+    assert diff.to_dict() == {"values_changed": {"root['v']": {"old_value": 1, "new_value": 2}}}
+    assert diff.stats["skipped_subtrees"] >= 1
+
+
+def test_float_tolerances():
+    assert not compare([1.0], [1.0 + 1e-12], atol=1e-9)
+    assert compare([1.0], [1.1], atol=1e-9)
+    assert not compare([0.1234], [0.1231], significant_digits=3)
+
+
+def test_max_diffs_truncates():
+    diff = compare(list(range(100)), list(range(1, 101)), max_diffs=5)
+    assert len(diff.to_dict()["values_changed"]) == 5
+    assert diff.truncated
+
+
+def test_deep_nesting_does_not_overflow_stack():
+    depth = 100_000
+    old = new = 1
+    for _ in range(depth):
+        old, new = [old], [new]
+    assert not compare(old, new)
+
+
+class Money:
+    """Класс со своим __eq__ и кэшем в __dict__."""
+
+    def __init__(self, cents):
+        self.cents = cents
+
+    def __eq__(self, other):
+        return self.cents == other.cents
+
+    def text(self):
+        self._text = "%d.%02d" % divmod(self.cents, 100)
+        return self._text
+
+
+@pytest.mark.parametrize("options", ENGINES)
+def test_class_with_eq_compares_with_eq(options):
+    cached, fresh = pathlib.PurePosixPath("a/b"), pathlib.PurePosixPath("a/b")
+    str(cached)
+    assert not compare({"p": cached}, {"p": fresh}, **options)
+    diff = compare({"p": cached}, {"p": pathlib.PurePosixPath("a/c")}, **options).to_dict()
+    assert list(diff["values_changed"]) == ["root['p']"]
+
+    money = Money(150)
+    money.text()
+    assert not compare([money], [Money(150)], **options)
@@ -0,0 +1,63 @@
+"""compare_json и compare_json_files: сравнение документов без json.loads."""
+
+import json
+
+import pytest
+
+from rustdeepdiff import compare, compare_json, compare_json_files
+
+
+def test_matches_compare_of_loaded_documents():
+    old = b'{"a": 1, "b": [1, 2, 3], "c": {"x": "y"}, "d": 1}'
+    new = b'{"a": 2, "b": [1, 2], "c": {"x": "y", "n": true}, "d": 1.0}'
+    assert compare_json(old, new).to_dict() == compare(json.loads(old), json.loads(new)).to_dict()
+
+
+def test_integers_beyond_u64_stay_int():
+    old = b'{"n": 123456789012345678901234567890}'
+    new = b'{"n": 123456789012345678901234567891}'
+    changed = compare_json(old, new).to_dict()["values_changed"]["root['n']"]
+    assert changed == {"old_value": 123456789012345678901234567890, "new_value": 123456789012345678901234567891}
+    assert type(changed["old_value"]) is int
+
+
+def test_big_integer_against_float_is_type_change():
+    diff = compare_json(b"[18446744073709551616]", b"[18446744073709551616.0]").to_dict()
+    change = diff["type_changes"]["root[0]"]
+    assert (change["old_type"], change["new_type"]) == ("int", "float")
+
+
+def test_numbers_compare_by_value():
+    assert not compare_json(b"[1.0, 1e2, -0]", b"[1.00, 100.0, 0]")
+
+
+def test_deep_document_within_limit():
+    depth = 500
+    old = b"[" * depth + b"1" + b"]" * depth
+    new = b"[" * depth + b"2" + b"]" * depth
+    diff = compare_json(old, new).to_dict()
+    assert list(diff["values_changed"].values()) == [{"old_value": 1, "new_value": 2}]
+
+
+def test_too_deep_document_is_rejected_with_clear_error():
+    depth = 100_000
+    document = b"[" * depth + b"]" * depth
+    with pytest.raises(ValueError, match="вложенность"):
+        compare_json(document, document)
+
+
+def test_brackets_inside_strings_do_not_count_as_nesting():
+    document = json.dumps(["[" * 5000]).encode()
+    assert not compare_json(document, document)
+
+
+def test_invalid_json():
+    with pytest.raises(ValueError, match="Некорректный JSON"):
+        compare_json(b"[1,", b"[1]")
+
+
+def test_files(tmp_path):
+    old, new = tmp_path / "old.json", tmp_path / "new.json"
+    old.write_bytes(b'{"a": [1, 2]}')
+    new.write_bytes(b'{"a": [1, 3]}')
+    assert compare_json_files(old, new).to_dict() == {"values_changed": {"root['a'][1]": {"old_value": 2, "new_value": 3}}}
@@ -0,0 +1,51 @@
+"""Ссылочные циклы: обход не зацикливается и сообщает о них в DeepDiff.cycles."""
+
+import pytest
+
+from rustdeepdiff import compare
+
+ENGINES = [{}, {"use_hashes": True}, {"use_hashes": True, "parallelism": 2}]
+
+
+def self_dict(value):
+    document = {"a": value}
+    document["self"] = document
+    return document
+
+
+def self_list(value):
+    document = [value]
+    document.append(document)
+    return document
+
+
+@pytest.mark.parametrize("options", ENGINES)
+def test_self_referential_dict(options):
+    diff = compare(self_dict(1), self_dict(2), **options)
+    assert diff.to_dict() == {"values_changed": {"root['a']": {"old_value": 1, "new_value": 2}}}
+    assert diff.cycles == ["root['self']"]
+
+
+@pytest.mark.parametrize("options", ENGINES)
+def test_self_referential_list(options):
+    diff = compare(self_list(1), self_list(2), **options)
+    assert diff.to_dict() == {"values_changed": {"root[0]": {"old_value": 1, "new_value": 2}}}
+    assert diff.cycles == ["root[1]"]
+
+
+@pytest.mark.parametrize("options", ENGINES)
+def test_cycle_below_root(options):
+    diff = compare({"x": self_list(1), "y": 1}, {"x": self_list(1), "y": 2}, **options)
+    assert diff.to_dict() == {"values_changed": {"root['y']": {"old_value": 1, "new_value": 2}}}
+    assert diff.cycles == ["root['x'][1]"]
+
+
+def test_cycle_is_counted_in_stats():
+    diff = compare(self_dict(1), self_dict(1), stats=True)
+    assert not diff
+    assert diff.cycles == ["root['self']"]
+    assert diff.stats["cycles"] == 1
+
+
+def test_no_cycles():
+    assert compare({"a": [1]}, {"a": [2]}).cycles == []
@@ -0,0 +1,80 @@
+"""Delta: применение, обращение и двоичный формат патча."""
+
+import copy
+
+import pytest
+
+from rustdeepdiff import Delta, compare
+
+CASES = [
+    ({"a": 1, "b": [1, 2, 3], "c": {"x": "y"}}, {"a": 2, "b": [1, 2], "c": {"x": "z", "n": None}, "d": (1, 2)}),
+    ([1, [2, [3, [4]]]], [1, [2, [3, [5]]], 6]),
+    ({"s": {1, 2}, "f": frozenset({"a"}), "t": (1, 2, 3)}, {"s": {2, 3}, "f": frozenset({"b"}), "t": (1, 4)}),
+    ({"n": 2**100, "f": 1.5, "b": b"x"}, {"n": 2**100 + 1, "f": 2.5, "b": b"y", "u": "строка"}),
+]
+
+
+@pytest.mark.parametrize("old, new", CASES)
+def test_apply_and_reverse(old, new):
+    delta = Delta(compare(old, new))
+    assert delta.apply(copy.deepcopy(old)) == new
+    assert delta.reverse().apply(copy.deepcopy(new)) == old
+
+
+@pytest.mark.parametrize("old, new", CASES)
+def test_bytes_round_trip(old, new):
+    delta = Delta(compare(old, new))
+    restored = Delta.from_bytes(delta.to_bytes())
+    assert len(restored) == len(delta)
+    assert restored.to_bytes() == delta.to_bytes()
+    assert restored.apply(copy.deepcopy(old)) == new
+    assert Delta.from_bytes(delta.reverse().to_bytes()).apply(copy.deepcopy(new)) == old
+
+
+def test_empty_delta_returns_object():
+    obj = {"a": 1}
+    assert Delta(compare(obj, {"a": 1})).apply(obj) is obj
+
+
+def test_truncated_diff_is_rejected():
+    diff = compare(list(range(10)), list(range(1, 11)), max_diffs=3)
+    assert diff.truncated
+    with pytest.raises(ValueError, match="max_diffs"):
+        Delta(diff)
+
+
+def test_unordered_delta_cannot_be_reversed():
+    delta = Delta(compare([1, 2, 3], [3, 2, 4], ignore_order=True))
+    with pytest.raises(ValueError, match="ignore_order"):
+        delta.reverse()
+
+
+def test_deep_value_is_rejected_on_serialization():
+    value = None
+    for _ in range(5000):
+        value = [value]
+    delta = Delta(compare({"a": 1}, {"a": 1, "deep": value}))
+    with pytest.raises(ValueError, match="глубже"):
+        delta.to_bytes()
+
+
+def test_deep_path_is_rejected():
+    old, new = [1], [2]
+    for _ in range(5000):
+        old, new = [old], [new]
+    with pytest.raises(ValueError, match="путь"):
+        Delta(compare(old, new))
+
+
+def test_crafted_nesting_is_rejected():
+    # Правка Replace без пути, значение которой — 100000 вложенных списков.
+    depth = 100_000
+    data = b"RDDT\x01\x00\x01" + b"\x00\x00\x02" + b"\x08\x01" * depth + b"\x00"
+    with pytest.raises(ValueError, match="Некорректные данные Delta"):
+        Delta.from_bytes(data)
+
+
+@pytest.mark.parametrize("data", [b"", b"XXXX\x01\x00\x00", b"RDDT\x02\x00\x00", b"RDDT\x01\x00\x01\x63"])
+def test_corrupt_bytes(data):
+    with pytest.raises(ValueError, match="Некорректные данные Delta"):
+        Delta.from_bytes(data)
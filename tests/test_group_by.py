@@ -0,0 +1,73 @@
+"""compare(..., group_by=...): сопоставление записей списков по полю."""
+
+import dataclasses
+
+import pytest
+
+from rustdeepdiff import Delta, compare
+
+OLD = {"users": [{"id": 42, "name": "ann"}, {"id": 7, "name": "bob"}]}
+NEW = {"users": [{"id": 7, "name": "bob"}, {"id": 42, "name": "anna"}, {"id": 1, "name": "cid"}]}
+
+
+@dataclasses.dataclass
+class Team:
+    users: list
+
+
+class Attrs(dict):
+    pass
+
+
+def test_records_are_matched_by_field():
+    assert compare(OLD, NEW, group_by="id").to_dict() == {
+        "values_changed": {"root['users'][id=42]['name']": {"old_value": "ann", "new_value": "anna"}},
+        "iterable_item_added": {"root['users'][id=1]": {"id": 1, "name": "cid"}},
+    }
+
+
+def test_group_by_paths():
+    assert compare(OLD, NEW, group_by={"root['users']": "id"}).to_dict() == compare(OLD, NEW, group_by="id").to_dict()
+
+
+def test_string_keys_are_quoted():
+    old = [{"name": "ann", "age": 30}]
+    new = [{"name": "ann", "age": 31}]
+    diff = compare(old, new, group_by="name").to_dict()
+    assert diff == {"values_changed": {"root[name='ann']['age']": {"old_value": 30, "new_value": 31}}}
+
+
+def test_structured_path_names_the_field():
+    diff = compare(OLD, NEW, group_by="id").to_dict(structured_paths=True)
+    assert ("users", ("id", 42), "name") in diff["values_changed"]
+
+
+def test_group_key_is_not_an_index():
+    # root['users'][1] — индекс, а не запись с id=1.
+    assert compare(OLD, NEW, group_by="id", exclude_paths=["root['users'][1]"]).to_dict() == compare(
+        OLD, NEW, group_by="id"
+    ).to_dict()
+    diff = compare(OLD, NEW, group_by="id", exclude_paths=["root['users'][id=1]"]).to_dict()
+    assert "iterable_item_added" not in diff
+
+
+def test_delta_rejects_grouped_records():
+    with pytest.raises(ValueError, match="group_by"):
+        Delta(compare(OLD, NEW, group_by="id"))
+
+
+@pytest.mark.parametrize(
+    "wrap, path, group_by",
+    [
+        (lambda doc: Team(doc["users"]), "root.users", "id"),
+        (lambda doc: Team(doc["users"]), "root.users", {"root.users": "id"}),
+        (Attrs, "root['users']", {"root['users']": "id"}),
+    ],
+    ids=["dataclass", "dataclass-path", "dict-subclass-path"],
+)
+def test_records_inside_objects(wrap, path, group_by):
+    # Списки внутри непрозрачных объектов сопоставляет обход Python.
+    assert compare(wrap(OLD), wrap(NEW), group_by=group_by).to_dict() == {
+        "values_changed": {path + "[id=42]['name']": {"old_value": "ann", "new_value": "anna"}},
+        "iterable_item_added": {path + "[id=1]": {"id": 1, "name": "cid"}},
+    }
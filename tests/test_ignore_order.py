@@ -0,0 +1,101 @@
+"""compare(..., ignore_order=True): списки как мультимножества."""
+
+import dataclasses
+
+import pytest
+
+from rustdeepdiff import compare
+
+
+@dataclasses.dataclass
+class Point:
+    x: int
+    y: int
+
+
+class Tag(str):
+    pass
+
+
+def test_reordered_list_is_equal():
+    assert not compare([1, "a", [2, 3], {"k": None}], [{"k": None}, [2, 3], "a", 1], ignore_order=True)
+
+
+def test_added_and_removed_items():
+    diff = compare([1, 2, 3], [3, 4, 1], ignore_order=True).to_dict()
+    assert diff == {"iterable_item_removed": {"root[1]": 2}, "iterable_item_added": {"root[1]": 4}}
+
+
+def test_similar_items_are_compared_in_depth():
+    record = {"id": 1, "a": 1, "b": 2, "c": 3, "e": 5, "f": 6}
+    old = [{**record, "d": 4}, "x"]
+    new = ["x", {**record, "d": 5}]
+    assert compare(old, new, ignore_order=True).to_dict() == {
+        "values_changed": {"root[0]['d']": {"old_value": 4, "new_value": 5}},
+    }
+
+
+@pytest.mark.parametrize(
+    "make",
+    [
+        lambda: Point(1, 2),
+        lambda: {1, 2},
+        lambda: {(1, 2): "tuple key"},
+        lambda: Tag("sub"),
+        lambda: {"p": Point(3, 4)},
+    ],
+    ids=["dataclass", "set", "tuple-key-dict", "str-subclass", "dict-with-object"],
+)
+def test_equal_unhashed_items_are_matched(make):
+    old = [make(), 1, make()]
+    new = [2 - 1, make(), make()]
+    assert not compare(old, new, ignore_order=True)
+
+
+def test_same_object_is_matched():
+    nan = float("nan")
+    point = Point(1, 2)
+    assert not compare([nan, point, "s"], ["s", point, nan], ignore_order=True)
+
+
+def test_different_unhashed_items():
+    diff = compare([Point(1, 2), Point(3, 4)], [Point(3, 4), Point(5, 6)], ignore_order=True).to_dict()
+    assert diff == {"iterable_item_removed": {"root[0]": Point(1, 2)}, "iterable_item_added": {"root[1]": Point(5, 6)}}
+
+
+def test_unhashed_items_of_different_types_are_not_matched():
+    diff = compare([Tag("a")], ["a"], ignore_order=True).to_dict()
+    assert diff == {"iterable_item_removed": {"root[0]": "a"}, "iterable_item_added": {"root[0]": "a"}}
+
+
+@dataclasses.dataclass
+class Tagged:
+    tags: list
+
+
+class Attrs(dict):
+    pass
+
+
+@pytest.mark.parametrize(
+    "wrap",
+    [Tagged, lambda tags: Attrs(tags=tags), lambda tags: {"outer": Tagged(tags)}],
+    ids=["dataclass", "dict-subclass", "nested-dataclass"],
+)
+def test_lists_inside_objects_ignore_order(wrap):
+    # Списки внутри непрозрачных объектов сравнивает обход Python.
+    assert not compare(wrap(["a", "b", [1, 2]]), wrap([[1, 2], "b", "a"]), ignore_order=True)
+    diff = compare(wrap(["a", "b"]), wrap(["c", "a"]), ignore_order=True).to_dict()
+    assert set(diff) == {"iterable_item_removed", "iterable_item_added"}
+    assert list(diff["iterable_item_removed"].values()) == ["b"]
+    assert list(diff["iterable_item_added"].values()) == ["c"]
+
+
+def test_repetition_inside_object():
+    diff = compare(Tagged(["a", "b"]), Tagged(["b", "a", "a"]), ignore_order=True, report_repetition=True)
+    change = {"old_repeat": 1, "new_repeat": 2, "old_indexes": [0], "new_indexes": [1, 2], "value": "a"}
+    assert diff.to_dict() == {"repetition_change": {"root.tags[0]": change}}
+
+
+def test_max_depth_ignores_order():
+    assert not compare({"a": {"b": [1, 2, 3]}}, {"a": {"b": [3, 1, 2]}}, ignore_order=True, max_depth=1)
@@ -0,0 +1,66 @@
+"""Импорт пакета: один путь к скомпилированному модулю и короткий холодный старт."""
+
+import subprocess
+import sys
+
+# Верхняя граница холодного импорта в отдельном процессе, секунды. С большим
+# запасом: импорт занимает миллисекунды, граница ловит поиск по каталогам и
+# тяжелые зависимости, а не шум медленных CI-машин.
+IMPORT_TIME_LIMIT = 0.5
+
+# Модули, которые пакет не должен тянуть при импорте.
+HEAVY_MODULES = ("asyncio", "concurrent.futures", "importlib.util", "json")
+
+
+def run_python(code):
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True, check=True)
+    return result.stdout, result.stderr
+
+
+def import_times(stderr):
+    """Накопленное время импорта по модулям из вывода -X importtime, секунды."""
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        try:
+            times[name.strip()] = int(cumulative) / 1e6
+        except ValueError:
+            continue
+    return times
+
+
+def test_extension_is_imported_from_package():
+    stdout, _ = run_python("import rustdeepdiff; print(rustdeepdiff._rustdeepdiff.__name__)")
+    assert stdout.strip() == "rustdeepdiff._rustdeepdiff"
+    stdout, _ = run_python("import sys, rustdeepdiff; print('_rustdeepdiff' in sys.modules)")
+    assert stdout.strip() == "False"
+
+
+def test_import_time_is_bounded():
+    _, stderr = run_python("import rustdeepdiff")
+    times = import_times(stderr)
+    assert "rustdeepdiff" in times
+    assert times["rustdeepdiff"] < IMPORT_TIME_LIMIT
+
+
+def test_import_does_not_load_heavy_modules():
+    code = "import sys; before = set(sys.modules); import rustdeepdiff; print(' '.join(set(sys.modules) - before))"
+    stdout, _ = run_python(code)
+    loaded = set(stdout.split())
+    assert not loaded & set(HEAVY_MODULES)
+
+
+def test_public_names():
+    import rustdeepdiff
+
+    for name in rustdeepdiff.__all__:
+        assert getattr(rustdeepdiff, name) is not None
+    assert rustdeepdiff.deep_diff({"a": 1}, {"a": 2}).to_dict() == rustdeepdiff.compare({"a": 1}, {"a": 2}).to_dict()
+
+
+def test_async_names_are_loaded_lazily():
+    code = "import sys, rustdeepdiff; rustdeepdiff.compare_async; print('asyncio' in sys.modules)"
+    stdout, _ = run_python(code)
+    assert stdout.strip() == "True"
@@ -0,0 +1,93 @@
+"""DeepDiff.to_json и write_json: тот же JSON, что json.dumps(to_dict())."""
+
+import collections
+import json
+import os
+import types
+
+import pytest
+
+from rustdeepdiff import compare
+
+Pair = collections.namedtuple("Pair", "a b")
+
+
+class Tags(list):
+    pass
+
+
+class Attrs(dict):
+    pass
+
+
+def dumps(diff):
+    return json.loads(json.dumps(diff.to_dict(), default=repr))
+
+
+def test_plain_values_match_json_dumps():
+    diff = compare({"a": 1, "b": [1, 2], "c": {"x": None}}, {"a": 2.5, "b": [1], "c": {"x": "y"}, "d": 2**70})
+    assert json.loads(diff.to_json()) == dumps(diff)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (Tags([1, "a"]), [1, "a"]),
+        (Attrs(k=[1]), {"k": [1]}),
+        (Pair(1, [2]), [1, [2]]),
+        (types.MappingProxyType({"k": 1}), {"k": 1}),
+        (collections.OrderedDict([("b", 1), ("a", 2)]), {"b": 1, "a": 2}),
+        ({"nested": Attrs(t=Tags([Pair(1, 2)]))}, {"nested": {"t": [[1, 2]]}}),
+        ({3, 1}, [1, 3]),
+    ],
+    ids=["list-subclass", "dict-subclass", "namedtuple", "mapping", "ordered-dict", "nested", "set"],
+)
+def test_containers_are_written_structurally(value, expected):
+    diff = compare({"v": None}, {"v": value})
+    written = json.loads(diff.to_json())["type_changes"]["root['v']"]["new_value"]
+    if isinstance(value, set):
+        written = sorted(written)
+    assert written == expected
+
+
+def test_mapping_with_non_json_keys_falls_back():
+    value = Attrs({(1, 2): "t"})
+    diff = compare({"v": None}, {"v": value})
+    assert json.loads(diff.to_json())["type_changes"]["root['v']"]["new_value"] == repr(value)
+
+
+def test_self_referential_subclass_does_not_loop():
+    value = Tags([1])
+    value.append(value)
+    diff = compare({"v": None}, {"v": value})
+    assert json.loads(diff.to_json())["type_changes"]["root['v']"]["new_value"] == [1, repr(value)]
+
+
+def test_lines():
+    diff = compare({"a": 1}, {"a": 2, "b": Tags([1])})
+    lines = [json.loads(line) for line in diff.to_json(lines=True).splitlines()]
+    assert lines == [
+        {"category": "values_changed", "path": "root['a']", "old_value": 1, "new_value": 2},
+        {"category": "dictionary_item_added", "path": "root['b']", "value": [1]},
+    ]
+
+
+def test_write_json_to_file_and_descriptor(tmp_path):
+    diff = compare({"a": Attrs(x=1)}, {"a": Attrs(x=2)})
+    path = tmp_path / "diff.json"
+    with open(path, "wb") as f:
+        diff.write_json(f)
+    assert path.read_bytes() == diff.to_json()
+
+    fd = os.open(tmp_path / "fd.json", os.O_WRONLY | os.O_CREAT)
+    try:
+        diff.write_json(fd)
+    finally:
+        os.close(fd)
+    assert (tmp_path / "fd.json").read_bytes() == diff.to_json()
+
+
+@pytest.mark.parametrize("file", [True, False])
+def test_bool_is_not_a_descriptor(file):
+    with pytest.raises(TypeError, match="bool"):
+        compare({"a": 1}, {"a": 2}).write_json(file)
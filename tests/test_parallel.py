@@ -0,0 +1,51 @@
+"""compare(..., parallelism=N): обход детей корня на нескольких потоках."""
+
+import pytest
+
+from rustdeepdiff import CancelToken, compare, is_equal
+
+# Широкий и мелкий документ: вся работа — в задачах детей корня.
+OLD = {"k%d" % i: [i, "x"] for i in range(5000)}
+NEW = {"k%d" % i: [i + (i % 7 == 0), "x"] for i in range(5000)}
+
+
+def test_same_result_as_sequential():
+    assert compare(OLD, NEW, parallelism=4).to_dict() == compare(OLD, NEW).to_dict()
+
+
+@pytest.mark.parametrize("max_diffs", [0, 1, 10, 500])
+def test_max_diffs_is_global(max_diffs):
+    sequential = compare(OLD, NEW, max_diffs=max_diffs)
+    parallel = compare(OLD, NEW, parallelism=4, max_diffs=max_diffs)
+    assert parallel.to_dict() == sequential.to_dict()
+    assert parallel.truncated
+
+
+def test_is_equal():
+    assert not is_equal(OLD, NEW, parallelism=4)
+    assert is_equal(OLD, dict(OLD), parallelism=4)
+
+
+def test_cancelled_before_start():
+    token = CancelToken()
+    token.cancel()
+    diff = compare(OLD, NEW, parallelism=4, cancel=token)
+    assert diff.truncated
+    assert not diff
+
+
+def test_expired_deadline():
+    diff = compare(OLD, NEW, parallelism=4, timeout=0)
+    assert diff.truncated
+    assert not diff
+
+
+@pytest.mark.parametrize("options", [{}, {"use_hashes": True}])
+def test_single_key_root_is_split_deeper(options):
+    # У корня один ключ: задачи берутся глубже, а не одна на все потоки.
+    old, new = {"data": OLD}, {"data": NEW}
+    diff = compare(old, new, parallelism=4, stats=True, **options)
+    assert diff.stats["parallel_tasks"] >= 4 * 8
+    assert diff.to_dict() == compare(old, new).to_dict()
+    limited = compare(old, new, parallelism=4, max_diffs=10, **options)
+    assert limited.to_dict() == compare(old, new, max_diffs=10).to_dict()
@@ -0,0 +1,67 @@
+"""Пути атрибутов: exclude_paths с root.name и кэш планов по типу."""
+
+import dataclasses
+import gc
+
+import pytest
+
+from rustdeepdiff import compare
+
+ENGINES = [{}, {"use_hashes": True}]
+
+
+@dataclasses.dataclass
+class Record:
+    x: int
+    y: int
+
+
+@pytest.mark.parametrize("options", ENGINES)
+def test_dotted_path_excludes_attribute(options):
+    diff = compare(Record(1, 1), Record(2, 2), exclude_paths=["root.x"], **options).to_dict()
+    assert diff == {"values_changed": {"root.y": {"old_value": 1, "new_value": 2}}}
+
+
+@pytest.mark.parametrize("options", ENGINES)
+def test_dotted_path_still_excludes_dict_key(options):
+    # Старый вид root.key[0]: .key — ключ словаря.
+    old = {"x": [1, 2], "y": 1}
+    new = {"x": [3, 2], "y": 2}
+    diff = compare(old, new, exclude_paths=["root.x[0]"], **options).to_dict()
+    assert diff == {"values_changed": {"root['y']": {"old_value": 1, "new_value": 2}}}
+    assert compare(old, new, exclude_paths=["root.x"], **options).to_dict() == diff
+
+
+def test_bracket_path_does_not_exclude_attribute():
+    diff = compare(Record(1, 1), Record(2, 1), exclude_paths=["root['x']"]).to_dict()
+    assert diff == {"values_changed": {"root.x": {"old_value": 1, "new_value": 2}}}
+
+
+def test_plan_is_rebuilt_for_new_class():
+    # Новый класс может занять адрес умершего: план берется для него, а не
+    # из кэша прошлых вызовов.
+    for fields in [("a",), ("b", "c"), ("a",)]:
+        cls = dataclasses.make_dataclass("Dyn", fields)
+        old = cls(*range(len(fields)))
+        new = cls(*range(1, len(fields) + 1))
+        diff = compare(old, new).to_dict()
+        assert list(diff["values_changed"]) == ["root.%s" % name for name in fields]
+        del cls, old, new
+        gc.collect()
+
+
+@pytest.mark.parametrize("options", ENGINES)
+def test_quotes_in_keys_are_escaped(options):
+    odd = {"a']['b": 1, "a": {"b": 1}, "back\\slash": 1}
+    diff = compare(odd, {"a']['b": 2, "a": {"b": 2}, "back\\slash": 2}, **options).to_dict()
+    assert set(diff["values_changed"]) == {"root['a\\'][\\'b']", "root['a']['b']", "root['back\\\\slash']"}
+
+
+@pytest.mark.parametrize("options", ENGINES)
+def test_escaped_key_in_exclude_paths(options):
+    old = {"a']['b": 1, "a": {"b": 1}}
+    new = {"a']['b": 2, "a": {"b": 2}}
+    diff = compare(old, new, exclude_paths=["root['a\\'][\\'b']"], **options).to_dict()
+    assert diff == {"values_changed": {"root['a']['b']": {"old_value": 1, "new_value": 2}}}
+    diff = compare(old, new, exclude_paths=["root['a']['b']"], **options).to_dict()
+    assert diff == {"values_changed": {"root['a\\'][\\'b']": {"old_value": 1, "new_value": 2}}}
@@ -0,0 +1,105 @@
+"""DiffSession: версии одного документа против живого baseline."""
+
+import pytest
+
+from rustdeepdiff import DiffSession, compare
+
+# Документ, у которого новые версии делят с прежними все, кроме пути к
+# правке.
+BASE = {
+    "users": [{"id": i, "name": "u%d" % i, "tags": ["a", "b"]} for i in range(50)],
+    "meta": {"version": 1, "ids": (1, 2, 3), 5: "int key"},
+}
+
+
+def edited(doc, i, name):
+    users = list(doc["users"])
+    users[i] = {**users[i], "name": name}
+    return {**doc, "users": users}
+
+
+def test_diff_matches_compare():
+    session = DiffSession(BASE)
+    new = edited(BASE, 7, "seven")
+    assert session.diff(new).to_dict() == compare(BASE, new).to_dict()
+    assert session.diff(new).to_dict() == {
+        "values_changed": {"root['users'][7]['name']": {"old_value": "u7", "new_value": "seven"}},
+    }
+
+
+def test_equal_version_shares_everything():
+    session = DiffSession(BASE)
+    assert not session.diff({**BASE})
+    assert not session.diff(BASE)
+
+
+@pytest.mark.parametrize(
+    "make",
+    [
+        lambda doc: {"meta": doc["meta"], "users": doc["users"]},
+        lambda doc: {**doc, "users": doc["users"][1:]},
+        lambda doc: {**doc, "users": doc["users"] + [{"id": 99}]},
+        lambda doc: {**doc, "users": list(reversed(doc["users"]))},
+        lambda doc: {**doc, "meta": {**doc["meta"], 5: "changed", "new": [1]}},
+        lambda doc: {**doc, "meta": {(1, 2): "tuple key"}},
+        lambda doc: {**doc, "users": tuple(doc["users"])},
+        lambda doc: [doc["users"], doc["meta"]],
+    ],
+    ids=["reordered-keys", "shorter", "longer", "reversed", "dict-edit", "opaque-dict", "list-to-tuple", "new-root"],
+)
+def test_reused_subtrees_give_same_result_and_hash(make):
+    session = DiffSession(BASE)
+    new = make(BASE)
+    assert session.diff(new).to_dict() == compare(BASE, new).to_dict()
+    session.advance()
+    assert session.baseline is new
+    assert session.fingerprint == DiffSession(new).fingerprint
+
+
+def test_advance_chain():
+    session = DiffSession(BASE)
+    versions = [BASE]
+    for step in range(5):
+        versions.append(edited(versions[-1], step, "v%d" % step))
+        diff = session.diff(versions[-1])
+        assert diff.to_dict() == compare(versions[-2], versions[-1]).to_dict()
+        session.advance()
+    assert session.diff(BASE).to_dict() == compare(versions[-1], BASE).to_dict()
+
+
+def test_advance_with_object():
+    session = DiffSession(BASE)
+    new = edited(BASE, 3, "three")
+    session.advance(new)
+    assert session.baseline is new
+    assert session.fingerprint == DiffSession(new).fingerprint
+    assert not session.diff(new)
+
+
+def test_advance_without_diff():
+    with pytest.raises(ValueError, match="advance"):
+        DiffSession(BASE).advance()
+
+
+def test_ignore_order():
+    session = DiffSession(BASE, ignore_order=True)
+    new = {**BASE, "users": list(reversed(BASE["users"]))}
+    assert not session.diff(new)
+    session.advance()
+    assert session.fingerprint == DiffSession(new, ignore_order=True).fingerprint
+
+
+def test_root_changed_in_place():
+    # Тот же корень снимается заново: правка на месте видна в diff().
+    doc = {"a": 1, "users": [1, 2]}
+    session = DiffSession(doc)
+    doc["a"] = 2
+    doc["new"] = True
+    assert session.diff(doc).to_dict() == {
+        "values_changed": {"root['a']": {"old_value": 1, "new_value": 2}},
+        "dictionary_item_added": {"root['new']": True},
+    }
+    session.advance()
+    assert not session.diff(doc)
+    doc["users"].append(3)
+    assert session.diff(doc).to_dict() == {"iterable_item_added": {"root['users'][2]": 3}}
@@ -0,0 +1,107 @@
+"""Файлы снимков: save_snapshot, save_json_snapshot и compare_to_snapshot."""
+
+import json
+
+import pytest
+
+from rustdeepdiff import compare, compare_to_snapshot, save_json_snapshot, save_snapshot
+
+CASES = [
+    ({"a": 1, "b": [1, 2, 3], "c": {"x": "y"}}, {"a": 2, "b": [1, 2], "c": {"x": "z", "n": None}, "d": (1, 2)}),
+    ([1, [2, [3, [4]]]], [1, [2, [3, [5]]], 6]),
+    ({"n": 2**100, "f": 1.5, "b": b"x", "t": True}, {"n": 2**100 + 1, "f": 2.5, "b": b"y", "t": False}),
+    ({"a": 1, "t": (1, 2)}, {"a": "1", "t": [1, 2]}),
+    ({"same": list(range(100))}, {"same": list(range(100))}),
+]
+
+
+@pytest.mark.parametrize("old, new", CASES)
+def test_matches_compare(tmp_path, old, new):
+    path = tmp_path / "old.rdds"
+    save_snapshot(path, old)
+    assert compare_to_snapshot(path, new).to_dict() == compare(old, new).to_dict()
+
+
+def test_str_path(tmp_path):
+    path = str(tmp_path / "old.rdds")
+    save_snapshot(path, {"a": 1})
+    assert not compare_to_snapshot(path, {"a": 1})
+
+
+@pytest.mark.parametrize("data", ['{"a": [1, 2, {"b": null}], "c": 1e3}', b'[1, "x", 18446744073709551616]'])
+def test_json_snapshot_is_like_loaded_document(tmp_path, data):
+    path = tmp_path / "doc.rdds"
+    save_json_snapshot(path, data)
+    old = json.loads(data)
+    assert not compare_to_snapshot(path, old)
+    new = json.loads(data)
+    if isinstance(new, dict):
+        new["a"][2]["b"] = 0
+    else:
+        new.append(None)
+    assert compare_to_snapshot(path, new).to_dict() == compare(old, new).to_dict()
+
+
+def test_invalid_json(tmp_path):
+    with pytest.raises(ValueError, match="JSON"):
+        save_json_snapshot(tmp_path / "doc.rdds", "{")
+
+
+def test_options(tmp_path):
+    path = tmp_path / "old.rdds"
+    old = {"a": list(range(10)), "skip": 1}
+    new = {"a": list(range(1, 11)), "skip": 2}
+    save_snapshot(path, old)
+    diff = compare_to_snapshot(path, new, exclude_paths=["root['skip']"], max_diffs=3)
+    assert len(diff.to_dict()["values_changed"]) == 3
+    assert diff.truncated
+    assert "root['skip']" not in diff.to_dict()["values_changed"]
+
+
+def test_unsupported_options(tmp_path):
+    path = tmp_path / "old.rdds"
+    save_snapshot(path, [1])
+    with pytest.raises(TypeError, match="ignore_order"):
+        compare_to_snapshot(path, [1], ignore_order=True)
+
+
+def test_unsupported_value(tmp_path):
+    with pytest.raises(TypeError, match="object"):
+        save_snapshot(tmp_path / "old.rdds", {"a": object()})
+
+
+@pytest.mark.parametrize(
+    "damage",
+    [
+        lambda data: b"",
+        lambda data: b"XXXX" + data[4:],
+        lambda data: data[:-1],
+        lambda data: data[:16] + b"\xff" * (len(data) - 16),
+    ],
+    ids=["empty", "magic", "length", "body"],
+)
+def test_corrupt_file(tmp_path, damage):
+    path = tmp_path / "old.rdds"
+    save_snapshot(path, {"a": [1, 2, "x"]})
+    path.write_bytes(damage(path.read_bytes()))
+    with pytest.raises(ValueError, match="Некорректный файл снимка"):
+        compare_to_snapshot(path, {"a": [1, 2, "x"]})
+
+
+def test_unknown_version(tmp_path):
+    path = tmp_path / "old.rdds"
+    save_snapshot(path, [1])
+    data = bytearray(path.read_bytes())
+    data[4] = 99
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError, match="99"):
+        compare_to_snapshot(path, [1])
+
+
+def test_json_snapshot_deeper_than_object_snapshot(tmp_path):
+    # Снимок объекта глубже 256 уровней непрозрачен, а файл JSON хранит до 512.
+    data = "[" * 300 + "1" + "]" * 300
+    path = tmp_path / "deep.rdds"
+    save_json_snapshot(path, data)
+    assert not compare_to_snapshot(path, json.loads(data))
+    assert compare_to_snapshot(path, json.loads(data.replace("1", "2")))
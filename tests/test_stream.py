@@ -0,0 +1,79 @@
+"""compare_json_stream: потоковое сравнение файлов JSON."""
+
+import json
+
+import pytest
+
+from rustdeepdiff import compare_json_files, compare_json_stream
+
+
+def stream_dict(old, new):
+    """Записи потока, собранные в словарь того же вида, что to_dict()."""
+    result = {}
+    for category, path, payload in compare_json_stream(old, new):
+        result.setdefault(category, {})[path] = payload
+    return result
+
+
+def write(tmp_path, name, document):
+    path = tmp_path / name
+    path.write_text(json.dumps(document))
+    return path
+
+
+@pytest.mark.parametrize(
+    "old, new",
+    [
+        ({"a": 1, "b": [1, 2, 3], "c": {"x": "y"}}, {"a": 2, "b": [1, 2], "c": {"x": "z", "n": True}, "f": 3}),
+        ({"a": {"q": [1, {"z": 2}]}, "b": 2, "c": 3}, {"c": 4, "b": 2, "a": {"q": [1, {"z": 3}, 5]}}),
+        ({"x": [1, 2]}, {"x": {"a": 1}}),
+        ([1, "s", [], {}, -1.5e3, 12345678901234567890], [1, "t", [1], {"k": []}, -1500.0, 12345678901234567890, True]),
+    ],
+)
+def test_matches_tree_comparison(tmp_path, old, new):
+    old_path, new_path = write(tmp_path, "old.json", old), write(tmp_path, "new.json", new)
+    assert stream_dict(old_path, new_path) == compare_json_files(old_path, new_path).to_dict()
+
+
+def test_inserted_and_deleted_keys_keep_siblings_in_step(tmp_path):
+    column = list(range(1000))
+    changed = column[:500] + [-1] + column[501:]
+    old = {"a": column, "b": column, "c": column}
+    inserted = {"x": 1, "a": column, "b": changed, "c": column}
+    deleted = {"b": changed, "c": column}
+    old_path = write(tmp_path, "old.json", old)
+
+    assert stream_dict(old_path, write(tmp_path, "inserted.json", inserted)) == {
+        "dictionary_item_added": {"root['x']": 1},
+        "values_changed": {"root['b'][500]": {"old_value": 500, "new_value": -1}},
+    }
+    assert stream_dict(old_path, write(tmp_path, "deleted.json", deleted)) == {
+        "dictionary_item_removed": {"root['a']": column},
+        "values_changed": {"root['b'][500]": {"old_value": 500, "new_value": -1}},
+    }
+
+
+def test_deep_added_value(tmp_path):
+    depth = 1500
+    old_path = tmp_path / "old.json"
+    new_path = tmp_path / "new.json"
+    old_path.write_text("{}")
+    new_path.write_text('{"deep": ' + "[" * depth + "]" * depth + "}")
+    entries = list(compare_json_stream(old_path, new_path))
+    assert [(category, path) for category, path, _ in entries] == [("dictionary_item_added", "root['deep']")]
+
+
+def test_too_deep_document_is_rejected(tmp_path):
+    depth = 100_000
+    path = tmp_path / "deep.json"
+    path.write_text("[" * depth + "]" * depth)
+    with pytest.raises(ValueError, match="Вложенность"):
+        list(compare_json_stream(path, path))
+
+
+def test_invalid_document(tmp_path):
+    old_path, new_path = tmp_path / "old.json", tmp_path / "new.json"
+    old_path.write_text("[1,]")
+    new_path.write_text("[1]")
+    with pytest.raises(ValueError, match="Некорректный JSON"):
+        list(compare_json_stream(old_path, new_path))